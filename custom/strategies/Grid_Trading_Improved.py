@@ -49,6 +49,7 @@ class GridTradingImproved(Strategies):
     def parse_data(self, stock_list: list = None, latest_data: pd.DataFrame = None, backtesting: bool = False):
         # Received New Data => Parse it Now to input_data
         if latest_data is not None:
+            latest_data = self.normalize_latest_data(latest_data)
             # Only need to update for the stock_code with new data
             stock_code = latest_data['code'].iloc[0]
             stock_list = [stock_code]
@@ -72,9 +73,6 @@ class GridTradingImproved(Strategies):
                 self.input_data[stock_code] = self.input_data[stock_code].iloc[
                                               -min(self.OBSERVATION, self.input_data[stock_code].shape[0]):]
             if stock_code in self.input_data:
-                self.input_data[stock_code][['open', 'close', 'high', 'low']] = self.input_data[stock_code][
-                    ['open', 'close', 'high', 'low']].apply(pd.to_numeric)
-
                 # 初始化基准价格（如果未提供）
                 if self.base_price is None and len(self.input_data[stock_code]) > 0:
                     self.base_price = float(self.input_data[stock_code]['close'].iloc[-1])
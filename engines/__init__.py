@@ -17,8 +17,12 @@
 
 
 from .backtesting_engine import BacktestingEngine
-from .data_engine import DataProcessingInterface, HKEXInterface, YahooFinanceInterface, TuShareInterface
+from .capture_engine import CaptureEngine
+from .data_engine import AsyncWriteInterface, DataCatalogInterface, DataProcessingInterface, DatasetInterface, \
+    HKEXInterface, LiveJournalInterface, RehabInterface, SQLiteStoreInterface, TradingCalendarInterface, \
+    TransportInterface, WatermarkInterface, YahooFinanceInterface, TuShareInterface
 from .email_engine import EmailEngine
 from .order_engine import *
 from .stock_filter_engine import *
+from .storage_benchmark import StorageBenchmark
 from .trading_engine import FutuTrade
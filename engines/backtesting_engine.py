@@ -16,7 +16,6 @@
 #  Copyright (c)  billpwchan - All Rights Reserved
 
 
-import json
 import warnings
 from collections import ChainMap
 from datetime import date, datetime, timedelta
@@ -24,7 +23,7 @@ from multiprocessing import Pool, cpu_count
 
 import pandas as pd
 
-from engines.data_engine import DataProcessingInterface, HKEXInterface
+from engines.data_engine import DataProcessingInterface, HKEXInterface, TradingCalendarInterface
 from strategies.Strategies import Strategies
 from util import logger
 from util.global_vars import config, DATETIME_FORMAT_DW
@@ -47,8 +46,9 @@ class BacktestingEngine:
         self.strategy = None
         self.start_date = start_date
         self.end_date = end_date
-        self.date_range = pd.date_range(self.start_date, self.end_date - timedelta(days=1), freq='d').strftime(
-            DATETIME_FORMAT_DW).tolist()
+        self.date_range = TradingCalendarInterface.get_trading_days(
+            'HK', self.start_date.strftime(DATETIME_FORMAT_DW),
+            (self.end_date - timedelta(days=1)).strftime(DATETIME_FORMAT_DW))
         self.observation = observation
 
         # Transactions-Related
@@ -67,21 +67,9 @@ class BacktestingEngine:
         """
         self.input_data = DataProcessingInterface.get_1M_data_range(self.date_range, self.stock_list)
 
-    def process_custom_interval_data(self, stock_code, column_names, custom_interval: int = 5):
-        output_dict = {}
-        for input_date in self.date_range:
-            custom_dict = DataProcessingInterface.get_custom_interval_data(target_date=input_date,
-                                                                           custom_interval=custom_interval,
-                                                                           stock_list=[stock_code])
-            for stock_code, df in custom_dict.items():
-                output_dict[stock_code] = pd.concat(
-                    [output_dict.get(stock_code, pd.DataFrame(columns=column_names)), df],
-                    ignore_index=True)
-
-        for stock_code, input_df in output_dict.items():
-            input_df[['open', 'close', 'high', 'low']] = input_df[['open', 'close', 'high', 'low']].apply(pd.to_numeric)
-            input_df.sort_values(by='time_key', ascending=True, inplace=True)
-        return output_dict
+    def process_custom_interval_data(self, stock_code, custom_interval: int = 5):
+        # Resampled bars are served from the cache next to the 1M data and only rebuilt when the 1M source changes
+        return DataProcessingInterface.get_custom_interval_data_range(self.date_range, [stock_code], custom_interval)
 
     def prepare_input_data_file_custom_M(self, custom_interval: int = 5) -> None:
         """
@@ -89,14 +77,11 @@ class BacktestingEngine:
         Multi-threading enabled
         :param custom_interval: Integer
         """
-        column_names = json.loads(self.config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
-
         # Use Starmap to pass multiple arguments into process_custom_interval_data function
         # Received a list of dict in format [{'HK.00001': pd.Dataframe}, {...}]
         pool = Pool(min(cpu_count(), len(self.stock_list)))
         list_of_custom_dict = pool.starmap(self.process_custom_interval_data,
-                                           [(stock_code, column_names, custom_interval) for stock_code in
-                                            self.stock_list])
+                                           [(stock_code, custom_interval) for stock_code in self.stock_list])
         pool.close()
         pool.join()
 
@@ -185,7 +170,7 @@ class BacktestingEngine:
                         EBIT = (current_price - buy_price) * qty
                         profit = EBIT - 2 * self.fixed_charge - (
                                 buy_price + current_price) * qty * self.perc_charge / 100 / 2
-                        current_date = datetime.strptime(row['time_key'], '%Y-%m-%d  %H:%M:%S').date()
+                        current_date = row['time_key'].date()
 
                         self.returns_df.loc[str(current_date), stock_code] += profit
                         self.capital += current_price * qty
@@ -0,0 +1,279 @@
+#  Futu Algo: Algorithmic High-Frequency Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2021
+#  Copyright (c)  billpwchan - All Rights Reserved
+
+
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from futu import OrderBookHandlerBase, RET_OK, TickerHandlerBase
+
+from engines.data_engine import DataProcessingInterface
+from util import logger
+from util.global_vars import *
+
+
+class OnTickerClass(TickerHandlerBase):
+    def __init__(self, capture_engine):
+        super().__init__()
+        self.capture_engine = capture_engine
+
+    def on_recv_rsp(self, rsp_pb):
+        # The parsed records are handed over as they are. Building a DataFrame here would hold up the push thread
+        ret, data = self.parse_rsp_pb(rsp_pb)
+        if ret == RET_OK:
+            self.capture_engine.add_tickers(data)
+        return ret, data
+
+
+class OnOrderBookClass(OrderBookHandlerBase):
+    def __init__(self, capture_engine):
+        super().__init__()
+        self.capture_engine = capture_engine
+
+    def on_recv_rsp(self, rsp_pb):
+        ret, data = self.parse_rsp_pb(rsp_pb)
+        if ret == RET_OK:
+            self.capture_engine.add_order_book(data)
+        return ret, data
+
+
+class CaptureEngine:
+    """
+        Capture of the ticker and order book pushes of subscribed stocks for microstructure research.
+        The push callbacks only append the parsed records to an in-memory buffer. A background thread swaps the
+        buffers every FlushInterval seconds (or once FlushRows records are waiting) and writes them as one
+        zstd-compressed Parquet chunk per kind: data/Capture/<ticker|order_book>/<YYYY-MM-DD>/part-<ns>.parquet.
+        Prices are stored as int64 multiples of 1 / PRICE_SCALE and timestamps as int64 nanoseconds, both
+        DELTA_BINARY_PACKED encoded after sorting by code and time. time / svr_recv_time_* are exchange time as sent
+        by Futu, recv_time / capture_time are UTC. Both kinds are partitioned by the exchange-local trading day.
+    """
+    PRICE_SCALE = 1000
+    KINDS = ('ticker', 'order_book')
+    DELTA_COLUMNS = {'ticker':     ['time', 'price', 'sequence', 'recv_time'],
+                     'order_book': ['capture_time', 'svr_recv_time_bid', 'svr_recv_time_ask', 'price']}
+    # Exchange time zone by market prefix of the stock code, used when Futu sends no exchange time
+    MARKET_TIMEZONES = {'HK': 'Asia/Hong_Kong', 'SH': 'Asia/Shanghai', 'SZ': 'Asia/Shanghai',
+                        'US': 'America/New_York'}
+
+    def __init__(self, output_dir: Path = None, flush_interval: float = None, flush_rows: int = None,
+                 order_book_levels: int = None):
+        """
+        :param output_dir: Folder of the captured chunks. Default to data/Capture
+        :param flush_interval: Seconds between flushes. Default to [FutuOpenD.Capture] FlushInterval
+        :param flush_rows: Buffered records that trigger an early flush. Default to [FutuOpenD.Capture] FlushRows
+        :param order_book_levels: Order book levels kept per side. Default to [FutuOpenD.Capture] OrderBookLevels
+        """
+        self.default_logger = logger.get_logger("capture")
+        self.output_dir = output_dir or CaptureEngine.get_path()
+        self.flush_interval = flush_interval or config.getfloat('FutuOpenD.Capture', 'FlushInterval', fallback=5)
+        self.flush_rows = flush_rows or config.getint('FutuOpenD.Capture', 'FlushRows', fallback=100000)
+        self.order_book_levels = order_book_levels or config.getint('FutuOpenD.Capture', 'OrderBookLevels',
+                                                                    fallback=10)
+        self.lock = threading.Lock()
+        self.buffers = {kind: [] for kind in CaptureEngine.KINDS}
+        self.buffered_rows = 0
+        self.flush_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.flush_thread = threading.Thread(target=self.__flush_loop, name='capture_flush', daemon=True)
+        self.flush_thread.start()
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATA / 'Capture'
+
+    def add_tickers(self, ticker_list: list) -> None:
+        """
+            Buffer the ticker records of one push (output of TickerQuery.unpack_rsp)
+        """
+        with self.lock:
+            self.buffers['ticker'].extend(ticker_list)
+            self.buffered_rows += len(ticker_list)
+            if self.buffered_rows >= self.flush_rows:
+                self.flush_event.set()
+
+    def add_order_book(self, order_book: dict) -> None:
+        """
+            Buffer one order book snapshot (output of OrderBookQuery.unpack_rsp) with its capture time
+        """
+        with self.lock:
+            self.buffers['order_book'].append((time.time_ns(), order_book))
+            self.buffered_rows += 1
+            if self.buffered_rows >= self.flush_rows:
+                self.flush_event.set()
+
+    def __flush_loop(self) -> None:
+        while not self.stop_event.is_set():
+            self.flush_event.wait(self.flush_interval)
+            self.flush_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.default_logger.error(f'Capture flush failed: {e}')
+
+    def flush(self) -> int:
+        """
+            Write the buffered records as one chunk per kind
+        :return: Number of records written
+        """
+        with self.lock:
+            buffers, self.buffers = self.buffers, {kind: [] for kind in CaptureEngine.KINDS}
+            self.buffered_rows = 0
+        row_count = 0
+        for kind, table in (('ticker', self.get_ticker_table(buffers['ticker'])),
+                            ('order_book', self.get_order_book_table(buffers['order_book']))):
+            if table is None or table.num_rows == 0:
+                continue
+            self.write_chunk(kind, table)
+            row_count += table.num_rows
+        return row_count
+
+    def stop(self) -> None:
+        """
+            Stop the flush thread and write everything still buffered
+        """
+        self.stop_event.set()
+        self.flush_event.set()
+        self.flush_thread.join()
+        self.flush()
+
+    @staticmethod
+    def to_price(values) -> pa.Array:
+        return pa.array((pd.Series(values, dtype='float64') * CaptureEngine.PRICE_SCALE).round().astype('int64'))
+
+    @staticmethod
+    def to_timestamp(values) -> pa.Array:
+        # Futu sends 'YYYY-MM-DD HH:MM:SS[.fff]' strings in exchange time, or an empty string if unknown
+        return pa.array(pd.to_datetime(pd.Series(values, dtype='object').replace('', None), format='ISO8601'),
+                        pa.timestamp('ns'))
+
+    def get_ticker_table(self, ticker_list: list):
+        if not ticker_list:
+            return None
+        input_df = pd.DataFrame.from_records(ticker_list)
+        table = pa.table({
+            'code':             pa.array(input_df['code'], pa.string()),
+            'time':             CaptureEngine.to_timestamp(input_df['time']),
+            'price':            CaptureEngine.to_price(input_df['price']),
+            'volume':           pa.array(input_df['volume'], pa.int64()),
+            'turnover':         pa.array(input_df['turnover'], pa.float64()),
+            'ticker_direction': pa.array(input_df['ticker_direction'], pa.string()),
+            'sequence':         pa.array(input_df['sequence'], pa.int64()),
+            'type':             pa.array(input_df['type'], pa.string()),
+            # recvTime is in seconds since epoch (0 if not provided)
+            'recv_time':        pa.array((input_df.get('recv_timestamp', pd.Series(0, index=input_df.index)).astype(
+                'float64') * 1e9).round().astype('int64')).cast(pa.timestamp('ns')),
+        })
+        return table.sort_by([('code', 'ascending'), ('sequence', 'ascending')])
+
+    def get_order_book_table(self, snapshots: list):
+        if not snapshots:
+            return None
+        # One row per snapshot, side and level
+        columns = {'capture_time': [], 'code': [], 'svr_recv_time_bid': [], 'svr_recv_time_ask': [], 'side': [],
+                   'level': [], 'price': [], 'volume': [], 'order_count': []}
+        for capture_time, order_book in snapshots:
+            for side in ('Bid', 'Ask'):
+                for level, (price, volume, order_count, *_) in enumerate(
+                        order_book.get(side, [])[:self.order_book_levels]):
+                    columns['capture_time'].append(capture_time)
+                    columns['code'].append(order_book['code'])
+                    columns['svr_recv_time_bid'].append(order_book.get('svr_recv_time_bid', ''))
+                    columns['svr_recv_time_ask'].append(order_book.get('svr_recv_time_ask', ''))
+                    columns['side'].append(side)
+                    columns['level'].append(level)
+                    columns['price'].append(price)
+                    columns['volume'].append(volume)
+                    columns['order_count'].append(order_count)
+        table = pa.table({
+            'capture_time':      pa.array(columns['capture_time'], pa.int64()).cast(pa.timestamp('ns')),
+            'code':              pa.array(columns['code'], pa.string()),
+            'svr_recv_time_bid': CaptureEngine.to_timestamp(columns['svr_recv_time_bid']),
+            'svr_recv_time_ask': CaptureEngine.to_timestamp(columns['svr_recv_time_ask']),
+            'side':              pa.array(columns['side'], pa.string()),
+            'level':             pa.array(columns['level'], pa.int8()),
+            'price':             CaptureEngine.to_price(columns['price']),
+            'volume':            pa.array(columns['volume'], pa.int64()),
+            'order_count':       pa.array(columns['order_count'], pa.int32()),
+        })
+        return table.sort_by([('code', 'ascending'), ('capture_time', 'ascending'), ('side', 'ascending'),
+                              ('level', 'ascending')])
+
+    def get_exchange_time(self, kind: str, table: pa.Table) -> pa.ChunkedArray:
+        """
+            Exchange time of each row: the ticker time, or the server receive time of the order book. Rows that Futu
+            sent without one fall back to their receive time (recv_time / capture_time, or now if unknown) converted
+            to the time zone of the stock's market
+        """
+        if kind == 'ticker':
+            exchange_time, receive_time = table.column('time'), table.column('recv_time')
+        else:
+            exchange_time = pc.coalesce(table.column('svr_recv_time_bid'), table.column('svr_recv_time_ask'))
+            receive_time = table.column('capture_time')
+        if exchange_time.null_count == 0:
+            return exchange_time
+        self.default_logger.warning(f'{exchange_time.null_count} {kind} records without exchange time are stored '
+                                    f'by their receive date')
+        # recv_time is 0 if Futu did not provide it
+        receive_time = receive_time.to_pandas()
+        receive_time = receive_time.where(receive_time > pd.Timestamp(0), pd.Timestamp(time.time_ns()))
+        timezones = table.column('code').to_pandas().str[:2].map(CaptureEngine.MARKET_TIMEZONES).fillna(
+            CaptureEngine.MARKET_TIMEZONES['HK'])
+        local_time = pd.Series(pd.NaT, index=receive_time.index, dtype='datetime64[ns]')
+        for timezone, index in timezones.groupby(timezones).groups.items():
+            local_time[index] = receive_time[index].dt.tz_localize('UTC').dt.tz_convert(timezone).dt.tz_localize(None)
+        return pc.coalesce(exchange_time, pa.array(local_time, pa.timestamp('ns')))
+
+    def write_chunk(self, kind: str, table: pa.Table) -> Path:
+        """
+            Write one chunk per exchange-local trading day of the table
+        """
+        dates = pc.strftime(self.get_exchange_time(kind, table), format='%Y-%m-%d')
+        delta_columns = CaptureEngine.DELTA_COLUMNS[kind]
+        output_path = None
+        for trading_day in pc.unique(dates).to_pylist():
+            output_path = self.output_dir / kind / trading_day / f'part-{time.time_ns()}.parquet'
+            with DataProcessingInterface.atomic_output(output_path) as temp_path:
+                pq.write_table(table.filter(pc.equal(dates, trading_day)), temp_path, compression='zstd',
+                               use_dictionary=[column for column in table.column_names if
+                                               column not in delta_columns],
+                               column_encoding=dict.fromkeys(delta_columns, 'DELTA_BINARY_PACKED'))
+        return output_path
+
+    @staticmethod
+    def load(kind: str, start_date: str, end_date: str, stock_list: list = None, output_dir: Path = None) -> pa.Table:
+        """
+            Captured records of a date range as an Arrow table, with prices converted back to float64
+        :param kind: ticker / order_book
+        :param start_date: Exchange-local trading day in String Format (YYYY-MM-DD)
+        :param end_date: Exchange-local trading day in String Format (YYYY-MM-DD)
+        :param stock_list: Only load these stocks. Default to all captured stocks
+        :param output_dir: Folder of the captured chunks. Default to data/Capture
+        """
+        kind_path = (output_dir or CaptureEngine.get_path()) / kind
+        paths = sorted(path.as_posix() for day_path in kind_path.glob('????-??-??') if
+                       start_date <= day_path.name <= end_date for path in day_path.glob('part-*.parquet'))
+        if not paths:
+            return None
+        dataset = ds.dataset(paths, format='parquet')
+        table = dataset.to_table(filter=None if stock_list is None else ds.field('code').isin(stock_list))
+        index = table.schema.get_field_index('price')
+        return table.set_column(index, pa.field('price', pa.float64()),
+                                pc.divide(table.column(index).cast(pa.float64()), CaptureEngine.PRICE_SCALE))
@@ -17,16 +17,28 @@
 
 
 import csv
+import io
+import itertools
 import json
 import os
 import re
+import shutil
 import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import closing, contextmanager
 from datetime import datetime, timedelta
 from multiprocessing import Pool, cpu_count
 
 import humanize
+import numpy as np
 import openpyxl
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 import requests
 import tushare as ts
 import yahooquery
@@ -36,6 +48,7 @@ from tqdm import tqdm
 
 from util import logger
 from util.global_vars import *
+from util.transport import ResponseCache
 
 
 @deprecated(version='1.0', reason="Database dependency is removed.")
@@ -86,248 +99,2232 @@ class DatabaseInterface:
 
 class DataProcessingInterface:
     default_logger = logger.get_logger("data_processing")
+    READ_WORKERS = min(32, cpu_count() + 4)
+    # Footer metadata key of resample cache files holding the fingerprint of their 1M source
+    CACHE_SOURCE_KEY = b'futu_algo.source'
+    # Canonical K-line schema: time_key as timestamp[ns], code/name dictionary-encoded (pandas category),
+    # volume as int64 and prices/ratios as float64 (or float32 with [Data.Storage] Float32 = True)
+    FLOAT_COLUMNS = ('open', 'close', 'high', 'low', 'pe_ratio', 'turnover_rate', 'turnover', 'change_rate',
+                     'last_close')
+    CATEGORY_COLUMNS = ('code', 'name')
+    # Streaming CSV <-> Parquet conversion: CSV block size in bytes and Parquet record batch size in rows
+    CONVERT_BLOCK_SIZE = 1 << 24
+    CONVERT_BATCH_ROWS = 1 << 16
+    # 1M validation: HK sessions by bar end time, and the shortest zero-volume run reported
+    HK_SESSIONS = {'MORNING': ('09:30', '12:00'), 'AFTERNOON': ('13:01', '16:00')}
+    ZERO_VOLUME_RUN = 30
+    VALIDATION_COLUMNS = ['code', 'date', 'check', 'count', 'first_time']
 
     @staticmethod
     def validate_dir(dir_path: Path):
         dir_path.mkdir(parents=True, exist_ok=True)
 
     @staticmethod
-    def get_1M_data_range(date_range: list, stock_list: list) -> dict:
+    def get_1M_data_range(date_range: list, stock_list: list, columns: list = None) -> dict:
         """
             Get 1M Data from CSV based on Stock List. Returned in Dict format
         :param date_range: A list of Date in DateTime Format (YYYY-MM-DD)
         :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param columns: Only decode these columns (e.g., ['time_key', 'close']). Default to all columns
         :return: Dictionary in Format {'HK.00001': pd.Dataframe, 'HK.00002': pd.Dataframe}
         """
+        if DatasetInterface.is_enabled():
+            return DatasetInterface.read_1M_data(stock_list, min(date_range), max(date_range), columns=columns)
+
+        # Resolve all existing files with one directory listing per stock instead of probing every date
+        stock_files = {stock_code: DataProcessingInterface.get_1M_data_range_paths(date_range, stock_code) for
+                       stock_code in stock_list}
+
+        # Decode every file concurrently, then concatenate each stock at the Arrow level and convert to pandas once.
+        # time_key is always decoded to look up the rehab factors of unadjusted files.
+        read_columns = columns if columns is None or 'time_key' in columns else ['time_key', *columns]
+        tables = DataProcessingInterface.read_parquet_files(
+            [input_path for input_files in stock_files.values() for input_path in input_files], columns=read_columns)
+        output_dict = {}
+        for stock_code, input_files in stock_files.items():
+            stock_tables = [RehabInterface.adjust_table(tables[input_path], stock_code) for input_path in input_files]
+            if not stock_tables:
+                output_dict[stock_code] = DataProcessingInterface.get_empty_kline_df(columns)
+                continue
+            # Files are named by date and each file is already sorted, so the concatenation is in time order
+            stock_table = pa.concat_tables(stock_tables, promote_options='permissive')
+            output_dict[stock_code] = (stock_table if columns is None else stock_table.select(columns)).to_pandas()
+        return output_dict
+
+    @staticmethod
+    def get_kline_type(column_name: str, float32: bool = None):
+        """
+            Canonical Arrow type of a K-line column, or None for columns outside the schema
+        """
+        if float32 is None:
+            float32 = config.getboolean('Data.Storage', 'Float32', fallback=False)
+        if column_name == 'time_key':
+            return pa.timestamp('ns')
+        if column_name == 'volume':
+            return pa.int64()
+        if column_name in DataProcessingInterface.CATEGORY_COLUMNS:
+            return pa.dictionary(pa.int32(), pa.string())
+        if column_name in DataProcessingInterface.FLOAT_COLUMNS:
+            return pa.float32() if float32 else pa.float64()
+        return None
+
+    @staticmethod
+    def get_kline_schema(column_names: list = None, float32: bool = None) -> pa.Schema:
+        column_names = column_names or json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
+        return pa.schema([(column_name, DataProcessingInterface.get_kline_type(column_name, float32) or pa.string())
+                          for column_name in column_names])
+
+    @staticmethod
+    def normalize_kline_table(table: pa.Table, float32: bool = None) -> pa.Table:
+        """
+            Cast the K-line columns of a table to the canonical schema. Columns already in their canonical type are
+            left untouched, so this is cheap on files written by this version. Other schema metadata (e.g., the
+            resample cache fingerprint) is kept, the stale pandas metadata is dropped.
+        :param table: K-line data with string or typed time_key (e.g., as stored by older versions or sent by Futu)
+        :param float32: Store prices in float32. Default to [Data.Storage] Float32
+        """
+        for index, field in enumerate(table.schema):
+            target_type = DataProcessingInterface.get_kline_type(field.name, float32)
+            if target_type is None or field.type == target_type:
+                continue
+            column = table.column(index)
+            if pa.types.is_dictionary(target_type):
+                column = column.cast(pa.string()).dictionary_encode()
+            else:
+                column = column.cast(target_type)
+            table = table.set_column(index, pa.field(field.name, column.type), column)
+        metadata = {key: value for key, value in (table.schema.metadata or {}).items() if key != b'pandas'}
+        return table.replace_schema_metadata(metadata or None)
+
+    @staticmethod
+    def normalize_kline_df(input_df: pd.DataFrame, float32: bool = None) -> pd.DataFrame:
+        """
+            Convert a K-line Dataframe to the canonical schema (the index is reset)
+        """
+        return DataProcessingInterface.normalize_kline_table(pa.Table.from_pandas(input_df, preserve_index=False),
+                                                             float32).to_pandas()
+
+    @staticmethod
+    def get_empty_kline_df(column_names: list = None) -> pd.DataFrame:
+        return DataProcessingInterface.get_kline_schema(column_names).empty_table().to_pandas()
+
+    @staticmethod
+    def list_dir(dir_path: Path) -> set:
+        """
+            File names in a directory from a single listing. Empty set if the directory does not exist.
+        :param dir_path: Directory to List
+        """
+        try:
+            with os.scandir(dir_path) as entries:
+                return {entry.name for entry in entries}
+        except FileNotFoundError:
+            return set()
+
+    @staticmethod
+    def read_parquet_files(input_paths: list, max_workers: int = None, columns: list = None) -> dict:
+        """
+            Decode a list of K-line Parquet files concurrently on a bounded thread pool and cast them to the
+            canonical schema. pyarrow releases the GIL while decoding, so this scales with cores and disk bandwidth.
+        :param input_paths: A list of Path to Load
+        :param max_workers: Number of reader threads. Default to DataProcessingInterface.READ_WORKERS
+        :param columns: Only decode these columns. Default to all columns
+        :return: Dictionary in Format {Path: pa.Table}
+        """
+        if not input_paths:
+            return {}
+        max_workers = max_workers or DataProcessingInterface.READ_WORKERS
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(input_paths))) as executor:
+            return dict(zip(input_paths, executor.map(
+                lambda input_path: DataProcessingInterface.normalize_kline_table(
+                    pq.read_table(input_path, columns=columns, use_threads=False, partitioning=None)), input_paths)))
+
+    @staticmethod
+    def get_parquet_write_options() -> dict:
+        """
+            Keyword arguments of pyarrow.parquet.write_table from the [Data.Storage] section
+        """
+        compression = config.get('Data.Storage', 'Compression', fallback='snappy').strip().lower()
+        write_options = {
+            'compression':      None if compression == 'none' else compression,
+            'use_dictionary':   config.getboolean('Data.Storage', 'UseDictionary', fallback=True),
+            'write_statistics': config.getboolean('Data.Storage', 'WriteStatistics', fallback=True),
+        }
+        if config.get('Data.Storage', 'CompressionLevel', fallback='').strip():
+            write_options['compression_level'] = config.getint('Data.Storage', 'CompressionLevel')
+        if config.get('Data.Storage', 'RowGroupSize', fallback='').strip():
+            write_options['row_group_size'] = config.getint('Data.Storage', 'RowGroupSize')
+        return write_options
+
+    @staticmethod
+    def get_custom_interval_data(target_date: datetime, custom_interval: int, stock_list: list) -> dict:
+        """
+            Get 3M/5M/15M/30M/60M Customized-Interval Data from 1M data based on Stock List. Returned in Dict format
+        :param target_date: Date in DateTime Format (YYYY-MM-DD)
+        :param custom_interval: Customized-Interval in unit of "Minutes"
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :return: Dictionary in Format {'HK.00001': pd.Dataframe, 'HK.00002': pd.Dataframe}
+        """
+        target_date = target_date if isinstance(target_date, str) else target_date.strftime(DATETIME_FORMAT_DW)
+        input_data = {}
+        for stock_code, input_df in DataProcessingInterface.get_1M_data_range([target_date], stock_list).items():
+            # Non-Trading Day -> Skip
+            if input_df.empty:
+                continue
+            input_data[stock_code] = DataProcessingInterface.resample_custom_interval(input_df, custom_interval)
+        return input_data
+
+    @staticmethod
+    def get_custom_interval_data_range(date_range: list, stock_list: list, custom_interval: int) -> dict:
+        """
+            Get Customized-Interval Data for a date range through the materialized resample cache.
+            Resampled bars are stored next to their 1M source (data/<code>/<code>_<YYYY-MM-DD>_5M.parquet, or the
+            5M dataset partition of the same month) together with the size/mtime fingerprint of the source.
+            Only caches whose 1M source is missing from the cache or changed since are rebuilt.
+        :param date_range: A list of Date in DateTime Format (YYYY-MM-DD)
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param custom_interval: Customized-Interval in unit of "Minutes"
+        :return: Dictionary in Format {'HK.00001': pd.Dataframe, 'HK.00002': pd.Dataframe}
+        """
+        k_type = f'{custom_interval}M'
+        source_units, stock_cache_paths = {}, {}
+        for stock_code in stock_list:
+            if DatasetInterface.is_enabled():
+                source_paths = DatasetInterface.get_partition_paths(stock_code, min(date_range), max(date_range))
+                cache_paths = [PATH_DATASET / k_type / source_path.relative_to(PATH_DATASET / '1M') for source_path in
+                               source_paths]
+            else:
+                source_paths = DataProcessingInterface.get_1M_data_range_paths(date_range, stock_code)
+                cache_paths = [source_path.with_name(source_path.name.replace('_1M.', f'_{k_type}.')) for
+                               source_path in source_paths]
+            source_units.update(zip(source_paths, cache_paths))
+            stock_cache_paths[stock_code] = cache_paths
+
+        stale_units = {source_path: cache_path for source_path, cache_path in source_units.items() if
+                       not DataProcessingInterface.is_cache_valid(source_path, cache_path)}
+        if stale_units:
+            DataProcessingInterface.default_logger.info(f'Rebuilding {len(stale_units)} {k_type} cache file(s)')
+            DataProcessingInterface.rebuild_custom_interval_cache(stale_units, custom_interval)
+
+        if DatasetInterface.is_enabled():
+            return DatasetInterface.read_1M_data(stock_list, min(date_range), max(date_range), k_type=k_type)
+
+        tables = DataProcessingInterface.read_parquet_files(list(source_units.values()))
         output_dict = {}
         for stock_code in stock_list:
-            # input_df refers to the all the 1M data from start_date to end_date in pd.Dataframe format
-            input_df = pd.concat(
-                [DataProcessingInterface.get_stock_df_from_file(
-                    PATH_DATA / stock_code / f'{stock_code}_{input_date}_1M.parquet')
-                    for input_date in date_range if
-                    (PATH_DATA / stock_code / f'{stock_code}_{input_date}_1M.parquet').is_file()],
-                ignore_index=True)
-            input_df[['open', 'close', 'high', 'low']] = input_df[['open', 'close', 'high', 'low']].apply(pd.to_numeric)
-            input_df.sort_values(by='time_key', ascending=True, inplace=True)
-            output_dict[stock_code] = output_dict.get(stock_code, input_df)
+            stock_tables = [RehabInterface.adjust_table(tables[cache_path], stock_code) for cache_path in
+                            stock_cache_paths[stock_code]]
+            output_dict[stock_code] = pa.concat_tables(stock_tables, promote_options='permissive').to_pandas() \
+                if stock_tables else DataProcessingInterface.get_empty_kline_df()
+        return output_dict
+
+    @staticmethod
+    def get_1M_data_range_paths(date_range: list, stock_code: str) -> list:
+        """
+            Existing per-day 1M files of a stock in date order, resolved with a catalog range query or a single
+            directory listing
+        """
+        if DataCatalogInterface.is_available():
+            stored_dates = set(DataCatalogInterface.get_partitions(stock_code, '1M', min(date_range), max(date_range)))
+            return [PATH_DATA / stock_code / f'{stock_code}_{input_date}_1M.parquet' for input_date in
+                    sorted(date_range) if input_date in stored_dates]
+        file_names = DataProcessingInterface.list_dir(PATH_DATA / stock_code)
+        return [PATH_DATA / stock_code / file_name for file_name in
+                sorted(f'{stock_code}_{input_date}_1M.parquet' for input_date in date_range) if file_name in file_names]
+
+    @staticmethod
+    def get_source_fingerprint(source_path: Path) -> bytes:
+        source_stat = source_path.stat()
+        return json.dumps({'size': source_stat.st_size, 'mtime_ns': source_stat.st_mtime_ns}).encode()
+
+    @staticmethod
+    def is_cache_valid(source_path: Path, cache_path: Path) -> bool:
+        """
+            A cache file is valid if the fingerprint in its footer matches the current state of its source.
+            Only the Parquet footer of the cache file is read.
+        """
+        try:
+            metadata = pq.read_schema(cache_path).metadata or {}
+        except (FileNotFoundError, pa.ArrowInvalid, OSError):
+            return False
+        return metadata.get(DataProcessingInterface.CACHE_SOURCE_KEY) == DataProcessingInterface.get_source_fingerprint(
+            source_path)
+
+    @staticmethod
+    def rebuild_custom_interval_cache(stale_units: dict, custom_interval: int) -> None:
+        """
+            Resample all stale 1M sources in one vectorized pass and write one cache file per source
+        :param stale_units: Dictionary in Format {source_path: cache_path}
+        :param custom_interval: Customized-Interval in unit of "Minutes"
+        """
+        # Fingerprint before reading so that a source modified in between is rebuilt again next time
+        fingerprints = {source_path: DataProcessingInterface.get_source_fingerprint(source_path) for source_path in
+                        stale_units}
+        tables = DataProcessingInterface.read_parquet_files(list(stale_units))
+        input_tables = []
+        for source_path, table in tables.items():
+            if 'code' not in table.column_names:
+                # Dataset partitions carry the stock code in the directory name only
+                table = table.append_column('code', pa.array([source_path.parts[-4].replace('code=', '')] *
+                                                             table.num_rows, pa.string()).dictionary_encode())
+            input_tables.append(table.append_column('_source', pa.array([source_path.as_posix()] * table.num_rows,
+                                                                        pa.string())))
+        input_df = pa.concat_tables(input_tables, promote_options='permissive').to_pandas()
+
+        # Resampling never crosses a day, so every source file maps to its own set of bars
+        source_by_day = input_df.groupby(['code', input_df['time_key'].dt.normalize()], sort=False, observed=True)[
+            '_source'].first()
+        output_df = DataProcessingInterface.resample_custom_interval(input_df.drop(columns=['_source']),
+                                                                     custom_interval)
+        output_df['_source'] = source_by_day.reindex(
+            pd.MultiIndex.from_arrays([output_df['code'], output_df['time_key'].dt.normalize()])).to_numpy()
+
+        for source_path, cache_path in stale_units.items():
+            table = pa.Table.from_pandas(
+                output_df[output_df['_source'] == source_path.as_posix()].drop(columns=['_source']),
+                preserve_index=False)
+            # Resampling commutes with the price adjustment, so caches keep the adjustment type of their source
+            table = table.replace_schema_metadata(
+                {**(table.schema.metadata or {}), DataProcessingInterface.CACHE_SOURCE_KEY: fingerprints[source_path],
+                 RehabInterface.AUTYPE_KEY: RehabInterface.get_autype(tables[source_path])})
+            if DatasetInterface.is_enabled():
+                DatasetInterface.write_partition(table, cache_path)
+            else:
+                DataProcessingInterface.write_parquet_atomic(table, cache_path)
+
+    @staticmethod
+    def resample_custom_interval(input_df: pd.DataFrame, custom_interval: int) -> pd.DataFrame:
+        """
+            Resample multi-day (and multi-stock) 1M data into custom-interval bars in one vectorized pass.
+            HK session rules: Bars are anchored at the session open (09:30 / 13:00) and labelled by their end time.
+            The 09:30 opening-auction bar is merged into the first bar, and the last bar of each session is cut at
+            12:00 / 16:00 (e.g., 60M bars end at 10:30, 11:30, 12:00, 14:00, 15:00, 16:00).
+            last_close is the close of the previous bar of the same day (the previous close for the first bar).
+        :param input_df: 1M data in Futu HistoryDataFormat
+        :param custom_interval: Customized-Interval in unit of "Minutes" (e.g., 3, 5, 15, 30, 60)
+        :return: Dataframe in Futu HistoryDataFormat sorted by code and time_key
+        """
+        column_names = json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
+        if input_df.empty:
+            return DataProcessingInterface.get_empty_kline_df(column_names)
+
+        time_key = pd.to_datetime(input_df['time_key'])
+        trading_date = time_key.dt.normalize()
+        minute_of_day = time_key.dt.hour * 60 + time_key.dt.minute
+        # Morning session 09:30 - 12:00, afternoon session 13:00 - 16:00 (in minutes of day)
+        is_morning = minute_of_day < 13 * 60
+        session_open = np.where(is_morning, 9 * 60 + 30, 13 * 60)
+        session_close = np.where(is_morning, 12 * 60, 16 * 60)
+        # 1M bars are labelled by their end time. The auction bar (elapsed 0) joins the first bar of the session
+        elapsed = np.clip(minute_of_day.to_numpy() - session_open, 1, None)
+        bar_end = np.minimum(session_open + np.ceil(elapsed / custom_interval).astype(int) * custom_interval,
+                             session_close)
+
+        agg_list = {
+            "open":          "first",
+            "close":         "last",
+            "high":          "max",
+            "low":           "min",
+            "pe_ratio":      "last",
+            "turnover_rate": "sum",
+            "volume":        "sum",
+            "turnover":      "sum",
+            "last_close":    "first",
+        }
+        grouped_df = input_df[list(agg_list.keys())].groupby(
+            [input_df['code'].to_numpy(), (trading_date + pd.to_timedelta(bar_end, unit='min')).to_numpy()],
+            sort=True).agg(agg_list)
+        grouped_df.index.names = ['code', 'time_key']
+        minute_df = grouped_df.reset_index()
+
+        # Last Close = Previous Close Price within the same day. The first bar keeps the previous day close
+        previous_close = minute_df.groupby(['code', minute_df['time_key'].dt.normalize()])['close'].shift(1)
+        minute_df['last_close'] = previous_close.fillna(minute_df['last_close'])
+        # Change Rate = (Close Price - Last Close Price) / Last Close Price * 100
+        minute_df['change_rate'] = 100 * (minute_df['close'] - minute_df['last_close']) / minute_df['last_close']
+
+        return DataProcessingInterface.normalize_kline_df(minute_df.reindex(columns=column_names))
+
+    @staticmethod
+    def convert_day_interval_to_weekly(input_df: pd.DataFrame):
+        """
+        For Yahoo Finance format, Index(['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits'], dtype='object')
+        Convert from Day-level K-line to Weekly-level K-Line for Stock Filter. Inplace change
+        :param input_df: Dataframe extracted from yFinance lib
+        """
+        logic = {'open':   'first',
+                 'high':   'max',
+                 'low':    'min',
+                 'close':  'last',
+                 'volume': 'sum'}
+        input_df.columns = [item.lower().strip() for item in input_df]
+
+        input_df.index = pd.to_datetime(input_df.index)
+        input_df = input_df.resample('W').apply(logic)
+        input_df.index = input_df.index - pd.tseries.frequencies.to_offset("6D")
+
+    @staticmethod
+    def get_session_offsets(trade_date_type: str = 'WHOLE') -> np.ndarray:
+        """
+            Expected 1M bar times of an HK trading day as nanosecond offsets from midnight. Futu stamps a bar with
+            its end time: 09:30 (opening auction) to 12:00 in the morning, 13:01 to 16:00 in the afternoon
+        :param trade_date_type: WHOLE / MORNING / AFTERNOON (Futu TradeDateType)
+        """
+        sessions = ('MORNING', 'AFTERNOON') if trade_date_type == 'WHOLE' else (trade_date_type,)
+        return np.concatenate([np.arange(pd.Timedelta(f'{start}:00').value, pd.Timedelta(f'{end}:00').value + 1,
+                                         pd.Timedelta(minutes=1).value, dtype=np.int64) for start, end in
+                               (DataProcessingInterface.HK_SESSIONS[session] for session in sessions)])
+
+    @staticmethod
+    def get_flagged_days(check: str, days: np.ndarray, times: np.ndarray, mask: np.ndarray) -> pd.DataFrame:
+        """
+            Count and first time of the flagged bars of each day
+        """
+        flagged_df = pd.DataFrame({'date': days[mask], 'first_time': times[mask]})
+        flagged_df = flagged_df.groupby('date', sort=True).agg(count=('first_time', 'size'),
+                                                               first_time=('first_time', 'min')).reset_index()
+        flagged_df['check'] = check
+        return flagged_df
+
+    @staticmethod
+    def validate_stock_1M_data(stock_code: str, date_range: list, trading_days: dict = None) -> pd.DataFrame:
+        """
+            Vectorized integrity checks of the stored 1M data of one stock. One report row per (date, check):
+            missing_day: Trading day of the calendar without any bar
+            missing_minutes: Expected session minutes without a bar (count = number of minutes)
+            off_session: Bars outside the session minutes of the day, or on a day that is not a trading day
+            duplicate_time / non_monotonic: Repeated time_key / time_key not increasing in stored order
+            ohlc_inconsistent: high < max(open, close), low > min(open, close), or a missing / non-positive price
+            zero_volume_run: Runs of at least ZERO_VOLUME_RUN consecutive zero-volume bars (count = longest run)
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param date_range: A list of Date in DateTime Format (YYYY-MM-DD)
+        :param trading_days: {'YYYY-MM-DD': 'WHOLE' / 'MORNING' / 'AFTERNOON'}. Default to the stored days as
+                             whole trading days (no calendar gap check)
+        """
+        input_df = DataProcessingInterface.get_1M_data_range(
+            date_range, [stock_code], columns=['time_key', 'open', 'high', 'low', 'close', 'volume'])[stock_code]
+        times = input_df['time_key'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+        day_ns = pd.Timedelta(days=1).value
+        days = times - times % day_ns
+        if trading_days is None:
+            trading_days = {pd.Timestamp(day).strftime(DATETIME_FORMAT_DW): 'WHOLE' for day in np.unique(days)}
+        calendar = {pd.Timestamp(trading_day).value: trade_date_type for trading_day, trade_date_type in
+                    trading_days.items() if min(date_range) <= trading_day <= max(date_range)}
+
+        # Expected bar times of every calendar day, built per trade date type
+        expected_days, expected_times = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for trade_date_type in set(calendar.values()):
+            type_days = np.array([day for day, day_type in calendar.items() if day_type == trade_date_type],
+                                 dtype=np.int64)
+            offsets = DataProcessingInterface.get_session_offsets(trade_date_type)
+            expected_days.append(np.repeat(type_days, len(offsets)))
+            expected_times.append((type_days[:, None] + offsets[None, :]).ravel())
+        expected_days, expected_times = np.concatenate(expected_days), np.concatenate(expected_times)
+
+        report_dfs = []
+        missing_df = DataProcessingInterface.get_flagged_days(
+            'missing_minutes', expected_days, expected_times, ~np.isin(expected_times, times))
+        missing_df.loc[~missing_df['date'].isin(days), 'check'] = 'missing_day'
+        report_dfs.append(missing_df)
+        report_dfs.append(DataProcessingInterface.get_flagged_days(
+            'off_session', days, times, ~np.isin(times, expected_times)))
+        report_dfs.append(DataProcessingInterface.get_flagged_days(
+            'duplicate_time', days, times, pd.Series(times).duplicated().to_numpy()))
+        report_dfs.append(DataProcessingInterface.get_flagged_days(
+            'non_monotonic', days, times, np.r_[False, np.diff(times) < 0]))
+
+        open_price, high, low, close = (input_df[column].to_numpy(dtype=np.float64) for column in
+                                        ('open', 'high', 'low', 'close'))
+        prices = np.column_stack([open_price, high, low, close])
+        report_dfs.append(DataProcessingInterface.get_flagged_days(
+            'ohlc_inconsistent', days, times,
+            (high < np.maximum(open_price, close)) | (low > np.minimum(open_price, close)) |
+            np.isnan(prices).any(axis=1) | (prices <= 0).any(axis=1)))
+
+        # Zero-volume runs never span two days
+        zero_volume = input_df['volume'].to_numpy() == 0
+        run_start = zero_volume & ~np.r_[False, zero_volume[:-1] & (days[1:] == days[:-1])]
+        run_ids = np.cumsum(run_start)[zero_volume]
+        run_df = pd.DataFrame({'run': run_ids, 'date': days[zero_volume], 'first_time': times[zero_volume]})
+        run_df = run_df.groupby('run').agg(date=('date', 'first'), count=('first_time', 'size'),
+                                           first_time=('first_time', 'min'))
+        run_df = run_df[run_df['count'] >= DataProcessingInterface.ZERO_VOLUME_RUN]
+        run_df = run_df.groupby('date', sort=True).agg(count=('count', 'max'), first_time=('first_time', 'min'))
+        report_dfs.append(run_df.reset_index().assign(check='zero_volume_run'))
+
+        report_df = pd.concat(report_dfs, ignore_index=True)
+        report_df['date'] = pd.to_datetime(report_df['date']).dt.date
+        report_df['first_time'] = pd.to_datetime(report_df['first_time'])
+        report_df.insert(0, 'code', stock_code)
+        return report_df.astype({'count': np.int32})[DataProcessingInterface.VALIDATION_COLUMNS]
+
+    @staticmethod
+    def validate_1M_data(date_range: list, stock_list: list, trading_days: dict = None,
+                         max_workers: int = None) -> pd.DataFrame:
+        """
+            Validate the stored 1M data of all stocks in parallel (one process per stock at a time)
+        :param date_range: A list of Date in DateTime Format (YYYY-MM-DD)
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param trading_days: {'YYYY-MM-DD': 'WHOLE' / 'MORNING' / 'AFTERNOON'} of the HK trading calendar
+        :param max_workers: Number of processes. Default to the number of CPUs
+        :return: Report with one row per (code, date, check). See validate_stock_1M_data
+        """
+        with Pool(min(max_workers or cpu_count(), max(len(stock_list), 1))) as pool:
+            report_dfs = pool.starmap(DataProcessingInterface.validate_stock_1M_data,
+                                      [(stock_code, date_range, trading_days) for stock_code in stock_list])
+        report_df = pd.concat(report_dfs, ignore_index=True) if report_dfs else pd.DataFrame(
+            columns=DataProcessingInterface.VALIDATION_COLUMNS)
+        report_df = report_df.astype({'code': 'category', 'check': 'category'}).sort_values(
+            by=['code', 'date', 'check']).reset_index(drop=True)
+        DataProcessingInterface.default_logger.info(
+            f'Validated 1M data of {len(stock_list)} stocks: {report_df["check"].value_counts().to_dict()}')
+        return report_df
+
+    @staticmethod
+    def save_validation_report(report_df: pd.DataFrame, output_dir: Path = Path('./validation_report')) -> Path:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / f'{datetime.now().strftime("%Y_%m_%d-%I_%M_%S_%p")}_1M_Validation.parquet'
+        pq.write_table(pa.Table.from_pandas(report_df, preserve_index=False), output_path,
+                       **DataProcessingInterface.get_parquet_write_options())
+        return output_path
+
+    @staticmethod
+    def save_stock_df_to_file(data: pd.DataFrame, output_path: str, file_type='parquet', autype: str = None) -> bool:
+        """
+        Save Data to File (CSV / Feather)
+        :param data: Data to Save
+        :param output_path: File Name to Save
+        :param file_type: File Type to Save (CSV / Feather / Parquet)
+        :param autype: Adjustment type of K-line prices stored in the Parquet footer (e.g., NONE for unadjusted)
+        :return: None
+        """
+        if data.empty:
+            return False
+        try:
+            # Written to a temporary file and renamed into place (which also registers it in the catalog). A failed
+            # write leaves the existing file untouched
+            with DataProcessingInterface.atomic_output(Path(output_path)) as temp_path:
+                if file_type == 'csv':
+                    data.to_csv(temp_path, index=False, encoding='utf-8-sig')
+                elif file_type == 'parquet':
+                    write_options = DataProcessingInterface.get_parquet_write_options()
+                    if 'time_key' in data.columns:
+                        # K-line data is stored in the canonical schema
+                        table = DataProcessingInterface.normalize_kline_table(
+                            pa.Table.from_pandas(data, preserve_index=False))
+                        if autype is not None:
+                            table = RehabInterface.set_autype(table, autype)
+                        pq.write_table(table, temp_path, **write_options)
+                    else:
+                        data.to_parquet(temp_path, index=False, **write_options)
+        except OverflowError as e:
+            DataProcessingInterface.default_logger.error(f'Cannot save {output_path}: {e}')
+            return False
+        return True
+
+    @staticmethod
+    def save_stock_df_async(data: pd.DataFrame, output_path: Path, file_type='parquet', autype: str = None) -> bool:
+        """
+            Queue save_stock_df_to_file on the background writer (see AsyncWriteInterface)
+        :return: True if there is data to save
+        """
+        if data.empty:
+            return False
+        AsyncWriteInterface.submit(DataProcessingInterface.save_stock_df_to_file, data, output_path, file_type, autype)
+        return True
+
+    @staticmethod
+    def write_parquet_atomic(table: pa.Table, output_path: Path, **write_options) -> None:
+        """
+            Write a Parquet file through a temporary file and rename it into place, so that readers never see a
+            partially written file and an interrupted rewrite never corrupts the existing one.
+        :param table: Arrow Table to Save
+        :param output_path: File Name to Save
+        :param write_options: Keyword arguments of pyarrow.parquet.write_table, overriding [Data.Storage]
+        """
+        with DataProcessingInterface.atomic_output(output_path) as temp_path:
+            pq.write_table(table, temp_path,
+                           **{**DataProcessingInterface.get_parquet_write_options(), **write_options})
+
+    @staticmethod
+    @contextmanager
+    def atomic_output(output_path: Path):
+        """
+            Yield a temporary path next to output_path and rename it into place once the block completes.
+            The temporary file is removed if the block raises, leaving any existing output_path untouched.
+        """
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = output_path.with_name(f'{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            yield temp_path
+            os.replace(temp_path, output_path)
+            DataCatalogInterface.register(output_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    @staticmethod
+    def get_stock_df_from_file(input_path: Path, columns: list = None) -> pd.DataFrame:
+        """
+        Load Data from File (CSV / Feather / Parquet). K-line data is returned in the canonical schema, with
+        unadjusted prices adjusted to [Data.Storage] AdjustType
+        :param input_path: File Name to Load
+        :param columns: Only load these columns (e.g., ['time_key', 'close']). Default to all columns
+        :return: DataFrame
+        """
+        data = DataProcessingInterface.get_empty_kline_df(columns)
+        if input_path.suffix == '.csv':
+            data = pd.read_csv(input_path, index_col=None, encoding='utf-8-sig', usecols=columns)
+        elif input_path.suffix == '.parquet' and 'time_key' in pq.read_schema(input_path).names:
+            read_columns = columns if columns is None or 'time_key' in columns else ['time_key', *columns]
+            table = DataProcessingInterface.normalize_kline_table(
+                pq.read_table(input_path, columns=read_columns, partitioning=None))
+            # K-line files are stored in data/<code>/, so the folder names the stock if the code column is not read
+            table = RehabInterface.adjust_table(table, None if 'code' in table.column_names else input_path.parent.name)
+            return (table if columns is None else table.select(columns)).to_pandas()
+        elif input_path.suffix == '.parquet':
+            data = pd.read_parquet(input_path, columns=columns)
+        if 'time_key' in data.columns:
+            data = DataProcessingInterface.normalize_kline_df(data)
+        return data
+
+    @staticmethod
+    def convert_to_canonical_schema(input_path: Path) -> bool:
+        """
+            Rewrite a K-line Parquet file (per-day file, yearly 1D/1W file, resample cache or dataset partition) in
+            the canonical schema. Files already in the canonical schema are skipped.
+        :param input_path: File to Convert
+        :return: True if the file was rewritten
+        """
+        table = pq.read_table(input_path, partitioning=None)
+        if 'time_key' not in table.column_names:
+            return False
+        output_table = DataProcessingInterface.normalize_kline_table(table)
+        if output_table.schema.remove_metadata().equals(table.schema.remove_metadata()):
+            return False
+        if input_path.is_relative_to(PATH_DATASET):
+            DatasetInterface.write_partition(output_table, input_path)
+        else:
+            DataProcessingInterface.write_parquet_atomic(output_table, input_path)
+        DataProcessingInterface.default_logger.info(f'Converted {input_path} to the canonical schema')
+        return True
+
+    @staticmethod
+    def convert_all_to_canonical_schema() -> int:
+        """
+            Convert all stored K-line files to the canonical schema
+        :return: Number of files rewritten
+        """
+        pool = Pool(cpu_count())
+        converted = sum(pool.map(DataProcessingInterface.convert_to_canonical_schema,
+                                 DataProcessingInterface.get_all_parquet_files()))
+        pool.close()
+        pool.join()
+        return converted
+
+    @staticmethod
+    def check_empty_data(input_path: Path) -> bool:
+        """
+        Check if the input file is empty (from its Parquet footer) and remove it if so
+        :param input_path:
+        :return:
+        """
+        if DataProcessingInterface.inspect_data_file(input_path)['status'] == 'empty':
+            input_path.unlink()
+            DataCatalogInterface.unregister(input_path)
+            DataProcessingInterface.default_logger.info(f'{input_path} removed.')
+            return True
+        return False
+
+    @staticmethod
+    def clear_empty_data():
+        if DataCatalogInterface.is_available():
+            input_paths = DataCatalogInterface.get_files(('1D', '1W', '1M'))
+        else:
+            input_paths = list(PATH_DATA.rglob("*/*_1[DWM].parquet"))
+        DataProcessingInterface.scan_data_health(input_paths, action='remove', statuses=('empty',))
+
+    @staticmethod
+    def get_all_parquet_files() -> list:
+        """
+            All K-line Parquet files: per-day / yearly files, resample caches and dataset partitions
+        """
+        if DataCatalogInterface.is_available():
+            return [PATH_DATA / row[0] for row in
+                    DataCatalogInterface.query("SELECT path FROM data_file WHERE format = 'parquet'")]
+        return [*PATH_DATA.glob('*/*_*[DWM].parquet'), *PATH_DATASET.rglob('part-0.parquet')]
+
+    @staticmethod
+    def get_footer_time_range(metadata: pq.FileMetaData) -> tuple:
+        """
+            (min, max) time_key of a Parquet file from its row group statistics, as 'YYYY-MM-DD HH:MM:SS' strings
+        """
+        if 'time_key' not in metadata.schema.names:
+            return None, None
+        column_index = metadata.schema.names.index('time_key')
+        min_time, max_time = None, None
+        for row_group in range(metadata.num_row_groups):
+            statistics = metadata.row_group(row_group).column(column_index).statistics
+            if statistics is None or not statistics.has_min_max:
+                continue
+            min_time = statistics.min if min_time is None else min(min_time, statistics.min)
+            max_time = statistics.max if max_time is None else max(max_time, statistics.max)
+        return None if min_time is None else str(min_time), None if max_time is None else str(max_time)
+
+    @staticmethod
+    def inspect_data_file(input_path: Path) -> dict:
+        """
+            Health of a K-line Parquet file from its footer only (no data page is decoded)
+            empty: no rows. truncated: unreadable footer or column chunks beyond the end of the file.
+            schema_drift: a column of HistoryDataFormat is missing or has a type that cannot hold it.
+        :param input_path: File to Inspect
+        :return: Dictionary with path, status, row_count, min_time, max_time and detail
+        """
+        output_dict = {'path': input_path, 'status': 'ok', 'row_count': None, 'min_time': None, 'max_time': None,
+                       'detail': ''}
+        try:
+            metadata = pq.read_metadata(input_path)
+            file_size = input_path.stat().st_size
+        except (pa.ArrowException, OSError) as e:
+            return {**output_dict, 'status': 'truncated', 'detail': str(e)}
+        output_dict['row_count'] = metadata.num_rows
+        output_dict['min_time'], output_dict['max_time'] = DataProcessingInterface.get_footer_time_range(metadata)
+
+        for row_group in range(metadata.num_row_groups):
+            for column_index in range(metadata.num_columns):
+                column = metadata.row_group(row_group).column(column_index)
+                start_offset = column.dictionary_page_offset if column.has_dictionary_page else column.data_page_offset
+                if start_offset + column.total_compressed_size > file_size:
+                    return {**output_dict, 'status': 'truncated',
+                            'detail': f'Column chunk {column.path_in_schema} of row group {row_group} ends beyond '
+                                      f'the file size {file_size}'}
+
+        if metadata.num_rows == 0:
+            return {**output_dict, 'status': 'empty'}
+
+        schema = metadata.schema.to_arrow_schema()
+        expected_columns = json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
+        if input_path.is_relative_to(PATH_DATASET):
+            # Dataset partitions carry the stock code in the directory name only
+            expected_columns = [column_name for column_name in expected_columns if column_name != 'code']
+        drifts = [f'missing {column_name}' for column_name in expected_columns if column_name not in schema.names]
+        for field in schema:
+            if field.name not in expected_columns:
+                continue
+            field_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+            if field.name == 'time_key':
+                compatible = pa.types.is_timestamp(field_type) or pa.types.is_string(field_type) or \
+                             pa.types.is_large_string(field_type)
+            elif field.name in DataProcessingInterface.CATEGORY_COLUMNS:
+                compatible = pa.types.is_string(field_type) or pa.types.is_large_string(field_type)
+            else:
+                compatible = pa.types.is_floating(field_type) or pa.types.is_integer(field_type)
+            if not compatible:
+                drifts.append(f'{field.name}: {field.type}')
+        if drifts:
+            return {**output_dict, 'status': 'schema_drift', 'detail': ', '.join(drifts)}
         return output_dict
 
     @staticmethod
-    def get_custom_interval_data(target_date: datetime, custom_interval: int, stock_list: list) -> dict:
+    def scan_data_health(input_paths: list = None, action: str = None,
+                         statuses: tuple = ('empty', 'truncated', 'schema_drift'),
+                         max_workers: int = None) -> pd.DataFrame:
+        """
+            Footer-only health check of the stored K-line files, concurrently on a bounded thread pool
+        :param input_paths: Files to Inspect. Default to all K-line Parquet files
+        :param action: None to only report, 'remove' to delete or 'quarantine' to move flagged files to
+                       data/Quarantine (keeping their relative path)
+        :param statuses: Statuses the action applies to
+        :param max_workers: Number of threads. Default to DataProcessingInterface.READ_WORKERS
+        :return: One row per file with path, status, row_count, min_time, max_time and detail
+        """
+        input_paths = DataProcessingInterface.get_all_parquet_files() if input_paths is None else list(input_paths)
+        output_columns = ['path', 'status', 'row_count', 'min_time', 'max_time', 'detail']
+        if not input_paths:
+            return pd.DataFrame(columns=output_columns)
+        with ThreadPoolExecutor(max_workers=min(max_workers or DataProcessingInterface.READ_WORKERS,
+                                                len(input_paths))) as executor:
+            output_df = pd.DataFrame(list(executor.map(DataProcessingInterface.inspect_data_file, input_paths)),
+                                     columns=output_columns)
+
+        flagged_df = output_df[output_df['status'].isin(statuses)]
+        for input_path in flagged_df['path']:
+            if action == 'remove':
+                input_path.unlink()
+            elif action == 'quarantine':
+                output_path = PATH_DATA / 'Quarantine' / input_path.relative_to(PATH_DATA)
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(input_path, output_path)
+            else:
+                continue
+            DataCatalogInterface.unregister(input_path)
+            DataProcessingInterface.default_logger.info(f'{input_path} {action}d.')
+        DataProcessingInterface.default_logger.info(
+            f'Scanned {output_df.shape[0]} files: {output_df["status"].value_counts().to_dict()}')
+        return output_df
+
+    @staticmethod
+    def convert_csv_to_parquet(input_file: Path, block_size: int = None) -> bool:
+        """
+        Convert CSV file to Parquet file. The CSV is streamed in blocks of block_size bytes and every block is
+        written as its own row group(s), so memory stays bounded by the block size whatever the file size.
+        K-line columns are stored in the canonical schema
+        :param input_file: File to Convert
+        :param block_size: CSV block size in bytes. Default to DataProcessingInterface.CONVERT_BLOCK_SIZE
+        :return: bool
+        """
+        if input_file.suffix != '.csv':
+            return False
+        output_file = input_file.with_suffix('.parquet')
+        DataProcessingInterface.default_logger.info(f'Converting {input_file} to {output_file}')
+        start_time = time.perf_counter()
+        reader = pa_csv.open_csv(input_file, read_options=pa_csv.ReadOptions(
+            block_size=block_size or DataProcessingInterface.CONVERT_BLOCK_SIZE))
+        schema = DataProcessingInterface.normalize_kline_table(reader.schema.empty_table()).schema
+        write_options = DataProcessingInterface.get_parquet_write_options()
+        row_group_size = write_options.pop('row_group_size', None)
+        row_count = 0
+        with DataProcessingInterface.atomic_output(output_file) as temp_file:
+            with pq.ParquetWriter(temp_file, schema, **write_options) as writer:
+                for batch in reader:
+                    writer.write_table(DataProcessingInterface.normalize_kline_table(pa.Table.from_batches([batch])),
+                                       row_group_size=row_group_size)
+                    row_count += batch.num_rows
+        DataProcessingInterface.log_conversion(input_file, output_file, row_count, time.perf_counter() - start_time)
+        return True
+
+    @staticmethod
+    def convert_parquet_to_csv(input_file: Path, batch_size: int = None) -> bool:
+        """
+        Convert Parquet file to CSV file, one record batch at a time. time_key is written in the
+        'YYYY-MM-DD HH:MM:SS' format of Futu
+        :param input_file: File to Convert
+        :param batch_size: Rows per batch. Default to DataProcessingInterface.CONVERT_BATCH_ROWS
+        :return: bool
+        """
+        if input_file.suffix != '.parquet':
+            return False
+        output_file = input_file.with_suffix('.csv')
+        DataProcessingInterface.default_logger.info(f'Converting {input_file} to {output_file}')
+        start_time = time.perf_counter()
+        parquet_file = pq.ParquetFile(input_file)
+        row_count = 0
+        writer = None
+        with DataProcessingInterface.atomic_output(output_file) as temp_file:
+            for batch in parquet_file.iter_batches(batch_size=batch_size or DataProcessingInterface.CONVERT_BATCH_ROWS):
+                table = DataProcessingInterface.format_csv_table(pa.Table.from_batches([batch]))
+                if writer is None:
+                    writer = pa_csv.CSVWriter(temp_file, table.schema)
+                writer.write_table(table)
+                row_count += batch.num_rows
+            if writer is None:
+                pa_csv.write_csv(DataProcessingInterface.format_csv_table(parquet_file.schema_arrow.empty_table()),
+                                 temp_file)
+            else:
+                writer.close()
+        DataProcessingInterface.log_conversion(input_file, output_file, row_count, time.perf_counter() - start_time)
+        return True
+
+    @staticmethod
+    def format_csv_table(table: pa.Table) -> pa.Table:
+        """
+            Timestamps as 'YYYY-MM-DD HH:MM:SS' strings and dictionary columns as plain strings for CSV output
+        """
+        for index, field in enumerate(table.schema):
+            if pa.types.is_timestamp(field.type):
+                # %S of a sub-second unit would print the fraction as well
+                column = pc.strftime(table.column(index).cast(pa.timestamp('s', field.type.tz), safe=False),
+                                     format='%Y-%m-%d %H:%M:%S')
+            elif pa.types.is_dictionary(field.type):
+                column = table.column(index).cast(pa.string())
+            else:
+                continue
+            table = table.set_column(index, pa.field(field.name, column.type), column)
+        return table
+
+    @staticmethod
+    def log_conversion(input_file: Path, output_file: Path, row_count: int, elapsed: float) -> None:
+        input_size = input_file.stat().st_size
+        DataProcessingInterface.default_logger.info(
+            f'Converted {input_file.name} ({row_count} rows, {humanize.naturalsize(input_size)} -> '
+            f'{humanize.naturalsize(output_file.stat().st_size)}) in {elapsed:.2f}s, '
+            f'{humanize.naturalsize(input_size / max(elapsed, 1e-9))}/s')
+
+    @staticmethod
+    def convert_all_csv_to_parquet(max_workers: int = None) -> int:
+        """
+            Convert all K-line CSV files in the data folder. Files are converted concurrently on a bounded thread
+            pool; pyarrow parses and encodes without holding the GIL, so the threads keep the disk busy.
+        :param max_workers: Number of concurrent conversions. Default to DataProcessingInterface.READ_WORKERS
+        :return: Number of files converted
+        """
+        if DataCatalogInterface.is_available():
+            input_paths = DataCatalogInterface.get_files(('1D', '1W', '1M'), file_format='csv')
+        else:
+            input_paths = list(PATH_DATA.rglob("*/*_1[DWM].csv"))
+        if not input_paths:
+            return 0
+        with ThreadPoolExecutor(max_workers=min(max_workers or DataProcessingInterface.READ_WORKERS,
+                                                len(input_paths))) as executor:
+            return sum(executor.map(DataProcessingInterface.convert_csv_to_parquet, input_paths))
+
+    @staticmethod
+    def get_num_days_to_update(stock_code, k_type: str = '1D') -> int:
+        watermark = WatermarkInterface.get_watermark(stock_code, k_type)
+        if watermark is not None:
+            return (datetime.now() - datetime.strptime(watermark, DATETIME_FORMAT_DW)).days
+        if DataCatalogInterface.is_available():
+            last_update = DataCatalogInterface.get_latest_mtime(stock_code)
+            return 365 * 2 if last_update is None else (datetime.now() - last_update).days
+        try:
+            return (datetime.now() - datetime.fromtimestamp(
+                Path(max((PATH_DATA / stock_code).glob('*_1[DWM].parquet'), key=os.path.getctime)).stat().st_mtime)).days
+        # Will throw ValueError if the Path is not found
+        except ValueError:
+            return 365 * 2
+
+    @staticmethod
+    def get_file_to_df(input_file: Path) -> pd.DataFrame:
+        if input_file.suffix == '.parquet':
+            DataProcessingInterface.default_logger.info(f'Loading {input_file}...')
+            return pd.read_parquet(input_file)
+        return pd.DataFrame()
+
+
+class AsyncWriteInterface:
+    """
+        Background writer of the download paths. A download thread hands its data over and returns to the next
+        request instead of waiting for the encode and write. Pending writes are bounded by [Data.Storage]
+        WriteQueueSize: submit() blocks once the queue is full (back-pressure on the download). flush() is the
+        barrier at the end of a download job, which waits for every submitted write.
+        WriteQueueSize = 0 writes synchronously.
+    """
+    default_logger = logger.get_logger("async_write")
+    lock = threading.Lock()
+    executor = None
+    slots = None
+    pending = set()
+    failures = []
+
+    @staticmethod
+    def get_executor() -> ThreadPoolExecutor:
+        with AsyncWriteInterface.lock:
+            if AsyncWriteInterface.executor is None:
+                AsyncWriteInterface.executor = ThreadPoolExecutor(
+                    max_workers=config.getint('Data.Storage', 'WriteWorkers', fallback=4),
+                    thread_name_prefix='async_write')
+                AsyncWriteInterface.slots = threading.BoundedSemaphore(
+                    config.getint('Data.Storage', 'WriteQueueSize', fallback=64))
+            return AsyncWriteInterface.executor
+
+    @staticmethod
+    def submit(fn, *args, **kwargs) -> None:
+        """
+            Run a write function on the writer pool. Blocks while WriteQueueSize writes are pending.
+        """
+        if config.getint('Data.Storage', 'WriteQueueSize', fallback=64) <= 0:
+            fn(*args, **kwargs)
+            return
+        executor = AsyncWriteInterface.get_executor()
+        AsyncWriteInterface.slots.acquire()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BaseException:
+            AsyncWriteInterface.slots.release()
+            raise
+        with AsyncWriteInterface.lock:
+            AsyncWriteInterface.pending.add(future)
+        future.add_done_callback(AsyncWriteInterface.on_done)
+
+    @staticmethod
+    def on_done(future: Future) -> None:
+        with AsyncWriteInterface.lock:
+            AsyncWriteInterface.pending.discard(future)
+            if future.exception() is not None:
+                AsyncWriteInterface.failures.append(future.exception())
+        AsyncWriteInterface.slots.release()
+        if future.exception() is not None:
+            AsyncWriteInterface.default_logger.error(f'Background write failed: {future.exception()}')
+
+    @staticmethod
+    def flush() -> int:
+        """
+            Wait until every submitted write has completed
+        :return: Number of writes that failed since the last flush
+        """
+        while True:
+            with AsyncWriteInterface.lock:
+                pending = list(AsyncWriteInterface.pending)
+            if not pending:
+                break
+            wait(pending)
+        with AsyncWriteInterface.lock:
+            failures, AsyncWriteInterface.failures = AsyncWriteInterface.failures, []
+        return len(failures)
+
+
+class DatasetInterface:
+    """
+        Hive-style partitioned Parquet dataset for 1M K-line data. One file per stock per month, sorted by time_key:
+        data/Dataset/1M/code=HK.00700/year=2022/month=4/part-0.parquet
+        The partition keys (code, year, month) are only encoded in the directory names, not in the file itself.
+    """
+    default_logger = logger.get_logger("dataset")
+    PARTITION_SCHEMA = pa.schema([('code', pa.string()), ('year', pa.int16()), ('month', pa.int8())])
+    # Roughly 6 trading days of 1M bars per row group, so a time_key filter can skip most of a month
+    ROW_GROUP_SIZE = 2000
+    # Stock folders in the data folder (e.g., HK.00700, US.BRK.B), as opposed to Stock_Pool, Yahoo_Cache, etc.
+    STOCK_FOLDER_PATTERN = re.compile(r'^[A-Z]{2}\.[A-Z0-9.\-]+$')
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return config.get('Data.Storage', 'Layout1M', fallback='daily') == 'partitioned'
+
+    @staticmethod
+    def get_partition_path(stock_code: str, year: int, month: int, k_type: str = '1M') -> Path:
+        return PATH_DATASET / k_type / f'code={stock_code}' / f'year={year}' / f'month={month}' / 'part-0.parquet'
+
+    @staticmethod
+    def get_partition_paths(stock_code: str, start_date: str, end_date: str, k_type: str = '1M') -> list:
+        """
+            Existing partition files of a stock that overlap [start_date, end_date]. No directory walk is needed.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD)
+        :param k_type: Dataset name (e.g., 1M)
+        """
+        months = pd.period_range(start_date, end_date, freq='M')
+        return [path for path in
+                (DatasetInterface.get_partition_path(stock_code, month.year, month.month, k_type) for month in months)
+                if path.is_file()]
+
+    @staticmethod
+    def get_stock_list(k_type: str = '1M') -> list:
+        dataset_path = PATH_DATASET / k_type
+        if not dataset_path.is_dir():
+            return []
+        return [item.name.replace('code=', '') for item in dataset_path.iterdir() if item.name.startswith('code=')]
+
+    @staticmethod
+    def get_stored_dates(stock_code: str, k_type: str = '1M') -> set:
+        """
+            Dates (YYYY-MM-DD) with at least one bar in the dataset. Only the time_key column is decoded.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param k_type: Dataset name (e.g., 1M)
+        """
+        stock_path = PATH_DATASET / k_type / f'code={stock_code}'
+        if not stock_path.is_dir():
+            return set()
+        output_set = set()
+        for input_path in stock_path.glob('year=*/month=*/part-0.parquet'):
+            time_key = DataProcessingInterface.normalize_kline_table(
+                pq.read_table(input_path, columns=['time_key'], partitioning=None)).column('time_key').to_pandas()
+            output_set.update(time_key.dt.normalize().drop_duplicates().dt.strftime(DATETIME_FORMAT_DW))
+        return output_set
+
+    @staticmethod
+    def write_1M_data(input_df: pd.DataFrame, k_type: str = '1M', autype: str = 'NONE') -> int:
+        """
+            Upsert K-line data into the monthly partitions. Rows with an existing time_key are overwritten.
+            A partition only holds prices of one adjustment type. Unadjusted rows replace a partition stored
+            adjusted by an older version (its other days are then downloaded again), while adjusted rows are never
+            merged into an unadjusted partition.
+        :param input_df: K-line data of a single or multiple stocks in Futu HistoryDataFormat
+        :param k_type: Dataset name (e.g., 1M)
+        :param autype: Adjustment type of the prices in input_df (NONE for unadjusted downloads)
+        :return: Number of partitions written
+        """
+        if input_df.empty:
+            return 0
+        input_df = DataProcessingInterface.normalize_kline_df(input_df)
+        partition_count = 0
+        for (stock_code, year, month), month_df in input_df.groupby(
+                ['code', input_df['time_key'].dt.year, input_df['time_key'].dt.month], sort=False, observed=True):
+            output_path = DatasetInterface.get_partition_path(stock_code, year, month, k_type)
+            month_df = month_df.drop(columns=['code'])
+            if output_path.is_file():
+                stored_table = DataProcessingInterface.read_parquet_files([output_path])[output_path]
+                stored_autype = RehabInterface.get_autype(stored_table)
+                if stored_autype == autype:
+                    month_df = pd.concat([stored_table.to_pandas(), month_df], ignore_index=True)
+                elif autype == 'NONE':
+                    DatasetInterface.default_logger.warning(
+                        f'{output_path}: {stored_autype} rows replaced by {autype} rows. The other days of the month '
+                        f'are downloaded again')
+                else:
+                    DatasetInterface.default_logger.warning(
+                        f'{output_path}: {autype} rows of {stock_code} not merged into {stored_autype} rows')
+                    continue
+            month_df = month_df.drop_duplicates(subset='time_key', keep='last').sort_values(by='time_key')
+            DatasetInterface.write_partition(
+                RehabInterface.set_autype(pa.Table.from_pandas(month_df, preserve_index=False), autype), output_path)
+            partition_count += 1
+        return partition_count
+
+    @staticmethod
+    def write_partition(table: pa.Table, output_path: Path) -> None:
+        # Partition keys are encoded in the directory names
+        if 'code' in table.column_names:
+            table = table.drop(['code'])
+        table = DataProcessingInterface.normalize_kline_table(table)
+        DataProcessingInterface.write_parquet_atomic(table, output_path, row_group_size=DatasetInterface.ROW_GROUP_SIZE,
+                                                     write_statistics=True)
+
+    @staticmethod
+    def read_1M_data(stock_list: list, start_date: str, end_date: str, k_type: str = '1M',
+                     columns: list = None) -> dict:
+        """
+            Get 1M Data from the partitioned dataset. Row groups outside the time range are skipped using their
+            min/max statistics.
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD)
+        :param k_type: Dataset name (e.g., 1M)
+        :param columns: Only decode these columns. Default to all columns
+        :return: Dictionary in Format {'HK.00001': pd.Dataframe, 'HK.00002': pd.Dataframe}
+        """
+        column_names = json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
+        output_columns = columns or column_names
+        output_dict = {stock_code: DataProcessingInterface.get_empty_kline_df(output_columns) for stock_code in
+                       stock_list}
+        paths = [path.as_posix() for stock_code in stock_list for path in
+                 DatasetInterface.get_partition_paths(stock_code, start_date, end_date, k_type)]
+        if not paths:
+            return output_dict
+
+        # Reading with the canonical schema also casts partitions written before the typed schema. Their string
+        # time_key cannot be compared in the scan, so they are filtered after the cast instead.
+        schema = DataProcessingInterface.get_kline_schema(column_names)
+        schema = schema.set(schema.get_field_index('code'), pa.field('code', pa.string()))
+        start_time = datetime.strptime(start_date, DATETIME_FORMAT_DW)
+        end_time = datetime.strptime(end_date, DATETIME_FORMAT_DW) + timedelta(days=1)
+        time_filter = (ds.field('time_key') >= pa.scalar(start_time, pa.timestamp('ns'))) & (
+                ds.field('time_key') < pa.scalar(end_time, pa.timestamp('ns')))
+        # Partitions are grouped by schema generation and adjustment type, which the dataset scan does not keep
+        path_groups = {}
+        for path in paths:
+            path_schema = pq.read_schema(path)
+            is_legacy = path_schema.field('time_key').type != schema.field('time_key').type
+            path_groups.setdefault((is_legacy, (path_schema.metadata or {}).get(RehabInterface.AUTYPE_KEY, b'QFQ')),
+                                   []).append(path)
+        # code and time_key are needed to split, sort and adjust the result
+        read_columns = list(dict.fromkeys(['code', 'time_key', *output_columns]))
+        tables = []
+        for (is_legacy, autype), dataset_paths in path_groups.items():
+            dataset = ds.dataset(dataset_paths, schema=schema, format='parquet',
+                                 partition_base_dir=(PATH_DATASET / k_type).as_posix(),
+                                 partitioning=ds.partitioning(DatasetInterface.PARTITION_SCHEMA, flavor='hive'))
+            table = dataset.to_table().filter(time_filter).select(read_columns) if is_legacy else \
+                dataset.to_table(columns=read_columns, filter=time_filter)
+            table = DataProcessingInterface.normalize_kline_table(table)
+            tables.append(RehabInterface.adjust_table(RehabInterface.set_autype(table, autype)))
+        input_df = pa.concat_tables(tables, promote_options='permissive').to_pandas()
+        for stock_code, stock_df in input_df.groupby('code', sort=False, observed=True):
+            output_dict[stock_code] = stock_df.sort_values(by='time_key')[output_columns].reset_index(drop=True)
+        return output_dict
+
+    @staticmethod
+    def migrate_daily_to_partitioned(stock_list: list = None, remove_source: bool = False) -> None:
+        """
+            Compact the per-day 1M files (data/<code>/<code>_<YYYY-MM-DD>_1M.parquet) into monthly partitions.
+        :param stock_list: A List of Stock Code. Default to all stock folders in the data folder
+        :param remove_source: Delete the per-day files once their month is written
+        """
+        if stock_list is None:
+            stock_list = [item.name for item in PATH_DATA.iterdir() if
+                          item.is_dir() and DatasetInterface.STOCK_FOLDER_PATTERN.match(item.name)]
+        for stock_code in tqdm(stock_list):
+            input_files = sorted((PATH_DATA / stock_code).glob(f'{stock_code}_????-??-??_1M.parquet'))
+            monthly_files = {}
+            for input_file in input_files:
+                monthly_files.setdefault(input_file.name[len(stock_code) + 1:][:7], []).append(input_file)
+            for month_files in monthly_files.values():
+                tables = DataProcessingInterface.read_parquet_files(month_files)
+                autype_tables = {}
+                for input_file in month_files:
+                    autype_tables.setdefault(RehabInterface.get_autype(tables[input_file]), []).append(
+                        tables[input_file])
+                # Files downloaded adjusted by older versions first, so that unadjusted files replace them
+                for autype in sorted(autype_tables, key=lambda item: item == 'NONE'):
+                    month_df = pa.concat_tables(autype_tables[autype], promote_options='permissive').to_pandas()
+                    DatasetInterface.write_1M_data(month_df, autype=autype)
+                if remove_source:
+                    for input_file in month_files:
+                        input_file.unlink()
+                        DataCatalogInterface.unregister(input_file)
+            DatasetInterface.default_logger.info(
+                f'Compacted {len(input_files)} 1M files of {stock_code} into {len(monthly_files)} partitions')
+
+
+class WatermarkInterface:
+    """
+        Persisted per-(stock, k_type) download watermarks: the last date up to which the history of a stock is known
+        to be complete, plus the trading days on which Futu returned no bars (e.g., trading suspension) so that
+        they are not requested again.
+        Format: {'HK.00700': {'1M': {'watermark': '2022-04-13', 'no_data': ['2022-01-04']}, '1D': {...}}}
+    """
+    default_logger = logger.get_logger("watermark")
+    lock = threading.Lock()
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATA / 'Stock_Pool' / 'download_watermarks.json'
+
+    @staticmethod
+    def load() -> dict:
+        try:
+            with open(WatermarkInterface.get_path(), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def get_watermark(stock_code: str, k_type: str):
+        """
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param k_type: 1M / 1D / 1W
+        :return: Watermark Date in String Format (YYYY-MM-DD) or None if the stock has never been downloaded
+        """
+        return WatermarkInterface.load().get(stock_code, {}).get(k_type, {}).get('watermark')
+
+    @staticmethod
+    def get_no_data_dates(stock_code: str, k_type: str) -> set:
+        return set(WatermarkInterface.load().get(stock_code, {}).get(k_type, {}).get('no_data', []))
+
+    @staticmethod
+    def update_watermark(stock_code: str, k_type: str, watermark: str, no_data_dates: list = None) -> None:
+        """
+            Advance the watermark of a stock (never moves backwards) and record trading days without bars.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param k_type: 1M / 1D / 1W
+        :param watermark: Date in String Format (YYYY-MM-DD)
+        :param no_data_dates: Trading days that Futu returned no bars for. Days whose session has not ended yet are
+                              ignored, as their bars may still come
+        """
+        last_closed_day = TradingCalendarInterface.get_last_closed_day()
+        no_data_dates = [no_data_date for no_data_date in no_data_dates or [] if no_data_date <= last_closed_day]
+        with WatermarkInterface.lock:
+            watermarks = WatermarkInterface.load()
+            record = watermarks.setdefault(stock_code, {}).setdefault(k_type, {})
+            record['watermark'] = max(watermark, record.get('watermark', watermark))
+            if no_data_dates:
+                record['no_data'] = sorted(set(record.get('no_data', [])) | set(no_data_dates))
+            WatermarkInterface.save(watermarks)
+
+    @staticmethod
+    def save(watermarks: dict) -> None:
+        output_path = WatermarkInterface.get_path()
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = output_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(watermarks, f, indent=2, sort_keys=True)
+        os.replace(temp_path, output_path)
+
+    @staticmethod
+    def clear_no_data_date(no_data_date: str, k_type: str = '1M') -> list:
+        """
+            Forget a day without bars for every stock, so that it is requested again
+        :return: List of affected stock codes
+        """
+        with WatermarkInterface.lock:
+            watermarks = WatermarkInterface.load()
+            stock_list = [stock_code for stock_code, records in watermarks.items() if
+                          no_data_date in records.get(k_type, {}).get('no_data', [])]
+            if not stock_list:
+                return []
+            for stock_code in stock_list:
+                watermarks[stock_code][k_type]['no_data'].remove(no_data_date)
+            WatermarkInterface.save(watermarks)
+        return stock_list
+
+    @staticmethod
+    def get_stored_dates_1M(stock_code: str) -> set:
+        """
+            Dates (YYYY-MM-DD) with stored 1M data for the configured storage layout
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        """
+        if DatasetInterface.is_enabled():
+            return DatasetInterface.get_stored_dates(stock_code)
+        if DataCatalogInterface.is_available():
+            return set(DataCatalogInterface.get_partitions(stock_code, '1M'))
+        file_pattern = re.compile(rf'^{re.escape(stock_code)}_(\d{{4}}-\d{{2}}-\d{{2}})_1M\.parquet$')
+        return {match.group(1) for match in
+                (file_pattern.match(file_name) for file_name in DataProcessingInterface.list_dir(PATH_DATA / stock_code))
+                if match}
+
+    @staticmethod
+    def find_missing_ranges(trading_days: list, stored_dates: set) -> list:
+        """
+            Compare stored dates against the trading calendar and collapse the holes into contiguous ranges.
+            Two missing days are contiguous if no stored trading day lies between them.
+        :param trading_days: Sorted list of trading days in String Format (YYYY-MM-DD)
+        :param stored_dates: Set of dates that already have data
+        :return: List of (start_date, end_date) tuples
+        """
+        missing_ranges = []
+        previous_missing = False
+        for trading_day in trading_days:
+            if trading_day in stored_dates:
+                previous_missing = False
+                continue
+            if previous_missing:
+                missing_ranges[-1] = (missing_ranges[-1][0], trading_day)
+            else:
+                missing_ranges.append((trading_day, trading_day))
+            previous_missing = True
+        return missing_ranges
+
+    @staticmethod
+    def plan_1M_ranges(stock_code: str, trading_days: list) -> list:
+        """
+            Ranges of 1M data to request for a stock: holes in the stored history plus everything after the last
+            stored trading day. Trading days known to have no bars are skipped.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param trading_days: Sorted list of trading days in String Format (YYYY-MM-DD) within the download window
+        :return: List of (start_date, end_date) tuples
+        """
+        stored_dates = WatermarkInterface.get_stored_dates_1M(stock_code) | WatermarkInterface.get_no_data_dates(
+            stock_code, '1M')
+        return WatermarkInterface.find_missing_ranges(trading_days, stored_dates)
+
+
+class TradingCalendarInterface:
+    """
+        Persisted trading calendars of the HK / US / CN (A-share) markets in data/Stock_Pool/trading_calendar.parquet.
+        One row per trading day with its trade date type (WHOLE, or MORNING / AFTERNOON for half days) and a closed
+        flag for unscheduled closures (e.g., typhoon signal No. 8 / black rainstorm), which the Futu calendar does
+        not contain. The covered date range of each market is kept in the file metadata and only dates outside it
+        are requested, up to today.
+    """
+    default_logger = logger.get_logger("trading_calendar")
+    lock = threading.Lock()
+    COLUMNS = ['market', 'date', 'trade_date_type', 'closed']
+    # Bars of a trading day are final once the closing auction is over
+    CLOSE_TIME = '16:10'
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATA / 'Stock_Pool' / 'trading_calendar.parquet'
+
+    @staticmethod
+    def load() -> tuple:
+        """
+        :return: (DataFrame of all trading days, {'HK': ['2020-04-17', '2022-04-17']} covered date ranges)
+        """
+        try:
+            table = pq.read_table(TradingCalendarInterface.get_path())
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return pd.DataFrame(columns=TradingCalendarInterface.COLUMNS), {}
+        return table.to_pandas(), json.loads((table.schema.metadata or {}).get(b'coverage', b'{}'))
+
+    @staticmethod
+    def save(calendar_df: pd.DataFrame, coverage: dict) -> None:
+        calendar_df = calendar_df.astype({'closed': bool}).sort_values(by=['market', 'date']).reset_index(drop=True)
+        table = pa.Table.from_pandas(calendar_df[TradingCalendarInterface.COLUMNS], preserve_index=False)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'coverage': json.dumps(coverage)})
+        with DataProcessingInterface.atomic_output(TradingCalendarInterface.get_path()) as output_path:
+            pq.write_table(table, output_path)
+
+    @staticmethod
+    def refresh(market: str, start_date: str, end_date: str, request_fn) -> None:
+        """
+            Request the trading days of the parts of [start_date, end_date] (clipped to today) outside the covered
+            range of a market. Stored days, including their closure flags, are never requested again.
+        :param market: HK / US / CN
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD)
+        :param request_fn: Callable (market, start_date, end_date) returning
+                           [{'time': '2022-04-14', 'trade_date_type': 'WHOLE'}, ...], or None if the request failed
+        """
+        end_date = min(end_date, datetime.today().strftime(DATETIME_FORMAT_DW))
+        with TradingCalendarInterface.lock:
+            calendar_df, coverage = TradingCalendarInterface.load()
+            covered = coverage.get(market)
+            if covered is None:
+                request_ranges = [(start_date, end_date)] if start_date <= end_date else []
+            else:
+                request_ranges = []
+                if start_date < covered[0]:
+                    request_ranges.append((start_date, TradingCalendarInterface.shift_date(covered[0], -1)))
+                if end_date > covered[1]:
+                    request_ranges.append((TradingCalendarInterface.shift_date(covered[1], 1), end_date))
+            if not request_ranges:
+                return
+
+            new_dfs = []
+            for range_start, range_end in request_ranges:
+                trading_days = request_fn(market, range_start, range_end)
+                if trading_days is None:
+                    TradingCalendarInterface.default_logger.error(
+                        f'Cannot refresh the {market} trading calendar from {range_start} to {range_end}')
+                    continue
+                new_dfs.append(pd.DataFrame({'market':          market,
+                                             'date':            [item['time'] for item in trading_days],
+                                             'trade_date_type': [str(item['trade_date_type']) for item in trading_days],
+                                             'closed':          False}, columns=TradingCalendarInterface.COLUMNS))
+                covered = [range_start, range_end] if covered is None else [min(covered[0], range_start),
+                                                                           max(covered[1], range_end)]
+            if new_dfs:
+                coverage[market] = covered
+                TradingCalendarInterface.save(pd.concat([calendar_df, *new_dfs], ignore_index=True), coverage)
+                TradingCalendarInterface.default_logger.info(
+                    f'{market} trading calendar refreshed: {request_ranges}, now covers {covered}')
+
+    @staticmethod
+    def get_last_closed_day(now: datetime = None) -> str:
+        """
+            Last date (YYYY-MM-DD) whose session has ended: today after the close, else yesterday
+        """
+        now = now or datetime.now()
+        return (now if now.strftime('%H:%M') >= TradingCalendarInterface.CLOSE_TIME else
+                now - timedelta(days=1)).strftime(DATETIME_FORMAT_DW)
+
+    @staticmethod
+    def shift_date(input_date: str, days: int) -> str:
+        return (datetime.strptime(input_date, DATETIME_FORMAT_DW) + timedelta(days=days)).strftime(DATETIME_FORMAT_DW)
+
+    @staticmethod
+    def get_sessions(market: str, start_date: str, end_date: str, request_fn=None) -> dict:
+        """
+            Open trading sessions of a market (closed days left out). Dates outside the stored calendar fall back to
+            weekdays as whole trading days
+        :param request_fn: Refresh the stored calendar first with this request function (see refresh)
+        :return: {'YYYY-MM-DD': 'WHOLE' / 'MORNING' / 'AFTERNOON'} in date order
+        """
+        if request_fn is not None:
+            TradingCalendarInterface.refresh(market, start_date, end_date, request_fn)
+        calendar_df, coverage = TradingCalendarInterface.load()
+        covered = coverage.get(market, ['', ''])
+        calendar_df = calendar_df[(calendar_df['market'] == market) & (calendar_df['date'] >= start_date) &
+                                  (calendar_df['date'] <= end_date) & ~calendar_df['closed'].astype(bool)]
+        sessions = dict(zip(calendar_df['date'], calendar_df['trade_date_type']))
+
+        weekdays = [weekday for weekday in pd.bdate_range(start_date, end_date).strftime(DATETIME_FORMAT_DW) if
+                    not covered[0] <= weekday <= covered[1]]
+        if weekdays:
+            TradingCalendarInterface.default_logger.warning(
+                f'No {market} trading calendar for {len(weekdays)} weekdays from {weekdays[0]} to {weekdays[-1]}. '
+                f'Assuming whole trading days')
+            sessions.update(dict.fromkeys(weekdays, 'WHOLE'))
+        return dict(sorted(sessions.items()))
+
+    @staticmethod
+    def get_trading_days(market: str, start_date: str, end_date: str, request_fn=None) -> list:
+        """
+            Sorted list of open trading days in String Format (YYYY-MM-DD). See get_sessions
+        """
+        return list(TradingCalendarInterface.get_sessions(market, start_date, end_date, request_fn))
+
+    @staticmethod
+    def mark_closed(market: str, trading_day: str, closed_session: str = 'WHOLE') -> None:
+        """
+            Record an unscheduled closure of a stored trading day
+        :param closed_session: WHOLE for a full-day closure, or the closed half (MORNING / AFTERNOON)
+        """
+        with TradingCalendarInterface.lock:
+            calendar_df, coverage = TradingCalendarInterface.load()
+            row_mask = (calendar_df['market'] == market) & (calendar_df['date'] == trading_day)
+            if not row_mask.any():
+                return
+            if closed_session == 'WHOLE':
+                calendar_df.loc[row_mask, 'closed'] = True
+            else:
+                open_session = 'AFTERNOON' if closed_session == 'MORNING' else 'MORNING'
+                calendar_df.loc[row_mask & (calendar_df['trade_date_type'] == closed_session), 'closed'] = True
+                calendar_df.loc[row_mask & (calendar_df['trade_date_type'] == 'WHOLE'), 'trade_date_type'] = \
+                    open_session
+            TradingCalendarInterface.save(calendar_df, coverage)
+        TradingCalendarInterface.default_logger.info(f'{market} {trading_day}: {closed_session} closure recorded')
+
+    @staticmethod
+    def reopen(market: str, trading_day: str, request_fn=None) -> bool:
+        """
+            Reverse a closure recorded by mark_closed / infer_closures, and forget the day as a day without 1M bars
+            so that its bars are downloaded again
+        :param request_fn: Request the session type of the day again (see refresh). Needed to restore the whole
+                           session of a day with a half-day closure
+        :return: False if the day is not in the stored calendar or the request failed
+        """
+        with TradingCalendarInterface.lock:
+            calendar_df, coverage = TradingCalendarInterface.load()
+            row_mask = (calendar_df['market'] == market) & (calendar_df['date'] == trading_day)
+            if not row_mask.any():
+                return False
+            if request_fn is not None:
+                trading_days = request_fn(market, trading_day, trading_day)
+                if trading_days is None:
+                    TradingCalendarInterface.default_logger.error(f'Cannot request the {market} session of '
+                                                                  f'{trading_day}')
+                    return False
+                sessions = {item['time']: str(item['trade_date_type']) for item in trading_days}
+                if trading_day in sessions:
+                    # A half-day closure replaced the session type with the open half
+                    calendar_df.loc[row_mask, 'trade_date_type'] = sessions[trading_day]
+            calendar_df.loc[row_mask, 'closed'] = False
+            TradingCalendarInterface.save(calendar_df, coverage)
+        WatermarkInterface.clear_no_data_date(trading_day)
+        TradingCalendarInterface.default_logger.info(f'{market} {trading_day}: closure reversed')
+        return True
+
+    @staticmethod
+    def infer_closures(stock_list: list, market: str = 'HK', min_stocks: int = 3) -> list:
+        """
+            Mark trading days on which Futu returned no 1M bars for any stock of the list as closed
+            (the per-stock trading days without bars are recorded by WatermarkInterface). Only days whose session
+            had ended when they were requested are recorded there, and days after the last closed session are
+            never considered. A wrong closure is reversed with reopen.
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param min_stocks: Minimum number of stocks with a 1M watermark needed to tell a closure from a suspension
+        :return: Sorted list of newly closed days
+        """
+        watermarks = WatermarkInterface.load()
+        records = [watermarks[stock_code]['1M'] for stock_code in stock_list if
+                   '1M' in watermarks.get(stock_code, {})]
+        if len(records) < min_stocks:
+            return []
+        last_closed_day = TradingCalendarInterface.get_last_closed_day()
+        closed_days = {closed_day for closed_day in
+                       set.intersection(*(set(record.get('no_data', [])) for record in records)) if
+                       closed_day <= last_closed_day}
+        if not closed_days:
+            return []
+        open_days = set(TradingCalendarInterface.get_trading_days(market, min(closed_days), max(closed_days)))
+        closed_days = sorted(closed_days & open_days)
+        for trading_day in closed_days:
+            TradingCalendarInterface.mark_closed(market, trading_day)
+        return closed_days
+
+
+class RehabInterface:
+    """
+        Adjustment of K-line prices for corporate actions (dividends, splits, rights issues).
+        K-line history is downloaded unadjusted and tagged with futu_algo.autype = NONE in the Parquet footer. The
+        rehab factors of a stock (Futu get_rehab) are kept in data/<code>/<code>_rehab.parquet and applied when the
+        data is loaded, as price * A + B per bar, towards [Data.Storage] AdjustType. A corporate action therefore
+        only requires downloading the factor table again instead of the whole history.
+        Files without the tag were downloaded forward-adjusted by older versions and are returned as they are.
+    """
+    default_logger = logger.get_logger("rehab")
+    lock = threading.Lock()
+    # Composed factors per stock: {stock_code: (mtime_ns, ex_div_date as int64 ns, {adjust_type: (A, B)})}
+    factor_cache = {}
+    AUTYPE_KEY = b'futu_algo.autype'
+    COLUMNS = ['ex_div_date', 'forward_adj_factorA', 'forward_adj_factorB', 'backward_adj_factorA',
+               'backward_adj_factorB']
+    PRICE_COLUMNS = ('open', 'close', 'high', 'low', 'last_close')
+
+    @staticmethod
+    def get_path(stock_code: str) -> Path:
+        return PATH_DATA / stock_code / f'{stock_code}_rehab.parquet'
+
+    @staticmethod
+    def get_adjust_type() -> str:
+        return config.get('Data.Storage', 'AdjustType', fallback='QFQ').strip().upper()
+
+    @staticmethod
+    def get_autype(table: pa.Table) -> str:
+        """
+            Adjustment type of the prices in a table. Untagged K-line files were stored forward-adjusted.
+        """
+        return (table.schema.metadata or {}).get(RehabInterface.AUTYPE_KEY, b'QFQ').decode()
+
+    @staticmethod
+    def set_autype(table: pa.Table, autype: str) -> pa.Table:
+        return table.replace_schema_metadata({**(table.schema.metadata or {}), RehabInterface.AUTYPE_KEY: autype})
+
+    @staticmethod
+    def save_factors(stock_code: str, rehab_df: pd.DataFrame) -> None:
         """
-            Get 5M/15M/Other Customized-Interval Data from CSV based on Stock List. Returned in Dict format
-            Supported Interval: 3M, 5M, 15M, 30M
-            Not-Supported Interval: 60M
-        :param target_date: Date in DateTime Format (YYYY-MM-DD)
-        :param custom_interval: Customized-Interval in unit of "Minutes"
-        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
-        :return: Dictionary in Format {'HK.00001': pd.Dataframe, 'HK.00002': pd.Dataframe}
+            Store the rehab factors of a stock
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param rehab_df: Output of Futu get_rehab (one row per ex-dividend date)
         """
+        rehab_df = rehab_df.reindex(columns=RehabInterface.COLUMNS)
+        rehab_df['ex_div_date'] = pd.to_datetime(rehab_df['ex_div_date'])
+        rehab_df = rehab_df.astype({column: 'float64' for column in RehabInterface.COLUMNS[1:]})
+        rehab_df = rehab_df.dropna(subset=['ex_div_date']).drop_duplicates(subset='ex_div_date', keep='last')
+        table = pa.Table.from_pandas(rehab_df.sort_values(by='ex_div_date'), preserve_index=False)
+        DataProcessingInterface.write_parquet_atomic(table, RehabInterface.get_path(stock_code))
+        with RehabInterface.lock:
+            RehabInterface.factor_cache.pop(stock_code, None)
 
-        input_data = {}
-        target_date = target_date.strftime('%Y-%m-%d')
-        for stock_code in stock_list:
-            input_path = PATH_DATA / stock_code / f'{stock_code}_{target_date}_1M.parquet'
+    @staticmethod
+    def compose_factors(factor_a: np.ndarray, factor_b: np.ndarray, reverse: bool) -> tuple:
+        """
+            Compose the per-event factors into one (A, B) per interval between ex-dividend dates.
+            Interval i holds the bars after the first i events. Forward adjustment applies the events after a bar in
+            chronological order, backward adjustment applies the events before a bar in reverse order.
+        :return: (A, B) arrays of length len(factor_a) + 1
+        """
+        event_count = len(factor_a)
+        output_a, output_b = np.ones(event_count + 1), np.zeros(event_count + 1)
+        if reverse:
+            for index in range(1, event_count + 1):
+                output_a[index] = output_a[index - 1] * factor_a[index - 1]
+                output_b[index] = output_a[index - 1] * factor_b[index - 1] + output_b[index - 1]
+        else:
+            for index in range(event_count - 1, -1, -1):
+                output_a[index] = output_a[index + 1] * factor_a[index]
+                output_b[index] = output_a[index + 1] * factor_b[index] + output_b[index + 1]
+        return output_a, output_b
 
-            if not Path(input_path).is_file():
-                continue
+    @staticmethod
+    def get_factors(stock_code: str):
+        """
+            Ex-dividend dates and composed factors of a stock, cached until its factor file changes
+        :return: (ex_div_date as int64 ns, {'QFQ': (A, B), 'HFQ': (A, B)}) or None if no factors are stored
+        """
+        input_path = RehabInterface.get_path(stock_code)
+        try:
+            mtime_ns = input_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with RehabInterface.lock:
+            cached = RehabInterface.factor_cache.get(stock_code)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1:]
+        rehab_df = pd.read_parquet(input_path)
+        ex_dates = rehab_df['ex_div_date'].to_numpy(dtype='datetime64[ns]').view('int64')
+        factors = {'QFQ': RehabInterface.compose_factors(rehab_df['forward_adj_factorA'].fillna(1).to_numpy(),
+                                                         rehab_df['forward_adj_factorB'].fillna(0).to_numpy(),
+                                                         reverse=False),
+                   'HFQ': RehabInterface.compose_factors(rehab_df['backward_adj_factorA'].fillna(1).to_numpy(),
+                                                         rehab_df['backward_adj_factorB'].fillna(0).to_numpy(),
+                                                         reverse=True)}
+        with RehabInterface.lock:
+            RehabInterface.factor_cache[stock_code] = (mtime_ns, ex_dates, factors)
+        return ex_dates, factors
 
-            input_df = DataProcessingInterface.get_stock_df_from_file(input_path)
-            # Non-Trading Day -> Skip
-            if input_df.empty:
+    @staticmethod
+    def adjust_table(table: pa.Table, stock_code: str = None, adjust_type: str = None) -> pa.Table:
+        """
+            Adjust the prices of an unadjusted K-line table. Tables that are already adjusted, or without time_key,
+            are returned unchanged. Stocks without stored factors are left unadjusted.
+        :param table: K-line data in the canonical schema
+        :param stock_code: Stock of all rows. Default to the code column (multi-stock tables)
+        :param adjust_type: QFQ / HFQ / NONE. Default to [Data.Storage] AdjustType
+        """
+        adjust_type = adjust_type or RehabInterface.get_adjust_type()
+        if adjust_type == 'NONE' or RehabInterface.get_autype(table) != 'NONE' or \
+                'time_key' not in table.column_names:
+            return table
+        price_columns = [column for column in RehabInterface.PRICE_COLUMNS if column in table.column_names]
+        times = table.column('time_key').to_numpy().astype('datetime64[ns]').view('int64')
+        if stock_code is not None:
+            stock_rows = {stock_code: slice(None)}
+        else:
+            codes = table.column('code').cast(pa.string()).to_numpy(zero_copy_only=False)
+            stock_rows = {code: np.flatnonzero(codes == code) for code in pd.unique(codes)}
+
+        output_a, output_b = np.ones(table.num_rows), np.zeros(table.num_rows)
+        for code, rows in stock_rows.items():
+            factors = RehabInterface.get_factors(code)
+            if factors is None:
                 continue
-            # Set Time-key as Index & Convert to Datetime
-            input_df = input_df.set_index('time_key')
-            input_df.index = pd.to_datetime(input_df.index, infer_datetime_format=True)
-            # Define Function List
-            agg_list = {
-                "code":          "first",
-                "open":          "first",
-                "close":         "last",
-                "high":          "max",
-                "low":           "min",
-                "pe_ratio":      "last",
-                "turnover_rate": "sum",
-                "volume":        "sum",
-                "turnover":      "sum",
-            }
-            # Group from 09:31:00 with Freq = 5 Min
-            minute_df = input_df.groupby(
-                pd.Grouper(freq=f'{custom_interval}min', closed='left', offset='1min', origin='start')
-            ).agg(agg_list)[1:]
-            # For 1min -> 5min, need to add Timedelta of 4min
-            minute_df.index = minute_df.index + pd.Timedelta(minutes=int(custom_interval - 1))
-            # Drop Lunch Time
-            minute_df.dropna(inplace=True)
-
-            # Update First Row (Special Cases) e.g. For 1min -> 5min, need to use the first 6min Rows of data
-            minute_df.iloc[0] = \
-                input_df.iloc[:(custom_interval + 1)].groupby('code').agg(agg_list).iloc[0]
-
-            # Update Last Close Price
-            last_index = minute_df.index[0]
-            minute_df['change_rate'] = 0
-            minute_df['last_close'] = input_df['last_close'][0]
-            minute_df.loc[last_index, 'change_rate'] = 100 * (float(minute_df.loc[last_index, 'close']) - float(
-                minute_df.loc[last_index, 'last_close'])) / float(minute_df.loc[last_index, 'last_close'])
-
-            # Change Rate = (Close Price - Last Close Price) / Last Close Price * 100
-            # Last Close = Previous Close Price
-            for index, row in minute_df[1:].iterrows():
-                minute_df.loc[index, 'last_close'] = minute_df.loc[last_index, 'close']
-                minute_df.loc[index, 'change_rate'] = 100 * (
-                        float(row['close']) - float(minute_df.loc[last_index, 'close'])) / float(
-                    minute_df.loc[last_index, 'close'])
-                last_index = index
-
-            minute_df.reset_index(inplace=True)
-            column_names = json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
-            minute_df = minute_df.reindex(columns=column_names)
-
-            # Convert Timestamp type column to standard String format
-            minute_df['time_key'] = minute_df['time_key'].dt.strftime('%Y-%m-%d %H:%M:%S')
-            input_data[stock_code] = input_data.get(stock_code, minute_df)
-        return input_data
+            ex_dates, (factor_a, factor_b) = factors[0], factors[1][adjust_type]
+            # Bars on an ex-dividend date already trade after the event
+            intervals = np.searchsorted(ex_dates, times[rows], side='right')
+            output_a[rows], output_b[rows] = factor_a[intervals], factor_b[intervals]
+
+        for column in price_columns:
+            index = table.schema.get_field_index(column)
+            field = table.schema.field(index)
+            values = table.column(index).to_numpy() * output_a + output_b
+            table = table.set_column(index, field, pa.array(values.astype(field.type.to_pandas_dtype()),
+                                                            from_pandas=True))
+        return RehabInterface.set_autype(table, adjust_type)
+
+
+class LiveJournalInterface:
+    """
+        Write-ahead journal of the live 1M bars received while trading, so that the trading day does not have to be
+        downloaded again through the historical K-line quota the next morning.
+        Every completed bar is appended to an Arrow IPC stream per stock and writer
+        (data/Journal/<YYYY-MM-DD>/<code>/<pid>.<ns>.arrows) and flushed to the OS right away. A stream cut off by a
+        crash keeps every batch before the cut.
+        After the close, compact() moves every complete stock day into the canonical layout and removes the journal.
+    """
+    default_logger = logger.get_logger("live_journal")
+    lock = threading.Lock()
+    # Open writers {(stock_code, trading_day): (sink, RecordBatchStreamWriter)} and last journaled bar per stock
+    writers = {}
+    last_time = {}
 
     @staticmethod
-    def convert_day_interval_to_weekly(input_df: pd.DataFrame):
+    def is_enabled() -> bool:
+        return config.getboolean('Data.Storage', 'LiveJournal', fallback=True)
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATA / 'Journal'
+
+    @staticmethod
+    def get_journal_schema(column_names: list) -> pa.Schema:
+        # Plain strings instead of the canonical dictionary columns, whose dictionaries would differ between batches
+        return pa.schema([pa.field(field.name, pa.string()) if pa.types.is_dictionary(field.type) else field for
+                          field in DataProcessingInterface.get_kline_schema(column_names)])
+
+    @staticmethod
+    def append_bars(stock_code: str, input_df: pd.DataFrame, now: datetime = None) -> int:
         """
-        For Yahoo Finance format, Index(['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits'], dtype='object')
-        Convert from Day-level K-line to Weekly-level K-Line for Stock Filter. Inplace change
-        :param input_df: Dataframe extracted from yFinance lib
+            Journal the completed bars of today that are newer than the last journaled bar of the stock.
+            Futu stamps a 1M bar with its end time, so the bar of the current minute is still forming.
+            Today's bars are the same forward-adjusted or unadjusted, so they are journaled as unadjusted.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param input_df: Latest real-time K-line data of the stock in the canonical schema
+        :param now: Current time. Default to datetime.now()
+        :return: Number of bars written
         """
-        logic = {'open':   'first',
-                 'high':   'max',
-                 'low':    'min',
-                 'close':  'last',
-                 'volume': 'sum'}
-        input_df.columns = [item.lower().strip() for item in input_df]
+        now = pd.Timestamp(now or datetime.now())
+        trading_day = now.strftime(DATETIME_FORMAT_DW)
+        # Earlier days are complete in the historical store already
+        start_time = now.normalize() - pd.Timedelta(1)
+        with LiveJournalInterface.lock:
+            start_time = max(LiveJournalInterface.last_time.get(stock_code, start_time), start_time)
+            output_df = input_df[(input_df['time_key'] > start_time) & (input_df['time_key'] <= now)]
+            if output_df.empty:
+                return 0
+            schema = LiveJournalInterface.get_journal_schema(list(output_df.columns))
+            writer_key = (stock_code, trading_day)
+            if writer_key not in LiveJournalInterface.writers:
+                journal_path = LiveJournalInterface.get_path() / trading_day / stock_code / \
+                               f'{os.getpid()}.{time.time_ns()}.arrows'
+                journal_path.parent.mkdir(parents=True, exist_ok=True)
+                sink = pa.OSFile(journal_path.as_posix(), 'wb')
+                LiveJournalInterface.writers[writer_key] = (sink, pa.ipc.new_stream(sink, schema))
+            sink, writer = LiveJournalInterface.writers[writer_key]
+            writer.write_table(pa.Table.from_pandas(output_df, preserve_index=False).cast(schema))
+            sink.flush()
+            LiveJournalInterface.last_time[stock_code] = output_df['time_key'].max()
+        return output_df.shape[0]
 
-        input_df.index = pd.to_datetime(input_df.index)
-        input_df = input_df.resample('W').apply(logic)
-        input_df.index = input_df.index - pd.tseries.frequencies.to_offset("6D")
+    @staticmethod
+    def close_writers(end_date: str = None) -> None:
+        """
+            Close the open writers of trading days up to end_date (all by default)
+        """
+        with LiveJournalInterface.lock:
+            for writer_key in [writer_key for writer_key in LiveJournalInterface.writers if
+                               end_date is None or writer_key[1] <= end_date]:
+                sink, writer = LiveJournalInterface.writers.pop(writer_key)
+                writer.close()
+                sink.close()
 
     @staticmethod
-    def validate_1M_data(date_range: list, stock_list: list, trading_days: dict):
-        raise NotImplementedError
-        # TODO: Validate data against futu records
+    def read_journal(journal_path: Path):
+        """
+            Batches of a journal up to the first incomplete one
+        :return: pa.Table or None if not even the schema was written
+        """
+        batches, schema = [], None
+        try:
+            with pa.OSFile(journal_path.as_posix(), 'rb') as source:
+                reader = pa.ipc.open_stream(source)
+                schema = reader.schema
+                while True:
+                    batches.append(reader.read_next_batch())
+        except StopIteration:
+            pass
+        except (pa.ArrowInvalid, OSError) as e:
+            LiveJournalInterface.default_logger.warning(f'{journal_path} is cut off after {len(batches)} bars: {e}')
+        return None if schema is None else pa.Table.from_batches(batches, schema)
 
     @staticmethod
-    def save_stock_df_to_file(data: pd.DataFrame, output_path: str, file_type='parquet') -> bool:
+    def compact(end_date: str = None) -> list:
         """
-        Save Data to File (CSV / Feather)
-        :param data: Data to Save
-        :param output_path: File Name to Save
-        :param file_type: File Type to Save (CSV / Feather / Parquet)
-        :return: None
+            Move the journaled trading days up to end_date into the canonical 1M layout. A stock day is stored only
+            if it has every bar of its session, otherwise it is left to the historical download. Journals are
+            removed once processed.
+        :param end_date: Last trading day (YYYY-MM-DD) to compact. Default to the last closed session day
+        :return: List of compacted (stock_code, trading_day)
         """
-        if not data.empty:
-            if file_type == 'csv':
-                data.to_csv(output_path, index=False, encoding='utf-8-sig')
-            elif file_type == 'parquet':
-                try:
-                    data.to_parquet(output_path, index=False)
-                except OverflowError:
-                    print("Error")
+        end_date = end_date or TradingCalendarInterface.get_last_closed_day()
+        LiveJournalInterface.close_writers(end_date)
+        journal_root = LiveJournalInterface.get_path()
+        if not journal_root.is_dir():
+            return []
+        output_list = []
+        for day_path in sorted(item for item in journal_root.iterdir() if item.is_dir() and item.name <= end_date):
+            trading_day = day_path.name
+            session = TradingCalendarInterface.get_sessions('HK', trading_day, trading_day).get(trading_day)
+            expected_offsets = DataProcessingInterface.get_session_offsets(session) if session else None
+            for stock_path in sorted(item for item in day_path.iterdir() if item.is_dir()):
+                stock_code = stock_path.name
+                tables = [table for table in
+                          map(LiveJournalInterface.read_journal, sorted(stock_path.glob('*.arrows'))) if
+                          table is not None]
+                day_df = DataProcessingInterface.normalize_kline_table(
+                    pa.concat_tables(tables, promote_options='permissive')).to_pandas() if tables else pd.DataFrame()
+                if not day_df.empty:
+                    day_df = day_df.drop_duplicates(subset='time_key', keep='last').sort_values(by='time_key')
+                    offsets = (day_df['time_key'] - day_df['time_key'].dt.normalize()).to_numpy().view('int64')
+                if day_df.empty or expected_offsets is None or not np.isin(expected_offsets, offsets).all():
+                    LiveJournalInterface.default_logger.info(
+                        f'Journal of {stock_code} on {trading_day} is incomplete ({day_df.shape[0]} bars). '
+                        f'Left to the historical download')
+                else:
+                    if DatasetInterface.is_enabled():
+                        DatasetInterface.write_1M_data(day_df.reset_index(drop=True), autype='NONE')
+                    else:
+                        output_path = PATH_DATA / stock_code / f'{stock_code}_{trading_day}_1M.parquet'
+                        # A downloaded file of the same day is kept as it is
+                        if not output_path.exists():
+                            table = DataProcessingInterface.normalize_kline_table(
+                                pa.Table.from_pandas(day_df, preserve_index=False))
+                            DataProcessingInterface.write_parquet_atomic(RehabInterface.set_autype(table, 'NONE'),
+                                                                         output_path)
+                    if SQLiteStoreInterface.is_enabled():
+                        SQLiteStoreInterface.upsert_kline(day_df, '1M')
+                    output_list.append((stock_code, trading_day))
+                shutil.rmtree(stock_path, ignore_errors=True)
+            if not any(day_path.iterdir()):
+                day_path.rmdir()
+        LiveJournalInterface.default_logger.info(f'Compacted {len(output_list)} journaled stock day(s)')
+        return output_list
+
+
+class DataCatalogInterface:
+    """
+        SQLite index of the data files under PATH_DATA, so that availability and range queries do not need to walk
+        the directory tree. One row per file with its stock, K-line type, partition (day, year or month), row count,
+        min/max time_key, size and mtime.
+        Enabled by [Data.Storage] Catalog. The catalog is authoritative only once it has been fully built by
+        rebuild(); until then (or while disabled) readers fall back to the file system and writers do not create it.
+        Files added or removed outside this framework are only picked up by rebuild().
+    """
+    default_logger = logger.get_logger("data_catalog")
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS data_file (
+            path       TEXT PRIMARY KEY,
+            stock_code TEXT    NOT NULL,
+            k_type     TEXT    NOT NULL,
+            layout     TEXT    NOT NULL,
+            partition  TEXT    NOT NULL,
+            format     TEXT    NOT NULL,
+            row_count  INTEGER,
+            min_time   TEXT,
+            max_time   TEXT,
+            size       INTEGER NOT NULL,
+            mtime_ns   INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS data_file_range ON data_file (stock_code, k_type, layout, partition);
+        CREATE TABLE IF NOT EXISTS catalog_info (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+    # data/HK.00700/HK.00700_2022-04-13_1M.parquet, data/HK.00700/HK.00700_2022_1D.parquet
+    DAILY_PATTERN = re.compile(r'^(?P<code>.+)_(?P<partition>\d{4}(?:-\d{2}-\d{2})?)_(?P<k_type>\d+[DWM])\.'
+                               r'(?P<format>parquet|csv)$')
+    # data/Dataset/1M/code=HK.00700/year=2022/month=4/part-0.parquet
+    DATASET_PATTERN = re.compile(r'^(?P<k_type>\d+[DWM])/code=(?P<code>[^/]+)/year=(?P<year>\d{4})/'
+                                 r'month=(?P<month>\d{1,2})/part-0\.parquet$')
+    # Catalog files whose schema has been created / that have been fully built by this process
+    initialized_paths = set()
+    built_paths = set()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return config.getboolean('Data.Storage', 'Catalog', fallback=False)
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATA / 'catalog.sqlite'
+
+    @staticmethod
+    def connect() -> sqlite3.Connection:
+        catalog_path = DataCatalogInterface.get_path()
+        # WAL mode is persistent and the schema only has to be created once per catalog file
+        initialize = catalog_path not in DataCatalogInterface.initialized_paths or not catalog_path.is_file()
+        conn = sqlite3.connect(catalog_path, timeout=30)
+        if initialize:
+            conn.execute('PRAGMA journal_mode=WAL')
+            if 'checksum' in [row[1] for row in conn.execute('PRAGMA table_info(data_file)')]:
+                # Catalogs of older versions also stored a CRC32 per file; they are emptied and built again
+                conn.executescript('DROP TABLE data_file; DROP TABLE IF EXISTS catalog_info;')
+            conn.executescript(DataCatalogInterface.SCHEMA)
+            DataCatalogInterface.initialized_paths.add(catalog_path)
+        return conn
+
+    @staticmethod
+    def is_available() -> bool:
+        """
+            Whether the catalog is enabled, exists and has been fully built, i.e., it can answer queries instead of
+            the file system
+        """
+        if not DataCatalogInterface.is_enabled():
+            return False
+        catalog_path = DataCatalogInterface.get_path()
+        if not catalog_path.is_file():
+            DataCatalogInterface.built_paths.discard(catalog_path)
+            return False
+        # A catalog stays built once it has been, so only its existence is checked again
+        if catalog_path in DataCatalogInterface.built_paths:
             return True
-        return False
+        try:
+            with closing(DataCatalogInterface.connect()) as conn:
+                built = conn.execute("SELECT value FROM catalog_info WHERE key = 'built_at'").fetchone() is not None
+        except sqlite3.Error as e:
+            DataCatalogInterface.default_logger.error(f'Data catalog is not readable: {e}')
+            return False
+        if built:
+            DataCatalogInterface.built_paths.add(catalog_path)
+        return built
 
     @staticmethod
-    def get_stock_df_from_file(input_path: Path) -> pd.DataFrame:
+    def parse_path(input_path: Path):
         """
-        Load Data from File (CSV / Feather / Parquet)
-        :param input_path: File Name to Load
-        :return: DataFrame
+            Parse the catalog keys of a data file
+        :param input_path: File path under PATH_DATA
+        :return: (relative path, stock_code, k_type, layout, partition, format) or None if it is not a data file
         """
-        data = pd.DataFrame(columns=json.loads(config.get('FutuOpenD.DataFormat', 'HistoryDataFormat')))
-        if input_path.suffix == '.csv':
-            data = pd.read_csv(input_path, index_col=None, encoding='utf-8-sig')
-        elif input_path.suffix == '.parquet':
-            data = pd.read_parquet(input_path)
-        return data
+        try:
+            relative_path = Path(input_path).relative_to(PATH_DATA)
+        except ValueError:
+            return None
+        if relative_path.parts and relative_path.parts[0] == PATH_DATASET.name:
+            match = DataCatalogInterface.DATASET_PATTERN.match(Path(*relative_path.parts[1:]).as_posix())
+            if match is None:
+                return None
+            return (relative_path.as_posix(), match['code'], match['k_type'], 'dataset',
+                    f"{match['year']}-{int(match['month']):02d}", 'parquet')
+        match = DataCatalogInterface.DAILY_PATTERN.match(relative_path.name)
+        if len(relative_path.parts) != 2 or match is None or match['code'] != relative_path.parts[0]:
+            return None
+        return relative_path.as_posix(), match['code'], match['k_type'], 'daily', match['partition'], match['format']
 
     @staticmethod
-    def check_empty_data(input_path: Path) -> bool:
+    def describe_file(input_path: Path):
         """
-        Check if the input file is empty
-        :param input_path:
-        :return:
+            Catalog row of a data file. Row count and time range come from the Parquet footer, so no data page
+            is read.
         """
-        input_df = DataProcessingInterface.get_stock_df_from_file(input_path)
-        if input_df.empty:
-            input_path.unlink()
-            DataProcessingInterface.default_logger.info(f'{input_path} removed.')
-            return True
-        return False
+        keys = DataCatalogInterface.parse_path(input_path)
+        if keys is None:
+            return None
+        row_count, min_time, max_time = None, None, None
+        if keys[5] == 'parquet':
+            metadata = pq.read_metadata(input_path)
+            row_count = metadata.num_rows
+            min_time, max_time = DataProcessingInterface.get_footer_time_range(metadata)
+        stat = Path(input_path).stat()
+        return (*keys, row_count, min_time, max_time, stat.st_size, stat.st_mtime_ns)
 
     @staticmethod
-    def clear_empty_data():
-        pool = Pool(cpu_count())
-        pool.map(DataProcessingInterface.check_empty_data, PATH_DATA.rglob("*/*_1[DWM].parquet"))
-        pool.close()
-        pool.join()
+    def register(input_path: Path) -> None:
+        """
+            Record a newly written data file. A no-op while the catalog has not been built.
+        """
+        if not DataCatalogInterface.get_path().is_file():
+            return
+        try:
+            row = DataCatalogInterface.describe_file(input_path)
+            if row is None:
+                return
+            with closing(DataCatalogInterface.connect()) as conn, conn:
+                conn.execute('INSERT OR REPLACE INTO data_file VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+        except (OSError, sqlite3.Error, pa.ArrowException) as e:
+            DataCatalogInterface.default_logger.error(f'Cannot register {input_path} in the data catalog: {e}')
+
+    @staticmethod
+    def unregister(input_path: Path) -> None:
+        if not DataCatalogInterface.get_path().is_file():
+            return
+        keys = DataCatalogInterface.parse_path(input_path)
+        if keys is None:
+            return
+        with closing(DataCatalogInterface.connect()) as conn, conn:
+            conn.execute('DELETE FROM data_file WHERE path = ?', (keys[0],))
 
     @staticmethod
-    def convert_csv_to_parquet(input_file: Path) -> bool:
+    def rebuild() -> int:
         """
-        Convert CSV file to Parquet file
-        :param input_file: File to Convert
-        :return: bool
+            Build the catalog from a single walk of the data folder, replacing any existing content
+        :return: Number of files indexed
         """
-        if input_file.suffix == '.csv':
-            output_file = input_file.as_posix().replace('.csv', '.parquet')
-            output_file = Path(output_file)
-            # Temporary
-            output_file.parent.mkdir(parents=True, exist_ok=True)
-            DataProcessingInterface.default_logger.info(f'Converting {input_file} to {output_file}')
-            df = pd.read_csv(input_file, index_col=None)
-            df.to_parquet(output_file, index=False)
-            return True
-        return False
+        input_paths = [input_path for input_path in PATH_DATA.rglob('*') if
+                       input_path.suffix in ('.parquet', '.csv') and input_path.is_file()]
+        with ThreadPoolExecutor(max_workers=DataProcessingInterface.READ_WORKERS) as executor:
+            rows = [row for row in executor.map(DataCatalogInterface.describe_file, input_paths) if row is not None]
+        with closing(DataCatalogInterface.connect()) as conn, conn:
+            conn.execute('DELETE FROM data_file')
+            conn.executemany('INSERT OR REPLACE INTO data_file VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute("INSERT OR REPLACE INTO catalog_info VALUES ('built_at', ?)",
+                         (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+        DataCatalogInterface.built_paths.add(DataCatalogInterface.get_path())
+        DataCatalogInterface.default_logger.info(f'Data catalog rebuilt with {len(rows)} files')
+        return len(rows)
 
     @staticmethod
-    def convert_parquet_to_csv(input_file: Path) -> bool:
+    def ensure_built() -> None:
+        if not DataCatalogInterface.is_available():
+            DataCatalogInterface.rebuild()
+
+    @staticmethod
+    def query(sql: str, parameters: tuple = ()) -> list:
+        with closing(DataCatalogInterface.connect()) as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def get_stock_list() -> list:
+        return [row[0] for row in DataCatalogInterface.query('SELECT DISTINCT stock_code FROM data_file')]
+
+    @staticmethod
+    def get_partitions(stock_code: str, k_type: str, start: str = '0000', end: str = '9999', layout: str = 'daily',
+                       file_format: str = 'parquet') -> list:
         """
-        Convert Parquet file to CSV file
-        :param input_file: File to Convert
-        :return: bool
+            Partitions (dates, years or months) of a stock in [start, end] in ascending order, from an index range scan
         """
-        if input_file.suffix == '.parquet':
-            output_file = input_file.as_posix().replace('.parquet', '.csv')
-            DataProcessingInterface.default_logger.info(f'Converting {input_file} to {output_file}')
-            df = pd.read_parquet(input_file)
-            df.to_csv(output_file, index=False)
-            return True
-        return False
+        return [row[0] for row in DataCatalogInterface.query(
+            'SELECT partition FROM data_file WHERE stock_code = ? AND k_type = ? AND layout = ? AND format = ? '
+            'AND partition BETWEEN ? AND ? ORDER BY partition',
+            (stock_code, k_type, layout, file_format, start, end))]
 
     @staticmethod
-    def convert_all_csv_to_parquet():
-        pool = Pool(cpu_count())
-        pool.map(DataProcessingInterface.convert_csv_to_parquet, PATH_DATA.rglob("*/*_1[DWM].csv"))
-        pool.close()
-        pool.join()
+    def get_files(k_types: tuple, file_format: str = 'parquet', layout: str = 'daily') -> list:
+        placeholders = ', '.join('?' * len(k_types))
+        return [PATH_DATA / row[0] for row in DataCatalogInterface.query(
+            f'SELECT path FROM data_file WHERE format = ? AND layout = ? AND k_type IN ({placeholders})',
+            (file_format, layout, *k_types))]
+
+    @staticmethod
+    def get_latest_mtime(stock_code: str, k_types: tuple = ('1D', '1W', '1M')):
+        """
+            Latest modification time (datetime) of the daily-layout data files of a stock, or None if it has none
+        """
+        placeholders = ', '.join('?' * len(k_types))
+        mtime_ns = DataCatalogInterface.query(
+            f"SELECT MAX(mtime_ns) FROM data_file WHERE stock_code = ? AND layout = 'daily' AND format = 'parquet' "
+            f"AND k_type IN ({placeholders})", (stock_code, *k_types))[0][0]
+        return None if mtime_ns is None else datetime.fromtimestamp(mtime_ns / 1e9)
+
+
+class SQLiteStoreInterface:
+    """
+        Optional SQLite copy of the unadjusted K-line history for tools that want SQL access
+        ([Data.Storage] SQLiteStore = True). The Parquet files stay the primary store; downloaded and journaled bars
+        are upserted here as well.
+        The kline table (util/database_ddl.sql) is a WITHOUT ROWID table clustered on (code, k_type, time_key), so a
+        stock range is one primary key range scan, with a covering index for cross-sectional queries. The database
+        runs in WAL mode, so readers never wait for the writer, and every import is a single executemany upsert
+        inside an explicit transaction.
+    """
+    default_logger = logger.get_logger("sqlite_store")
+    SCHEMA_PATH = PATH / 'util' / 'database_ddl.sql'
+    COLUMNS = ('code', 'k_type', 'time_key', 'open', 'close', 'high', 'low', 'pe_ratio', 'turnover_rate', 'volume',
+               'turnover', 'change_rate', 'last_close')
+    KEY_COLUMNS = COLUMNS[:3]
+    CACHE_SIZE = 1 << 18
+    UPSERT_SQL = (f"INSERT INTO kline ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))}) "
+                  f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET "
+                  f"{', '.join(f'{column} = excluded.{column}' for column in COLUMNS[3:])}")
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return config.getboolean('Data.Storage', 'SQLiteStore', fallback=False)
+
+    @staticmethod
+    def get_path() -> Path:
+        return PATH_DATABASE / 'kline.sqlite'
+
+    @staticmethod
+    def connect() -> sqlite3.Connection:
+        SQLiteStoreInterface.get_path().parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode: writes open their transaction explicitly
+        conn = sqlite3.connect(SQLiteStoreInterface.get_path(), timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # A WAL commit does not fsync the database file. A power loss may lose the last commits, never consistency
+        conn.execute('PRAGMA synchronous=NORMAL')
+        # Keep the B-tree pages touched by a bulk upsert of the universe in memory (KiB)
+        conn.execute(f'PRAGMA cache_size=-{SQLiteStoreInterface.CACHE_SIZE}')
+        conn.executescript(SQLiteStoreInterface.SCHEMA_PATH.read_text())
+        return conn
 
     @staticmethod
-    def get_num_days_to_update(stock_code) -> int:
+    def get_rows(table: pa.Table, k_type: str, stock_code: str = None):
+        """
+            Rows of a K-line table in the column order of the kline table. Missing columns are stored as NULL.
+        :param stock_code: Stock of all rows, for tables without a code column (dataset partitions)
+        """
+        columns = []
+        for column_name in SQLiteStoreInterface.COLUMNS:
+            if column_name == 'k_type':
+                columns.append([k_type] * table.num_rows)
+            elif column_name == 'code' and stock_code is not None:
+                columns.append([stock_code] * table.num_rows)
+            elif column_name not in table.column_names:
+                columns.append([None] * table.num_rows)
+            else:
+                column = table.column(column_name)
+                if column_name == 'time_key' and pa.types.is_timestamp(column.type):
+                    # Arrow formats second timestamps as 'YYYY-MM-DD HH:MM:SS', an order of magnitude faster than
+                    # strftime
+                    column = column.cast(pa.timestamp('s'), safe=False).cast(pa.string())
+                elif pa.types.is_dictionary(column.type):
+                    column = column.cast(column.type.value_type)
+                # Going through numpy is much faster than to_pylist. Nulls become NaN, which SQLite stores as NULL
+                columns.append(column.to_numpy(zero_copy_only=False).tolist())
+        return zip(*columns)
+
+    @staticmethod
+    def __write(rows) -> bool:
         try:
-            return (datetime.now() - datetime.fromtimestamp(
-                Path(max((PATH_DATA / stock_code).glob('*.parquet'), key=os.path.getctime)).stat().st_mtime)).days
-        # Will throw ValueError if the Path is not found
-        except ValueError:
-            return 365 * 2
+            with closing(SQLiteStoreInterface.connect()) as conn:
+                # Take the write lock up front, so that concurrent writers wait on busy_timeout instead of deadlocking
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.executemany(SQLiteStoreInterface.UPSERT_SQL, rows)
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            return True
+        except (OSError, sqlite3.Error) as e:
+            SQLiteStoreInterface.default_logger.error(f'Cannot write K-line data to the SQLite store: {e}')
+            return False
 
     @staticmethod
-    def get_file_to_df(input_file: Path) -> pd.DataFrame:
-        if input_file.suffix == '.parquet':
-            DataProcessingInterface.default_logger.info(f'Loading {input_file}...')
-            return pd.read_parquet(input_file)
-        return pd.DataFrame()
+    def upsert_kline(data, k_type: str) -> int:
+        """
+            Insert or replace unadjusted K-line bars in one transaction
+        :param data: pa.Table or pd.DataFrame with code and time_key (string as sent by Futu, or timestamp)
+        :param k_type: 1M / 1D / 1W
+        :return: Number of rows written
+        """
+        table = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+        if table.num_rows == 0:
+            return 0
+        return table.num_rows if SQLiteStoreInterface.__write(SQLiteStoreInterface.get_rows(table, k_type)) else 0
+
+    @staticmethod
+    def import_files(input_paths: list) -> int:
+        """
+            Upsert stored K-line files in one transaction. Files adjusted by older versions are skipped.
+        :param input_paths: Daily-layout files or dataset partitions under PATH_DATA
+        :return: Number of rows written
+        """
+        keys = {input_path: DataCatalogInterface.parse_path(input_path) for input_path in input_paths}
+        tables = DataProcessingInterface.read_parquet_files([input_path for input_path, key in keys.items() if
+                                                            key is not None and key[5] == 'parquet'])
+        import_tables = []
+        for input_path, table in tables.items():
+            if RehabInterface.get_autype(table) != 'NONE':
+                SQLiteStoreInterface.default_logger.warning(f'Skipped adjusted file {input_path}. Download it again')
+                continue
+            # Dataset partitions encode the stock in their directory name
+            import_tables.append((table, keys[input_path][2], keys[input_path][1]))
+        if not import_tables or not SQLiteStoreInterface.__write(itertools.chain.from_iterable(
+                SQLiteStoreInterface.get_rows(table, k_type, stock_code) for table, k_type, stock_code in
+                import_tables)):
+            return 0
+        return sum(table.num_rows for table, _, _ in import_tables)
+
+    @staticmethod
+    def import_all(stock_list: list = None) -> int:
+        """
+            Import the stored K-line files, one transaction per stock
+        """
+        stock_files = {}
+        for input_path in DataProcessingInterface.get_all_parquet_files():
+            key = DataCatalogInterface.parse_path(input_path)
+            if key is not None and (stock_list is None or key[1] in stock_list):
+                stock_files.setdefault(key[1], []).append(input_path)
+        row_count = sum(SQLiteStoreInterface.import_files(input_paths) for input_paths in
+                        tqdm(stock_files.values(), desc='SQLite Import'))
+        SQLiteStoreInterface.default_logger.info(f'Imported {row_count} K-line rows of {len(stock_files)} stocks')
+        return row_count
+
+    @staticmethod
+    def query(sql: str, parameters: tuple = ()) -> list:
+        with closing(SQLiteStoreInterface.connect()) as conn:
+            return conn.execute(sql, parameters).fetchall()
+
+    @staticmethod
+    def get_stock_list(k_type: str = '1M') -> list:
+        return [row[0] for row in SQLiteStoreInterface.query(
+            'SELECT DISTINCT code FROM kline WHERE k_type = ? ORDER BY code', (k_type,))]
+
+    @staticmethod
+    def get_kline_range(stock_list: list, k_type: str, start_date: str, end_date: str, columns: list = None) -> list:
+        """
+            Unadjusted bars of the stocks in [start_date, end_date] as tuples, ordered by code and time_key
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param k_type: 1M / 1D / 1W
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD), inclusive
+        :param columns: Columns of each tuple. Default to all columns except k_type
+        """
+        columns = columns or [column for column in SQLiteStoreInterface.COLUMNS if column != 'k_type']
+        unknown_columns = set(columns) - set(SQLiteStoreInterface.COLUMNS)
+        if unknown_columns:
+            raise ValueError(f'Unknown K-line columns: {sorted(unknown_columns)}')
+        return SQLiteStoreInterface.query(
+            f"SELECT {', '.join(columns)} FROM kline WHERE code IN ({', '.join('?' * len(stock_list))}) "
+            f"AND k_type = ? AND time_key BETWEEN ? AND ? ORDER BY code, time_key",
+            (*stock_list, k_type, start_date, f'{end_date} 23:59:59'))
+
+    @staticmethod
+    def get_kline_table(stock_list: list, k_type: str, start_date: str, end_date: str, columns: list = None,
+                        adjust_type: str = None) -> pa.Table:
+        """
+            Bars of the stocks in [start_date, end_date] as one Arrow table in the canonical schema, adjusted with the
+            stored rehab factors
+        :param adjust_type: QFQ / HFQ / NONE. Default to [Data.Storage] AdjustType
+        """
+        columns = columns or [column for column in SQLiteStoreInterface.COLUMNS if column != 'k_type']
+        # code and time_key are needed to look up the rehab factors
+        read_columns = [*dict.fromkeys(['code', 'time_key', *columns])]
+        rows = SQLiteStoreInterface.get_kline_range(stock_list, k_type, start_date, end_date, read_columns)
+        values = list(zip(*rows)) if rows else [()] * len(read_columns)
+        table = pa.table({column: pa.array(column_values, SQLiteStoreInterface.get_value_type(column)) for
+                          column, column_values in zip(read_columns, values)})
+        table = DataProcessingInterface.normalize_kline_table(RehabInterface.set_autype(table, 'NONE'))
+        table = RehabInterface.adjust_table(table, adjust_type=adjust_type)
+        return table.select(columns)
+
+    @staticmethod
+    def get_value_type(column_name: str) -> pa.DataType:
+        if column_name == 'volume':
+            return pa.int64()
+        return pa.string() if column_name in SQLiteStoreInterface.KEY_COLUMNS else pa.float64()
+
+
+class TransportInterface:
+    """
+        Record / replay transport shared by the HKEX, Yahoo Finance and TuShare adapters.
+        [Transport] Mode = passthrough / record / replay. Responses are stored in data/Transport_Cache.
+    """
+
+    @staticmethod
+    def get_cache() -> ResponseCache:
+        return ResponseCache(PATH_DATA / 'Transport_Cache', config.get('Transport', 'Mode', fallback='passthrough'))
+
+    @staticmethod
+    def fetch(source: str, request: dict, fetch_fn, ttl: float = None):
+        return TransportInterface.get_cache().fetch(source, request, fetch_fn, ttl=ttl)
 
 
 class TuShareInterface:
+    """
+        A-share daily bars are kept in a local store (data/TuShare/daily.parquet) that is appended with new trade
+        dates only. The bars of the screened stocks are loaded into output_df, sorted by code, with the row range of
+        each stock in offsets for O(1) per-stock access.
+    """
+    default_logger = logger.get_logger("tushare")
     output_df = pd.DataFrame()
-    pro = ts.pro_api(config.get('TuShare.Credential', 'token'))
+    offsets = {}
+    pro = None
+
+    @staticmethod
+    def get_pro():
+        # Created on first use, so that importing the engines needs neither a token nor the network
+        if TuShareInterface.pro is None:
+            TuShareInterface.pro = ts.pro_api(config.get('TuShare.Credential', 'token'))
+        return TuShareInterface.pro
+
+    @staticmethod
+    def query(api_name: str, **kwargs) -> pd.DataFrame:
+        return TransportInterface.fetch('tushare', {'api': api_name, **kwargs},
+                                        lambda: TuShareInterface.get_pro().query(api_name, **kwargs))
 
     @staticmethod
     def __validate_stock_code(stock_list: list) -> list:
@@ -340,35 +2337,81 @@ class TuShareInterface:
         return [YahooFinanceInterface.futu_code_to_yfinance_code(stock_code) if stock_code[:1].isalpha() else stock_code
                 for stock_code in stock_list]
 
+    @staticmethod
+    def get_store_path() -> Path:
+        return PATH_DATA / 'TuShare' / 'daily.parquet'
+
     @staticmethod
     def update_stocks_history(stock_list: list) -> bool:
+        """
+            Append the daily bars of every trade date after the last stored one (at most 1 year back) to the local
+            store, with one whole-market request per trade date. Then load the last year of the given stocks.
+        :param stock_list: Either in Futu Format (e.g., SZ.000001) / TuShare Format (e.g., 000001.SZ)
+        """
+        store_path = TuShareInterface.get_store_path()
+        start_date = (datetime.today() - timedelta(days=365)).strftime("%Y%m%d")
+        end_date = datetime.today().strftime("%Y%m%d")
+        last_date = None
+        if store_path.exists():
+            last_date = pc.max(pq.read_table(store_path, columns=['trade_date'])['trade_date']).as_py()
+        trade_dates = TuShareInterface.query('trade_cal', exchange='SSE', start_date=start_date, end_date=end_date,
+                                             is_open='1')['cal_date']
+        trade_dates = sorted(trade_date for trade_date in trade_dates if last_date is None or trade_date > last_date)
+
+        # Bars of the current trade date are published after the close. The store ends before the first empty
+        # response (not published yet, or throttled), so that trade date and the later ones are fetched next time
+        new_dfs = []
+        for trade_date in tqdm(trade_dates):
+            new_df = TuShareInterface.query('daily', trade_date=trade_date)
+            if new_df.empty:
+                TuShareInterface.default_logger.warning(f'No TuShare daily bars for {trade_date}. Retried next time')
+                break
+            new_dfs.append(new_df)
+        if new_dfs:
+            store_df = pd.concat(([pd.read_parquet(store_path)] if last_date is not None else []) + new_dfs,
+                                 ignore_index=True)
+            store_df = store_df.drop_duplicates(subset=['ts_code', 'trade_date'], keep='last')
+            store_df = store_df.sort_values(by=['ts_code', 'trade_date']).reset_index(drop=True)
+            with DataProcessingInterface.atomic_output(store_path) as output_path:
+                store_df.to_parquet(output_path, index=False)
+            TuShareInterface.default_logger.info(
+                f'TuShare daily store updated with {len(new_dfs)} trade dates ({sum(map(len, new_dfs))} bars)')
+
+        TuShareInterface.load_stocks_history(stock_list, start_date)
+        return True
+
+    @staticmethod
+    def load_stocks_history(stock_list: list, start_date: str) -> None:
+        """
+            Load the stored bars of the given stocks since start_date (YYYYMMDD) and index them by stock
+        """
         stock_list = TuShareInterface.__validate_stock_code(stock_list)
-        # Rate Limit = 6000 data per request
-        interval = int(6000 / 300)
-        stock_lists = [stock_list[i:i + interval] for i in range(0, len(stock_list), interval)]
-        start_date = str((datetime.today() - timedelta(days=round(365 * 1))).date())
-        end_date = str(datetime.today().date().strftime("%Y%m%d"))
-        super_x = [TuShareInterface.output_df]
-        for stock_list in tqdm(stock_lists):
-            super_x.append(
-                TuShareInterface.pro.daily(ts_code=','.join(stock_list), start_date=start_date, end_date=end_date))
-        TuShareInterface.output_df = pd.concat(super_x, ignore_index=True)
-        TuShareInterface.output_df.sort_values(by=['ts_code', 'trade_date'], ascending=[True, True], inplace=True)
-        TuShareInterface.output_df = TuShareInterface.output_df.rename(
+        input_df = pd.DataFrame(columns=['ts_code', 'trade_date'])
+        if TuShareInterface.get_store_path().exists():
+            input_df = pq.read_table(TuShareInterface.get_store_path(), filters=[
+                ('ts_code', 'in', stock_list), ('trade_date', '>=', start_date)]).to_pandas()
+        input_df = input_df.sort_values(by=['ts_code', 'trade_date'], kind='stable').reset_index(drop=True)
+        TuShareInterface.output_df = input_df.rename(
             columns={"ts_code": "code", "trade_date": "time_key", "vol": "volume"})
-        return True
+
+        stock_codes = TuShareInterface.output_df['code'].to_numpy()
+        boundaries = np.flatnonzero(stock_codes[1:] != stock_codes[:-1]) + 1
+        starts, ends = np.r_[0, boundaries], np.r_[boundaries, len(stock_codes)]
+        TuShareInterface.offsets = {} if not len(stock_codes) else dict(
+            zip(stock_codes[starts], zip(starts.tolist(), ends.tolist())))
 
     @staticmethod
     def get_stock_history(stock_code: str) -> pd.DataFrame:
         stock_code = TuShareInterface.__validate_stock_code([stock_code])[0]
-        return TuShareInterface.output_df[TuShareInterface.output_df['code'] == stock_code].reset_index(drop=True)
+        start, end = TuShareInterface.offsets.get(stock_code, (0, 0))
+        return TuShareInterface.output_df.iloc[start:end].reset_index(drop=True)
 
     @staticmethod
     def get_stocks_email(stock_list: list) -> dict:
         stock_list = TuShareInterface.__validate_stock_code(stock_list)
         output_dict = {}
-        input_df = TuShareInterface.pro.stock_basic(ts_code=','.join(stock_list), exchange='', list_status='L',
-                                                    fields='ts_code,symbol,name,area,industry,market,list_date,enname,fullname,curr_type')
+        input_df = TuShareInterface.query('stock_basic', ts_code=','.join(stock_list), exchange='', list_status='L',
+                                          fields='ts_code,symbol,name,area,industry,market,list_date,enname,fullname,curr_type')
         for stock_code in stock_list:
             stock_info = input_df[input_df['ts_code'] == stock_code].reset_index(drop=True)
             stock_price = TuShareInterface.get_stock_history(stock_code).tail(1).reset_index(drop=True)
@@ -386,6 +2429,11 @@ class TuShareInterface:
 
 
 class YahooFinanceInterface:
+    default_logger = logger.get_logger("yahoo_finance")
+    HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
+    PERIOD_OFFSETS = {'d': 'days', 'wk': 'weeks', 'mo': 'months', 'y': 'years'}
+    quote_cache = {}
+
     @staticmethod
     def __validate_stock_code(stock_list: list) -> list:
         """
@@ -399,9 +2447,12 @@ class YahooFinanceInterface:
 
     @staticmethod
     def get_top_30_hsi_constituents() -> list:
-        r = requests.get('https://finance.yahoo.com/quote/%5EHSI/components/', headers={
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'})
-        payload = pd.read_html(r.text)[0]
+        url = 'https://finance.yahoo.com/quote/%5EHSI/components/'
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+        text = TransportInterface.fetch('yahoo', {'url': url}, lambda: requests.get(url, headers=headers).text,
+                                        ttl=3600 * config.getfloat('Transport', 'HSITTL', fallback=24))
+        payload = pd.read_html(io.StringIO(text))[0]
         return [YahooFinanceInterface.yfinance_code_to_futu_code(stock_code) for stock_code in
                 payload['Symbol'].tolist()]
 
@@ -434,41 +2485,79 @@ class YahooFinanceInterface:
         else:
             return '.'.join(reversed((yfinance_code).split('.')))
 
+    @staticmethod
+    def get_ticker_info(stock_code: str) -> dict:
+        return TransportInterface.fetch('yahoo', {'function': 'info', 'symbol': stock_code},
+                                        lambda: yf.Ticker(stock_code).info)
+
+    @staticmethod
+    def get_quote_modules(stock_list: list, modules: list) -> dict:
+        """
+            quoteSummary modules (e.g., price, summaryDetail, assetProfile) of many stocks. Stocks without a result
+            cached within [YahooFinance] QuoteTTL minutes are requested with one concurrent multi-symbol yahooquery
+            call per batch, which fetches all modules of a stock in a single request
+        :param stock_list: Stock codes in Yahoo Finance format (e.g., 0700.HK)
+        :return: {'0700.HK': {'price': {...}, 'summaryDetail': {...}}}. Stocks without data map to {}
+        """
+        ttl = 60 * config.getfloat('YahooFinance', 'QuoteTTL', fallback=15)
+        batch_size = config.getint('YahooFinance', 'BatchSize', fallback=200)
+        modules = sorted(modules)
+        missing_list = [stock_code for stock_code in dict.fromkeys(stock_list) if
+                        time.time() - YahooFinanceInterface.quote_cache.get((stock_code, *modules), (0, None))[0] >= ttl]
+        for index in range(0, len(missing_list), batch_size):
+            batch = missing_list[index:index + batch_size]
+            response = TransportInterface.fetch(
+                'yahoo', {'function': 'quote_summary', 'symbols': batch, 'modules': modules},
+                lambda: yahooquery.Ticker(batch, asynchronous=True).get_modules(modules))
+            for stock_code in batch:
+                # yahooquery returns an error message instead of a dict for symbols without data
+                stock_modules = response.get(stock_code) if isinstance(response, dict) else None
+                YahooFinanceInterface.quote_cache[(stock_code, *modules)] = (
+                    time.time(), stock_modules if isinstance(stock_modules, dict) else {})
+        return {stock_code: YahooFinanceInterface.quote_cache[(stock_code, *modules)][1] for stock_code in stock_list}
+
+    @staticmethod
+    def download(stock_list: list, **kwargs) -> pd.DataFrame:
+        return TransportInterface.fetch('yahoo', {'function': 'download', 'tickers': stock_list, **kwargs},
+                                        lambda: yf.download(stock_list, **kwargs))
+
     @staticmethod
     def get_stocks_info(stock_list: list) -> dict:
         stock_list = YahooFinanceInterface.__validate_stock_code(stock_list)
-        return {stock_code: yf.Ticker(stock_code).info for stock_code in stock_list}
+        return {stock_code: YahooFinanceInterface.get_ticker_info(stock_code) for stock_code in stock_list}
 
     @staticmethod
     def get_stock_info(stock_code: str) -> dict:
         try:
             stock_code = YahooFinanceInterface.__validate_stock_code([stock_code])[0]
-            return yf.Ticker(stock_code).info
+            return YahooFinanceInterface.get_ticker_info(stock_code)
         except:
             return {}
 
     @staticmethod
     def get_stocks_name(stock_list: list) -> dict:
         stock_list = YahooFinanceInterface.__validate_stock_code(stock_list)
-        return {stock_code: yf.Ticker(stock_code).info['longName'] for stock_code in stock_list}
+        return {stock_code: YahooFinanceInterface.get_ticker_info(stock_code)['longName'] for stock_code in stock_list}
 
     @staticmethod
     def get_stocks_email(stock_list: list) -> dict:
         stock_list = YahooFinanceInterface.__validate_stock_code(stock_list)
         output_dict = {}
+        quote_modules = YahooFinanceInterface.get_quote_modules(stock_list, ['price', 'summaryDetail', 'assetProfile'])
         for stock_code in stock_list:
-            # stock_ticker = yf.Ticker(stock_code)
-            stock_ticker = yahooquery.Ticker(stock_code)
+            price = quote_modules[stock_code].get('price', {})
+            summary_detail = quote_modules[stock_code].get('summaryDetail', {})
+            asset_profile = quote_modules[stock_code].get('assetProfile', {})
             output_dict[stock_code] = {
-                'Company Name':         f"{stock_ticker.price[stock_code].get('shortName')} {stock_ticker.price[stock_code].get('longName')}",
-                'Sector':               stock_ticker.asset_profile[stock_code].get('sector', 'N/A'),
-                'Last Close':           f"{stock_ticker.summary_detail[stock_code].get('currency', 'N/A')} {stock_ticker.summary_detail[stock_code].get('previousClose', 0):.3f}",
-                'Open':                 f"{stock_ticker.summary_detail[stock_code].get('currency', 'N/A')} {stock_ticker.price[stock_code].get('regularMarketDayHigh', 0):.3f}",
-                'Close':                f"{stock_ticker.summary_detail[stock_code].get('currency', 'N/A')} {stock_ticker.price[stock_code].get('regularMarketPrice', 0):.3f}",
-                '% Change':             f"{float(stock_ticker.price[stock_code].get('regularMarketChangePercent', 0))*100:.2f}%",
-                'Volume':               f"{stock_ticker.summary_detail[stock_code].get('currency', 'N/A')} {humanize.intword(stock_ticker.summary_detail[stock_code].get('volume', 'N/A'))}",
-                '52 Week Range':        f"{stock_ticker.summary_detail[stock_code].get('currency', 'N/A')} {stock_ticker.summary_detail[stock_code].get('fiftyTwoWeekLow', 'N/A')}-{stock_ticker.summary_detail[stock_code].get('fiftyTwoWeekHigh', 'N/A')}",
-                'PE(Trailing/Forward)': f"{stock_ticker.summary_detail[stock_code].get('trailingPE', 'N/A')} / {stock_ticker.summary_detail[stock_code].get('forwardPE', 'N/A')}",
+                'Company Name':         f"{price.get('shortName')} {price.get('longName')}",
+                'Sector':               asset_profile.get('sector', 'N/A'),
+                'Last Close':           f"{summary_detail.get('currency', 'N/A')} {summary_detail.get('previousClose', 0):.3f}",
+                'Open':                 f"{summary_detail.get('currency', 'N/A')} {price.get('regularMarketDayHigh', 0):.3f}",
+                'Close':                f"{summary_detail.get('currency', 'N/A')} {price.get('regularMarketPrice', 0):.3f}",
+                '% Change':             f"{float(price.get('regularMarketChangePercent', 0))*100:.2f}%",
+                'Volume':               f"{summary_detail.get('currency', 'N/A')} {humanize.intword(summary_detail.get('volume', 'N/A'))}",
+                '52 Week Range':        f"{summary_detail.get('currency', 'N/A')} {summary_detail.get('fiftyTwoWeekLow', 'N/A')}-{summary_detail.get('fiftyTwoWeekHigh', 'N/A')}",
+                'PE(Trailing/Forward)': f"{summary_detail.get('trailingPE', 'N/A')} / {summary_detail.get('forwardPE', 'N/A')}",
             }
 
         return output_dict
@@ -476,13 +2565,190 @@ class YahooFinanceInterface:
     @staticmethod
     def get_stocks_history(stock_list: list) -> pd.DataFrame:
         stock_list = YahooFinanceInterface.__validate_stock_code(stock_list)
-        return yf.download(stock_list, group_by="ticker", auto_adjust=True, actions=True, progress=False)
+        return YahooFinanceInterface.download(stock_list, group_by="ticker", auto_adjust=True, actions=True,
+                                              progress=False)
 
     @staticmethod
     def get_stock_history(stock_code: str, period: str = "1y") -> pd.DataFrame:
+        """
+            Daily bars (auto-adjusted, with actions) of a stock, served from the local history cache.
+            The stock is downloaded only if its cache is missing, expired or does not cover the period.
+        :param stock_code: Either in Futu Format (e.g., HK.00001) / Yahoo Finance Format (e.g., 0001.HK)
+        :param period: yfinance period (e.g., 5d, 6mo, 1y, ytd, max)
+        """
         stock_code = YahooFinanceInterface.__validate_stock_code([stock_code])[0]
-        # return yf.download(stock_code, auto_adjust=True, actions=True, progress=False, period="1y")
-        return yf.Ticker(stock_code).history(period=period)
+        period_start = YahooFinanceInterface.get_period_start(period)
+        if YahooFinanceInterface.get_history_state(stock_code, period_start) != 'fresh':
+            YahooFinanceInterface.prefetch_stocks_history([stock_code], period=period)
+        stock_df = YahooFinanceInterface.read_history_cache(stock_code)
+        if stock_df is None:
+            return pd.DataFrame(columns=YahooFinanceInterface.HISTORY_COLUMNS)
+        return stock_df if period_start is None else stock_df[stock_df.index >= period_start]
+
+    @staticmethod
+    def prefetch_stocks_history(stock_list: list, period: str = "1y", batch_size: int = None) -> int:
+        """
+            Bring the local history cache of all stocks up to date with multi-ticker yf.download requests.
+            Stocks without (enough) cached history are downloaded for the whole period, expired ones only from their
+            last cached bar onwards (the bar is re-fetched as it may have been partial). Fresh ones are skipped.
+            Bars are auto-adjusted, so a new dividend or split changes the whole history: such stocks are downloaded
+            again over their cached period instead of merged.
+        :param stock_list: Either in Futu Format (e.g., HK.00001) / Yahoo Finance Format (e.g., 0001.HK)
+        :param period: yfinance period (e.g., 5d, 6mo, 1y, ytd, max)
+        :param batch_size: Tickers per request. Default [YahooFinance] BatchSize
+        :return: Number of requests sent
+        """
+        batch_size = batch_size or config.getint('YahooFinance', 'BatchSize', fallback=200)
+        period_start = YahooFinanceInterface.get_period_start(period)
+        full_list, last_dates = [], {}
+        for stock_code in dict.fromkeys(YahooFinanceInterface.__validate_stock_code(stock_list)):
+            history_state = YahooFinanceInterface.get_history_state(stock_code, period_start)
+            if history_state is None:
+                full_list.append(stock_code)
+            elif history_state != 'fresh':
+                last_dates[stock_code] = history_state
+
+        num_requests = 0
+        history_start = '' if period_start is None else period_start.strftime(DATETIME_FORMAT_DW)
+        for index in range(0, len(full_list), batch_size):
+            batch = full_list[index:index + batch_size]
+            for stock_code, stock_df in YahooFinanceInterface.download_history(batch, period=period).items():
+                YahooFinanceInterface.update_history_cache(stock_code, stock_df, history_start)
+            num_requests += 1
+        # Expired stocks are grouped by their last cached bar so that each request starts as late as possible
+        incremental_list = sorted(last_dates, key=last_dates.get)
+        rebase_starts = {}
+        for index in range(0, len(incremental_list), batch_size):
+            batch = incremental_list[index:index + batch_size]
+            for stock_code, stock_df in YahooFinanceInterface.download_history(
+                    batch, start=min(last_dates[stock_code] for stock_code in batch)).items():
+                if YahooFinanceInterface.has_new_actions(stock_code, stock_df):
+                    rebase_starts[stock_code] = YahooFinanceInterface.get_history_start(stock_code)
+                else:
+                    YahooFinanceInterface.update_history_cache(stock_code, stock_df)
+            num_requests += 1
+        # Stocks with a new corporate action are grouped by their cached period start
+        rebase_list = sorted(rebase_starts, key=rebase_starts.get)
+        for index in range(0, len(rebase_list), batch_size):
+            batch = rebase_list[index:index + batch_size]
+            history_start = min(rebase_starts[stock_code] for stock_code in batch)
+            for stock_code, stock_df in YahooFinanceInterface.download_history(
+                    batch, **({'start': history_start} if history_start else {'period': 'max'})).items():
+                YahooFinanceInterface.update_history_cache(stock_code, stock_df, history_start, replace=True)
+            num_requests += 1
+        if num_requests:
+            YahooFinanceInterface.default_logger.info(
+                f'History cache updated: {len(full_list)} full / {len(incremental_list)} incremental '
+                f'({len(rebase_list)} downloaded again after a corporate action) stocks in {num_requests} requests')
+        return num_requests
+
+    @staticmethod
+    def download_history(stock_list: list, **kwargs) -> dict:
+        """
+            One multi-ticker yf.download request, split per ticker. Tickers without data are left out.
+        :return: {'0001.HK': DataFrame indexed by Date}
+        """
+        download_df = YahooFinanceInterface.download(stock_list, group_by='ticker', auto_adjust=True, actions=True,
+                                                     progress=False, threads=True, **kwargs)
+        output_dict = {}
+        if download_df is None or download_df.empty:
+            return output_dict
+        for stock_code in stock_list:
+            if stock_code not in download_df.columns.get_level_values(0):
+                continue
+            stock_df = download_df[stock_code].dropna(subset=['Close'])
+            if not stock_df.empty:
+                output_dict[stock_code] = stock_df
+        return output_dict
+
+    @staticmethod
+    def get_period_start(period: str):
+        """
+            First date covered by a yfinance period (e.g., 5d -> 5 days ago, ytd -> 1st January). None for max
+        """
+        today = pd.Timestamp.today().normalize()
+        if period == 'ytd':
+            return today.replace(month=1, day=1)
+        match = re.match(r'^(\d+)(d|wk|mo|y)$', period)
+        if match is None:
+            return None
+        return today - pd.DateOffset(**{YahooFinanceInterface.PERIOD_OFFSETS[match[2]]: int(match[1])})
+
+    @staticmethod
+    def get_history_cache_path(stock_code: str) -> Path:
+        return PATH_DATA / 'Yahoo_Cache' / f'{stock_code}.parquet'
+
+    @staticmethod
+    def get_history_state(stock_code: str, period_start=None):
+        """
+            State of the cached history of a stock, from the file footer only
+        :return: None if the cache is missing or does not cover period_start, 'fresh' if it is younger than
+                 [YahooFinance] HistoryTTL hours, otherwise the date of the last cached bar (YYYY-MM-DD)
+        """
+        input_path = YahooFinanceInterface.get_history_cache_path(stock_code)
+        try:
+            metadata = pq.read_schema(input_path).metadata or {}
+            modified_time = input_path.stat().st_mtime
+        except (OSError, pa.ArrowException):
+            return None
+        history_start = metadata.get(b'history_start', b'').decode()
+        if history_start and (period_start is None or pd.Timestamp(history_start) > period_start):
+            return None
+        if time.time() - modified_time < 3600 * config.getfloat('YahooFinance', 'HistoryTTL', fallback=12):
+            return 'fresh'
+        return metadata[b'last_date'].decode()
+
+    @staticmethod
+    def get_history_start(stock_code: str) -> str:
+        """
+            Start date (YYYY-MM-DD) of the cached history of a stock, '' if it covers the max period
+        """
+        metadata = pq.read_schema(YahooFinanceInterface.get_history_cache_path(stock_code)).metadata or {}
+        return metadata.get(b'history_start', b'').decode()
+
+    @staticmethod
+    def has_new_actions(stock_code: str, stock_df: pd.DataFrame) -> bool:
+        """
+            Whether newly downloaded bars contain a dividend or split that the cached history was not adjusted for
+        """
+        cached_df = YahooFinanceInterface.read_history_cache(stock_code)
+        action_columns = [column for column in ('Dividends', 'Stock Splits') if column in stock_df]
+        if cached_df is None or not action_columns:
+            return False
+        new_actions = stock_df[action_columns].fillna(0)
+        cached_actions = cached_df.reindex(index=new_actions.index, columns=action_columns).fillna(0)
+        return bool((new_actions.ne(0) & new_actions.ne(cached_actions)).any(axis=None))
+
+    @staticmethod
+    def read_history_cache(stock_code: str):
+        try:
+            return pq.read_table(YahooFinanceInterface.get_history_cache_path(stock_code)).to_pandas()
+        except (OSError, pa.ArrowException):
+            return None
+
+    @staticmethod
+    def update_history_cache(stock_code: str, stock_df: pd.DataFrame, history_start: str = None,
+                             replace: bool = False) -> None:
+        """
+            Merge newly downloaded bars into the cached history of a stock (newer bars replace cached ones)
+        :param history_start: Start date of a full download ('' for max), which may extend the covered period
+        :param replace: Replace the cached history instead of merging (a full download on a new adjustment basis)
+        """
+        input_path = YahooFinanceInterface.get_history_cache_path(stock_code)
+        cached_df = None if replace else YahooFinanceInterface.read_history_cache(stock_code)
+        if cached_df is not None:
+            cached_start = pq.read_schema(input_path).metadata.get(b'history_start', b'').decode()
+            history_start = cached_start if history_start is None else min(history_start, cached_start)
+            stock_df = pd.concat([cached_df, stock_df])
+            stock_df = stock_df[~stock_df.index.duplicated(keep='last')].sort_index()
+        stock_df = stock_df[[column for column in YahooFinanceInterface.HISTORY_COLUMNS if column in stock_df]]
+        stock_df.index.name = 'Date'
+
+        table = pa.Table.from_pandas(stock_df)
+        table = table.replace_schema_metadata({**table.schema.metadata, b'history_start': (history_start or ''),
+                                               b'last_date': stock_df.index[-1].strftime(DATETIME_FORMAT_DW)})
+        with DataProcessingInterface.atomic_output(input_path) as output_path:
+            pq.write_table(table, output_path)
 
     @staticmethod
     def parse_stock_info(stock_code: str):
@@ -490,6 +2756,18 @@ class YahooFinanceInterface:
 
 
 class HKEXInterface:
+    """
+        HKEX List of Securities. The spreadsheet is parsed once after each download into a typed Parquet security
+        master (Stock_Pool/ListOfSecurities.parquet). Lookups are served from an in-memory code index that is only
+        reloaded when that file changes on disk.
+    """
+    default_logger = logger.get_logger("hkex")
+    lock = threading.Lock()
+    security_cache = {'key': None, 'df': None, 'index': {}}
+
+    @staticmethod
+    def get_security_list_path(file_format: str = 'parquet') -> Path:
+        return PATH_DATA / 'Stock_Pool' / f'ListOfSecurities.{file_format}'
 
     @staticmethod
     def update_security_list_full() -> None:
@@ -498,25 +2776,113 @@ class HKEXInterface:
             URL: https://www.hkex.com.hk/eng/services/trading/securities/securitieslists/ListOfSecurities.xlsx
         """
         full_stock_list = "https://www.hkex.com.hk/eng/services/trading/securities/securitieslists/ListOfSecurities.xlsx"
-        resp = requests.get(full_stock_list)
-        with open(PATH_DATA / 'Stock_Pool' / 'ListOfSecurities.xlsx', 'wb') as fp:
-            fp.write(resp.content)
+        content = TransportInterface.fetch('hkex', {'url': full_stock_list},
+                                           lambda: requests.get(full_stock_list).content)
+        with open(HKEXInterface.get_security_list_path('xlsx'), 'wb') as fp:
+            fp.write(content)
+        HKEXInterface.convert_security_list(HKEXInterface.get_security_list_path('xlsx'))
+
+    @staticmethod
+    def convert_security_list(input_path: Path) -> pd.DataFrame:
+        """
+            Stream the downloaded spreadsheet (openpyxl read-only mode) into the CSV kept for compatibility and the
+            typed Parquet security master
+        """
+        wb = openpyxl.load_workbook(input_path, read_only=True)
+        try:
+            sh = wb.active
+            # HKEX declares a stale sheet dimension (e.g., A1:V8), which would truncate a read-only scan
+            sh.reset_dimensions()
+            rows = list(sh.iter_rows(values_only=True))
+        finally:
+            wb.close()
+
+        with open(HKEXInterface.get_security_list_path('csv'), 'w', newline="") as f:
+            csv.writer(f).writerows(rows)
+
+        security_df = HKEXInterface.parse_security_rows(rows)
+        with DataProcessingInterface.atomic_output(HKEXInterface.get_security_list_path()) as output_path:
+            security_df.to_parquet(output_path, index=False)
+        HKEXInterface.default_logger.info(f'Security list converted: {len(security_df)} securities')
+        return security_df
+
+    @staticmethod
+    def parse_security_rows(rows) -> pd.DataFrame:
+        """
+            Parse the rows of the List of Securities (title lines, header, records) into a typed DataFrame:
+            5-digit string Stock Code, integer Board Lot, categorical Category and string for all other columns
+        """
+        rows = iter(rows)
+        for header in rows:
+            if header and header[0] == 'Stock Code':
+                break
+        else:
+            raise ValueError('Header row (Stock Code) not found in the List of Securities')
+        positions = [position for position, column_name in enumerate(header) if column_name not in (None, '')]
+        security_df = pd.DataFrame([[row[position] if position < len(row) else None for position in positions]
+                                    for row in rows if row and row[0] not in (None, '')],
+                                   columns=[str(header[position]) for position in positions])
+
+        security_df['Stock Code'] = security_df['Stock Code'].astype(str).str.strip().str.zfill(5)
+        security_df['Board Lot'] = pd.to_numeric(security_df['Board Lot'].astype(str).str.replace(',', ''),
+                                                 errors='coerce').astype('Int64')
+        for column_name in security_df.columns.difference(['Stock Code', 'Board Lot']):
+            security_df[column_name] = security_df[column_name].astype('string')
+        security_df['Category'] = security_df['Category'].astype('category')
+        return security_df
 
-        wb = openpyxl.load_workbook(PATH_DATA / 'Stock_Pool' / 'ListOfSecurities.xlsx')
-        sh = wb.active
-        with open(PATH_DATA / 'Stock_Pool' / 'ListOfSecurities.csv', 'w', newline="") as f:
-            c = csv.writer(f)
-            for r in sh.rows:
-                c.writerow([cell.value for cell in r])
+    @staticmethod
+    def load_security_master() -> dict:
+        """
+            The cached security master: {'df': DataFrame indexed by 5-digit Stock Code,
+            'index': {'HK.00001': ('CKH HOLDINGS', 500, 'Equity')}}. Reloaded only if the Parquet file changed.
+            An existing CSV from before the Parquet security master is converted once.
+        """
+        input_path = HKEXInterface.get_security_list_path()
+        with HKEXInterface.lock:
+            if not input_path.exists():
+                with open(HKEXInterface.get_security_list_path('csv'), 'r', newline="") as f:
+                    security_df = HKEXInterface.parse_security_rows(csv.reader(f))
+                with DataProcessingInterface.atomic_output(input_path) as output_path:
+                    security_df.to_parquet(output_path, index=False)
+
+            stat = input_path.stat()
+            cache_key = (stat.st_size, stat.st_mtime_ns)
+            if HKEXInterface.security_cache['key'] != cache_key:
+                security_df = pd.read_parquet(input_path).set_index('Stock Code')
+                index = dict(zip('HK.' + security_df.index,
+                                 zip(security_df['Name of Securities'].tolist(),
+                                     security_df['Board Lot'].astype(object).where(
+                                         security_df['Board Lot'].notna(), None).tolist(),
+                                     security_df['Category'].astype(str).tolist())))
+                HKEXInterface.security_cache.update({'key': cache_key, 'df': security_df, 'index': index})
+            return HKEXInterface.security_cache
 
     @staticmethod
     def get_security_df_full() -> pd.DataFrame:
-        input_csv = pd.read_csv(PATH_DATA / 'Stock_Pool' / 'ListOfSecurities.csv', index_col=None, skiprows=2,
-                                dtype={'Stock Code': str})
-        input_csv.dropna(subset=['Stock Code'], inplace=True)
-        input_csv.drop(input_csv.columns[-1], axis=1, inplace=True)
-        input_csv.set_index('Stock Code', inplace=True)
-        return input_csv
+        return HKEXInterface.load_security_master()['df']
+
+    @staticmethod
+    def get_security_info(stock_code: str):
+        """
+            O(1) lookup of a security
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :return: (Name of Securities, Board Lot, Category) or None if not listed
+        """
+        return HKEXInterface.load_security_master()['index'].get(stock_code)
+
+    @staticmethod
+    def get_board_lot(stock_code: str, default: int = 0) -> int:
+        """
+            O(1) Board Lot Size (Minimum Trading Unit) of a stock (e.g., HK.00001 -> 500)
+        """
+        security_info = HKEXInterface.get_security_info(stock_code)
+        return default if security_info is None or security_info[1] is None else security_info[1]
+
+    @staticmethod
+    def get_equity_df_full() -> pd.DataFrame:
+        security_df = HKEXInterface.get_security_df_full()
+        return security_df[security_df['Category'] == 'Equity']
 
     @staticmethod
     def get_equity_list_full() -> list:
@@ -524,8 +2890,7 @@ class HKEXInterface:
             Return Full List of Equity in FuTu Stock Code Format E.g. HK.00001
         :return:
         """
-        input_csv = HKEXInterface.get_security_df_full()
-        return [('HK.' + item) for item in input_csv[input_csv['Category'] == 'Equity']['Stock Code'].tolist()]
+        return ('HK.' + HKEXInterface.get_equity_df_full().index).tolist()
 
     @staticmethod
     def get_equity_info_full() -> list:
@@ -533,16 +2898,16 @@ class HKEXInterface:
             Return Full List of Equity dict in Futu Stock Code Format including Basic Info
             E.g., {"Stock Code": HK.00001, "Name of Securities": "CKH HOLDINGS", "Board Lot": 500}
         """
-        input_csv = HKEXInterface.get_security_df_full()
-        return [{"Stock Code": f'HK.{row["Stock Code"]}', "Name of Securities": row["Name of Securities"],
-                 "Board Lot":  row["Board Lot"]} for index, row in
-                input_csv[input_csv['Category'] == 'Equity'].iterrows()]
+        equity_df = HKEXInterface.get_equity_df_full()
+        return pd.DataFrame({"Stock Code":         'HK.' + equity_df.index,
+                             "Name of Securities": equity_df['Name of Securities'].astype(object),
+                             "Board Lot":          equity_df['Board Lot'].astype(object)}).to_dict('records')
 
     @staticmethod
     def get_board_lot_full() -> dict:
         """
             Return Full Dict of the Board Lot Size (Minimum Trading Unit) for each stock E.g. {'HK.00001': 500}
         """
-        input_csv = HKEXInterface.get_security_df_full()
-        return {('HK.' + index): int(row['Board Lot'].replace(',', '')) for index, row in
-                input_csv[input_csv['Category'] == 'Equity'].iterrows()}
+        equity_df = HKEXInterface.get_equity_df_full()
+        equity_df = equity_df[equity_df['Board Lot'].notna()]
+        return dict(zip('HK.' + equity_df.index, equity_df['Board Lot'].astype(int).tolist()))
@@ -106,6 +106,8 @@ class StockFilter:
         """
         filtered_stock_list = []
         if 'HK' in self.full_equity_list[0] or 'US' in self.full_equity_list[0]:
+            # Batch-download (or refresh from the local cache) all histories before the per-stock validation
+            YahooFinanceInterface.prefetch_stocks_history(self.full_equity_list)
             pool = Pool(min(len(self.full_equity_list), cpu_count()))
             filtered_stock_list = pool.map(self.validate_stock, self.full_equity_list)
             pool.close()
@@ -126,6 +128,7 @@ class StockFilter:
            Based on history data extracted from Yahoo Finance
        :return: Filtered Stock Code List in Futu Stock Code Format
        """
+        YahooFinanceInterface.prefetch_stocks_history(self.full_equity_list)
         pool = Pool(cpu_count())
         filtered_stock_list = pool.map(self.validate_stock_individual, self.full_equity_list)
         pool.close()
@@ -0,0 +1,206 @@
+#  Futu Algo: Algorithmic High-Frequency Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2021
+#  Copyright (c)  billpwchan - All Rights Reserved
+
+
+import os
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from engines.data_engine import DataCatalogInterface, DataProcessingInterface, DatasetInterface
+from util import logger
+from util.global_vars import PATH_DATA, PATH_DATASET
+
+
+class StorageBenchmark:
+    """
+        Measure write throughput, read latency and on-disk size of real K-line files under different Parquet
+        settings, with Feather (Arrow IPC) for comparison. Every sample file is written and read back on its own,
+        in a temporary folder inside the data folder, so the numbers reflect the actual per-file layout and disk.
+        All settings are written before any of them is read back, and each file is evicted from the OS page cache
+        before it is read, so the read timings come from the disk (cold_read is False where the OS cannot evict).
+    """
+    default_logger = logger.get_logger("storage_benchmark")
+    PARQUET_SETTINGS = [
+        {'compression': None},
+        {'compression': 'snappy'},
+        {'compression': 'lz4'},
+        {'compression': 'zstd', 'compression_level': 1},
+        {'compression': 'zstd', 'compression_level': 3},
+        {'compression': 'zstd', 'compression_level': 9},
+        {'compression': 'zstd', 'compression_level': 3, 'use_dictionary': False},
+        {'compression': 'zstd', 'compression_level': 3, 'write_statistics': False},
+        {'compression': 'zstd', 'compression_level': 3, 'row_group_size': 2000},
+    ]
+    FEATHER_SETTINGS = [
+        {'compression': 'uncompressed'},
+        {'compression': 'lz4'},
+        {'compression': 'zstd'},
+    ]
+
+    @staticmethod
+    def get_sample_paths(stock_list: list, k_type: str, max_files: int) -> list:
+        """
+            The latest stored files of each stock for a K-line type (per-day files or monthly dataset partitions for
+            1M, depending on [Data.Storage] Layout1M, and yearly files for 1D/1W)
+        """
+        sample_paths = []
+        for stock_code in stock_list:
+            if k_type == '1M' and DatasetInterface.is_enabled():
+                if DataCatalogInterface.is_available():
+                    partitions = DataCatalogInterface.get_partitions(stock_code, k_type, layout='dataset')
+                else:
+                    # .../code=<code>/year=<yyyy>/month=<m>/part-0.parquet
+                    partitions = sorted(f'{path.parent.parent.name[5:]}-{int(path.parent.name[6:]):02d}' for path in
+                                        (PATH_DATASET / k_type / f'code={stock_code}').glob(
+                                            'year=*/month=*/part-0.parquet'))
+                input_paths = [DatasetInterface.get_partition_path(stock_code, int(partition[:4]), int(partition[5:]),
+                                                                   k_type) for partition in partitions]
+            elif DataCatalogInterface.is_available():
+                partitions = DataCatalogInterface.get_partitions(stock_code, k_type)
+                input_paths = [PATH_DATA / stock_code / f'{stock_code}_{partition}_{k_type}.parquet' for partition in
+                               partitions]
+            else:
+                input_paths = sorted((PATH_DATA / stock_code).glob(f'{stock_code}_*_{k_type}.parquet'))
+            sample_paths.extend(input_paths[-max_files:])
+        return sample_paths
+
+    @staticmethod
+    def evict(input_path: Path) -> bool:
+        """
+            Drop a file from the OS page cache, so that the next read comes from the disk
+        :return: False if the OS does not support it (posix_fadvise is not available on Windows and macOS)
+        """
+        if not hasattr(os, 'posix_fadvise'):
+            return False
+        fd = os.open(input_path, os.O_RDONLY)
+        try:
+            # Dirty pages are only dropped once they have been written back
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        return True
+
+    @staticmethod
+    def measure_write(tables: list, file_format: str, write_options: dict, output_dir: Path, repeats: int) -> tuple:
+        """
+            Best-of-N write throughput and on-disk size of a list of tables for one storage setting
+        :return: (written paths, kept for measure_read; dictionary of write statistics)
+        """
+        suffix = 'parquet' if file_format == 'parquet' else 'feather'
+        output_dir.mkdir()
+        output_paths = [output_dir / f'{index}.{suffix}' for index in range(len(tables))]
+        write_seconds = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            for table, output_path in zip(tables, output_paths):
+                if file_format == 'parquet':
+                    pq.write_table(table, output_path, **write_options)
+                else:
+                    feather.write_feather(table, output_path, **write_options)
+            write_seconds.append(time.perf_counter() - start_time)
+
+        memory_bytes = sum(table.nbytes for table in tables)
+        disk_bytes = sum(output_path.stat().st_size for output_path in output_paths)
+        return output_paths, {
+            'disk_mb':           disk_bytes / 2 ** 20,
+            'compression_ratio': memory_bytes / disk_bytes,
+            'write_mb_per_s':    memory_bytes / 2 ** 20 / min(write_seconds),
+        }
+
+    @staticmethod
+    def measure_read(output_paths: list, file_format: str, repeats: int) -> dict:
+        """
+            Best-of-N read latency of the files of one storage setting (all columns, and the close column only).
+            Every file is evicted from the page cache before each read
+        """
+        read_seconds, column_seconds = [], []
+        cold_read = True
+        for _ in range(repeats):
+            for columns, timings in ((None, read_seconds), (['close'], column_seconds)):
+                elapsed = 0
+                for output_path in output_paths:
+                    cold_read &= StorageBenchmark.evict(output_path)
+                    start_time = time.perf_counter()
+                    if file_format == 'parquet':
+                        pq.read_table(output_path, columns=columns, use_threads=False)
+                    else:
+                        feather.read_table(output_path, columns=columns, memory_map=False, use_threads=False)
+                    elapsed += time.perf_counter() - start_time
+                timings.append(elapsed)
+        return {
+            'read_ms':       1000 * min(read_seconds),
+            'read_close_ms': 1000 * min(column_seconds),
+            'cold_read':     cold_read,
+        }
+
+    @staticmethod
+    def run(stock_list: list, k_types: tuple = ('1M', '1D'), max_files: int = 60, repeats: int = 3) -> pd.DataFrame:
+        """
+            Benchmark all settings on the stored data of the given stocks
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param k_types: K-line types to sample
+        :param max_files: Latest N files per stock and K-line type
+        :param repeats: Repetitions per setting. The best timing is reported
+        :return: One row per (k_type, format, setting), sorted by on-disk size
+        """
+        configured_options = DataProcessingInterface.get_parquet_write_options()
+        output_rows = []
+        for k_type in k_types:
+            sample_paths = StorageBenchmark.get_sample_paths(stock_list, k_type, max_files)
+            if not sample_paths:
+                StorageBenchmark.default_logger.warning(f'No {k_type} data of {stock_list} to benchmark')
+                continue
+            tables = list(DataProcessingInterface.read_parquet_files(sample_paths).values())
+            StorageBenchmark.default_logger.info(
+                f'Benchmarking {k_type} storage on {len(tables)} files ({sum(table.num_rows for table in tables)} rows)')
+
+            settings = [('parquet', {**write_options, 'use_dictionary': write_options.get('use_dictionary', True),
+                                     'write_statistics': write_options.get('write_statistics', True)}) for
+                        write_options in StorageBenchmark.PARQUET_SETTINGS] + \
+                       [('feather', write_options) for write_options in StorageBenchmark.FEATHER_SETTINGS]
+            with tempfile.TemporaryDirectory(dir=PATH_DATA) as output_dir:
+                # Write pass over every setting first, then a separate (cold) read pass
+                write_results = [StorageBenchmark.measure_write(tables, file_format, write_options,
+                                                                Path(output_dir) / str(index), repeats)
+                                 for index, (file_format, write_options) in enumerate(settings)]
+                for (file_format, write_options), (output_paths, write_stats) in zip(settings, write_results):
+                    output_rows.append({
+                        'k_type':     k_type,
+                        'format':     file_format,
+                        'setting':    ', '.join(f'{key}={value}' for key, value in write_options.items()),
+                        'configured': file_format == 'parquet' and write_options == configured_options,
+                        **write_stats,
+                        **StorageBenchmark.measure_read(output_paths, file_format, repeats)
+                    })
+        output_df = pd.DataFrame(output_rows)
+        if not output_df.empty:
+            output_df = output_df.sort_values(by=['k_type', 'disk_mb']).reset_index(drop=True)
+        return output_df
+
+    @staticmethod
+    def save_report(output_df: pd.DataFrame, output_dir: Path = Path('./benchmark_report')) -> Path:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output_path = output_dir / f'{datetime.now().strftime("%Y_%m_%d-%I_%M_%S_%p")}_Storage.csv'
+        output_df.to_csv(output_path, index=False)
+        return output_path
@@ -16,11 +16,16 @@
 #  Copyright (c)  billpwchan - All Rights Reserved
 
 
+import base64
 import itertools
 import json
+import os
 import pathlib
 import platform
+import shutil
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from multiprocessing import Pool, cpu_count
 
@@ -34,9 +39,13 @@ from futu import AccumulateFilter, AuType, Currency, KLType, KL_FIELD, Market, M
     SimpleFilter, SortDir, StockField, SubType, TradeDateMarket, TrdEnv, SysConfig
 
 import engines
-from engines import DataProcessingInterface, HKEXInterface, YahooFinanceInterface
+from engines import AsyncWriteInterface, DataProcessingInterface, DatasetInterface, HKEXInterface, \
+    LiveJournalInterface, RehabInterface, SQLiteStoreInterface, TradingCalendarInterface, WatermarkInterface, \
+    YahooFinanceInterface
+from engines.capture_engine import CaptureEngine, OnOrderBookClass, OnTickerClass
 from util import logger
 from util.global_vars import *
+from util.rate_limiter import RateLimiter
 
 
 class FutuTrade:
@@ -69,6 +78,11 @@ class FutuTrade:
                                    SecurityType.IDX, SecurityType.ETF, SecurityType.FUTURE, SecurityType.PLATE,
                                    SecurityType.PLATESET]
         self.reference_type_list = [SecurityReferenceType.WARRANT, SecurityReferenceType.FUTURE]
+        # Historical K-line requests of every connection share one account-wide frequency limit
+        self.history_rate_limiter = RateLimiter(
+            max_requests=self.config.getint('FutuOpenD.History', 'RequestLimit', fallback=60),
+            period=self.config.getfloat('FutuOpenD.History', 'RequestPeriod', fallback=30))
+        self.__history_local = threading.local()
 
     def __del__(self):
         """
@@ -206,6 +220,22 @@ class FutuTrade:
             self.default_logger.error(f'Cannot subscribe to K-Line: {err_message}')
         return ret_sub == RET_OK
 
+    def start_capture(self, stock_list: list) -> CaptureEngine:
+        """
+            Subscribe to the ticker and order book pushes of the stock list and record them with a CaptureEngine.
+            Call stop() on the returned engine to write the remaining buffered pushes.
+        :param stock_list: List of selected stocks ['HK.00009', 'HK.00001']
+        """
+        capture_engine = CaptureEngine()
+        self.quote_ctx.set_handler(OnTickerClass(capture_engine))
+        self.quote_ctx.set_handler(OnOrderBookClass(capture_engine))
+        # Same stock limit as kline_subscribe, which subscribes to the order book already
+        ret_sub, err_message = self.quote_ctx.subscribe(stock_list[:min(len(stock_list), 150)],
+                                                        [SubType.TICKER, SubType.ORDER_BOOK])
+        if ret_sub != RET_OK:
+            self.default_logger.error(f'Cannot subscribe to Ticker / Order Book: {err_message}')
+        return capture_engine
+
     def get_data_realtime(self, stock_list: list, sub_type: SubType = SubType.K_1M, kline_num: int = 1000) -> dict:
         """
         Receive real-time K-Line data as initial technical indicators observations
@@ -219,12 +249,80 @@ class FutuTrade:
         for stock_code in stock_list:
             ret, data = self.quote_ctx.get_cur_kline(stock_code, kline_num, sub_type, AuType.QFQ)
             if ret == RET_OK:
-                input_data[stock_code] = input_data.get(stock_code, data)
+                input_data[stock_code] = input_data.get(stock_code, DataProcessingInterface.normalize_kline_df(data))
             else:
                 self.default_logger.error(f'Cannot get Real-time K-line data: {data}')
         return input_data
 
-    def update_1M_data(self, stock_code: str, years=2, force_update: bool = False, default_days: int = 30):
+    def __request_history_kline(self, stock_code: str, **kwargs):
+        """
+            request_history_kline through the connection of the current download worker (or the default quote
+            connection), paced by the shared rate limiter instead of fixed sleeps
+        """
+        self.history_rate_limiter.acquire()
+        quote_ctx = getattr(self.__history_local, 'quote_ctx', None) or self.quote_ctx
+        return quote_ctx.request_history_kline(stock_code, **kwargs)
+
+    def get_history_kl_quota(self):
+        """
+            Remaining historical K-line quota and the stocks already requested within the last 30 days, which can
+            be downloaded again without consuming quota
+        :return: (remaining quota, set of stock codes) or (None, set()) if the quota cannot be retrieved
+        """
+        ret, data = self.quote_ctx.get_history_kl_quota(get_detail=True)
+        if ret != RET_OK:
+            self.default_logger.error(f'Cannot get Historical K-line Quota: {data}')
+            return None, set()
+        _, remain_quota, detail_list = data
+        return remain_quota, {item['code'] for item in detail_list}
+
+    def update_history_data(self, stock_list: list, update_stock, connections: int = None) -> None:
+        """
+            Run a per-stock download job on a small pool of OpenQuoteContext connections. All connections share the
+            historical K-line rate limiter, so the pool uses the allowed request rate without exceeding it.
+            Stocks that would exceed the remaining historical K-line quota are skipped.
+        :param stock_list: A List of Stock Code with Format (e.g., [HK.00001, HK.00002])
+        :param update_stock: Callable taking a stock code, e.g. lambda stock_code: futu_trade.update_1M_data(...)
+        :param connections: Number of quote connections. Default to [FutuOpenD.History] Connections
+        """
+        connections = connections or self.config.getint('FutuOpenD.History', 'Connections', fallback=4)
+        remain_quota, requested_stocks = self.get_history_kl_quota()
+        if remain_quota is not None:
+            new_stocks = [stock_code for stock_code in stock_list if stock_code not in requested_stocks]
+            if len(new_stocks) > remain_quota:
+                skipped_stocks = set(new_stocks[remain_quota:])
+                self.default_logger.error(f'Historical K-line quota exceeded. Skipped: {sorted(skipped_stocks)}')
+                stock_list = [stock_code for stock_code in stock_list if stock_code not in skipped_stocks]
+
+        quote_ctx_list = []
+        quote_ctx_lock = threading.Lock()
+
+        def worker(stock_code: str):
+            # Each worker thread lazily opens its own quote connection and keeps it for the whole job
+            if getattr(self.__history_local, 'quote_ctx', None) is None:
+                self.__history_local.quote_ctx = OpenQuoteContext(host=self.config['FutuOpenD.Config'].get('Host'),
+                                                                  port=self.config['FutuOpenD.Config'].getint('Port'))
+                with quote_ctx_lock:
+                    quote_ctx_list.append(self.__history_local.quote_ctx)
+            try:
+                update_stock(stock_code)
+            except Exception as e:
+                self.default_logger.error(f'History Download Failed for {stock_code}: {e}')
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, min(connections, len(stock_list)))) as executor:
+                list(executor.map(worker, stock_list))
+        finally:
+            for quote_ctx in quote_ctx_list:
+                quote_ctx.close()
+            # Barrier: every queued file is written when the job returns
+            failed_writes = AsyncWriteInterface.flush()
+            if failed_writes:
+                self.default_logger.error(f'{failed_writes} file(s) could not be written. They are downloaded again '
+                                          f'by the next update')
+
+    def update_1M_data(self, stock_code: str, years=2, force_update: bool = False, default_days: int = 30,
+                       start_date: str = None, end_date: str = None):
         """
             Update 1M Data to ./data/{stock_code} folders for max. 2-years duration
             Assume today is 2022-04-17, the oldest data that can be downloaded is 2020-04-17
@@ -232,96 +330,208 @@ class FutuTrade:
         :param years: 2 years
         :param default_days:
         :param force_update:
+        :param start_date: Explicit range start (YYYY-MM-DD). Overrides years / default_days
+        :param end_date: Explicit range end (YYYY-MM-DD). Default to today
+        :return: List of dates (YYYY-MM-DD) with downloaded bars, or None if the request failed
         """
         column_names = json.loads(self.config.get('FutuOpenD.DataFormat', 'HistoryDataFormat'))
-        history_df = pd.DataFrame(columns=column_names)
         # If force update, update all 2-years 1M data. Otherwise only update the last week's data
-        start_date = str((datetime.today() - timedelta(days=round(365 * years))).date()) if force_update else str(
-            (datetime.today() - timedelta(days=default_days)).date())
-        end_date = str(datetime.today().date())
-        # This will give a list of dates between 2-years range
-        date_range = pd.date_range(start_date, end_date, freq='d').strftime(DATETIME_FORMAT_DW).tolist()
-        # Retrieve the first page
-        ret, data, page_req_key = self.quote_ctx.request_history_kline(stock_code,
-                                                                       start=start_date,
-                                                                       end=end_date,
-                                                                       ktype=KLType.K_1M, autype=AuType.QFQ,
-                                                                       fields=[KL_FIELD.ALL],
-                                                                       max_count=1000, page_req_key=None,
-                                                                       extended_time=False)
-        if ret == RET_OK:
-            history_df = pd.concat([history_df, data], ignore_index=True)
-        else:
-            self.default_logger.error(f'Cannot get Historical 1M K-line data: {data}')
-            return
-
-        # 请求后面的所有结果
-        while page_req_key is not None:
-            # The inner loop is to ensure that whenever there is an error, we can re-try until it success
-            while True:
-                original_page_req_key = page_req_key
-                ret, data, page_req_key = self.quote_ctx.request_history_kline(stock_code,
-                                                                               start=start_date,
-                                                                               end=end_date,
-                                                                               ktype=KLType.K_1M, autype=AuType.QFQ,
-                                                                               fields=[KL_FIELD.ALL],
-                                                                               max_count=1000,
-                                                                               page_req_key=page_req_key,
-                                                                               extended_time=False)
-                if ret == RET_OK:
-                    history_df = pd.concat([history_df, data], ignore_index=True)
-                    break
+        if start_date is None:
+            start_date = str((datetime.today() - timedelta(days=round(365 * years))).date()) if force_update else str(
+                (datetime.today() - timedelta(days=default_days)).date())
+        end_date = end_date or str(datetime.today().date())
+
+        # Pages are collected in a list and concatenated once. Every page is checkpointed together with the next
+        # page_req_key, so an interrupted download resumes from the last page instead of restarting.
+        checkpoint_path = PATH_DATA / stock_code / '.checkpoint_1M'
+        pages, page_req_key = self.__load_1M_checkpoint(checkpoint_path, start_date, end_date)
+        if pages:
+            self.default_logger.info(f'Resuming 1M download of {stock_code} from page {len(pages) + 1}')
+        while not pages or page_req_key is not None:
+            ret, data, next_page_req_key = self.__request_history_kline(stock_code,
+                                                                         start=start_date,
+                                                                         end=end_date,
+                                                                         ktype=KLType.K_1M, autype=AuType.NONE,
+                                                                         fields=[KL_FIELD.ALL],
+                                                                         max_count=1000,
+                                                                         page_req_key=page_req_key,
+                                                                         extended_time=False)
+            if ret != RET_OK:
                 self.default_logger.error(f'Cannot get Historical 1M K-line data: {data}')
-                # Revert to previous page req key and re-try again
-                page_req_key = original_page_req_key
+                if not pages:
+                    return None
+                # Re-try the same page until it succeeds
                 time.sleep(1)
-
-        for input_date in date_range:
+                continue
+            pages.append(data)
+            page_req_key = next_page_req_key
+            self.__save_1M_checkpoint(checkpoint_path, start_date, end_date, pages, page_req_key)
+
+        history_df = pd.concat(pages, ignore_index=True) if pages else pd.DataFrame(columns=column_names)
+        if SQLiteStoreInterface.is_enabled():
+            SQLiteStoreInterface.upsert_kline(history_df, '1M')
+
+        if DatasetInterface.is_enabled():
+            if DatasetInterface.write_1M_data(history_df):
+                self.default_logger.info(f'Saved 1M K-line data of {stock_code} to {PATH_DATASET}')
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
+            return sorted(history_df['time_key'].str[:10].unique())
+
+        # Split into per-day files with a single groupby on the parsed date. Files are written in the background
+        saved_dates = []
+        for input_date, output_df in history_df.groupby(history_df['time_key'].str[:10], sort=True):
             output_path = PATH_DATA / stock_code / f'{stock_code}_{input_date}_1M.parquet'
-            output_df = history_df[history_df['time_key'].str.contains(input_date)]
-            if DataProcessingInterface.save_stock_df_to_file(output_df, output_path):
-                self.default_logger.info(f'Saved 1M K-line data to {output_path}')
-        time.sleep(0.5)
+            if DataProcessingInterface.save_stock_df_async(output_df.reset_index(drop=True), output_path,
+                                                           autype='NONE'):
+                self.default_logger.info(f'Queued 1M K-line data to {output_path}')
+                saved_dates.append(input_date)
+        shutil.rmtree(checkpoint_path, ignore_errors=True)
+        return saved_dates
+
+    @staticmethod
+    def __load_1M_checkpoint(checkpoint_path: pathlib.Path, start_date: str, end_date: str) -> tuple:
+        """
+            Load the downloaded pages and the next page_req_key of an interrupted download of the same range
+        :return: (list of page Dataframes, page_req_key). ([], None) if there is nothing to resume
+        """
+        try:
+            with open(checkpoint_path / 'state.json', 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
+            return [], None
+        if state['start_date'] != start_date or state['end_date'] != end_date or state['page_req_key'] is None:
+            shutil.rmtree(checkpoint_path, ignore_errors=True)
+            return [], None
+        pages = [pd.read_parquet(checkpoint_path / f'page_{index:05d}.parquet') for index in range(state['pages'])]
+        page_req_key = base64.b64decode(state['page_req_key']) if state['page_req_key_type'] == 'bytes' else \
+            state['page_req_key']
+        return pages, page_req_key
+
+    @staticmethod
+    def __save_1M_checkpoint(checkpoint_path: pathlib.Path, start_date: str, end_date: str, pages: list,
+                             page_req_key) -> None:
+        """
+            Persist the newest page and the cursor to continue from. Each page is written once, so checkpointing
+            stays linear in the number of pages.
+        """
+        checkpoint_path.mkdir(parents=True, exist_ok=True)
+        pages[-1].to_parquet(checkpoint_path / f'page_{len(pages) - 1:05d}.parquet', index=False)
+        state = {
+            'start_date':        start_date,
+            'end_date':          end_date,
+            'pages':             len(pages),
+            'page_req_key':      base64.b64encode(page_req_key).decode() if isinstance(page_req_key, bytes) else
+                                 page_req_key,
+            'page_req_key_type': 'bytes' if isinstance(page_req_key, bytes) else 'str'
+        }
+        with open(checkpoint_path / 'state.json.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(checkpoint_path / 'state.json.tmp', checkpoint_path / 'state.json')
+
+    def update_1M_data_gaps(self, stock_code: str, trading_days: list) -> bool:
+        """
+            Download only the missing 1M ranges of a stock (holes against the trading calendar and the tail after
+            the last stored day), then advance its watermark. Sessions that have not ended yet are left out, so that
+            today is neither stored partially nor recorded as a day without bars.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param trading_days: Sorted list of trading days (YYYY-MM-DD) within the 2-years download window
+        :return: True if every missing range was downloaded
+        """
+        last_closed_day = TradingCalendarInterface.get_last_closed_day()
+        trading_days = [trading_day for trading_day in trading_days if trading_day <= last_closed_day]
+        missing_ranges = WatermarkInterface.plan_1M_ranges(stock_code, trading_days)
+        self.default_logger.info(f'{stock_code}: {len(missing_ranges)} missing 1M range(s) {missing_ranges}')
+        for start_date, end_date in missing_ranges:
+            saved_dates = self.update_1M_data(stock_code, start_date=start_date, end_date=end_date)
+            if saved_dates is None:
+                return False
+            # Trading days inside a successful request without any bar (e.g., trading suspension)
+            no_data_dates = [trading_day for trading_day in trading_days if
+                             start_date <= trading_day <= end_date and trading_day not in saved_dates]
+            WatermarkInterface.update_watermark(stock_code, '1M', end_date, no_data_dates)
+        if trading_days:
+            WatermarkInterface.update_watermark(stock_code, '1M', trading_days[-1])
+        return True
 
     def update_DW_data(self, stock_code: str, years=10, force_update: bool = False, k_type: KLType = KLType.K_DAY):
         """
-            Update 1D Data (365 days per file) to ./data/{stock_code} folders for max. 2-years duration
-        :param force_update:
+            Update 1D / 1W Data to ./data/{stock_code} folders, one file per calendar year
+            The whole range is requested once (paged) and split into the yearly files with a single groupby
+        :param force_update: Update 10 years of data
         :param stock_code: Stock Code with Format (e.g., HK.00001)
-        :param years: 10 years
+        :param years: Number of years before the current year to update
         :param k_type: Futu K-Line Type
         """
-        for i in range(0, 11 if force_update else (years + 1)):
-            start_date = date((datetime.today() - timedelta(days=i * 365)).year, 1, 1)
-
-            DataProcessingInterface.validate_dir(PATH_DATA / stock_code)
-
-            if k_type == KLType.K_DAY:
-                output_path = PATH_DATA / stock_code / f'{stock_code}_{start_date.year}_1D.parquet'
-            elif k_type == KLType.K_WEEK:
-                output_path = PATH_DATA / stock_code / f'{stock_code}_{start_date.year}_1W.parquet'
-            else:
-                self.default_logger.error('Unsupported KLType. Please try it later.')
-                return False
-
-            # Request Historical K-line Data (Daily)
-            start_date = start_date.strftime(DATETIME_FORMAT_DW)
-            while True:
-                ret, data, page_req_key = self.quote_ctx.request_history_kline(stock_code, start=start_date,
-                                                                               end=None,
-                                                                               ktype=k_type, autype=AuType.QFQ,
-                                                                               fields=[KL_FIELD.ALL],
-                                                                               max_count=1000, page_req_key=None,
-                                                                               extended_time=False)
-                if ret == RET_OK:
-                    if DataProcessingInterface.save_stock_df_to_file(data, output_path):
-                        self.default_logger.info(f'Saved {k_type} K-line data to {output_path}')
-                    # Probably empty data during a non-trading date
-                    break
-                # Retry Storing Data due to too frequent requests (max. 60 requests per 30 seconds)
-                time.sleep(1)
+        if k_type == KLType.K_DAY:
+            k_type_name = '1D'
+        elif k_type == KLType.K_WEEK:
+            k_type_name = '1W'
+        else:
+            self.default_logger.error('Unsupported KLType. Please try it later.')
+            return False
+        start_date = date((datetime.today() - timedelta(days=(10 if force_update else years) * 365)).year, 1, 1)
+        DataProcessingInterface.validate_dir(PATH_DATA / stock_code)
+
+        # Request Historical K-line Data over the whole range
+        pages, page_req_key = [], None
+        while not pages or page_req_key is not None:
+            ret, data, next_page_req_key = self.__request_history_kline(stock_code,
+                                                                         start=start_date.strftime(DATETIME_FORMAT_DW),
+                                                                         end=None,
+                                                                         ktype=k_type, autype=AuType.NONE,
+                                                                         fields=[KL_FIELD.ALL],
+                                                                         max_count=1000, page_req_key=page_req_key,
+                                                                         extended_time=False)
+            if ret != RET_OK:
+                # Retry the same page due to too frequent requests (max. 60 requests per 30 seconds)
                 self.default_logger.error(f'{k_type} Historical KLine Store Error: {data}')
-            time.sleep(0.6)
+                time.sleep(1)
+                continue
+            pages.append(data)
+            page_req_key = next_page_req_key
+
+        # Probably empty data for years without trading (e.g., before listing)
+        history_df = pd.concat(pages, ignore_index=True)
+        if SQLiteStoreInterface.is_enabled():
+            SQLiteStoreInterface.upsert_kline(history_df, k_type_name)
+        output_dfs = {PATH_DATA / stock_code / f'{stock_code}_{year}_{k_type_name}.parquet': output_df.reset_index(
+            drop=True) for year, output_df in history_df.groupby(history_df['time_key'].str[:4], sort=True)}
+        # The watermark only advances once every yearly file is written
+        AsyncWriteInterface.submit(self.save_DW_data, stock_code, k_type_name, output_dfs,
+                                   datetime.today().strftime(DATETIME_FORMAT_DW))
+        self.default_logger.info(f'Queued {len(output_dfs)} {k_type} K-line file(s) of {stock_code}')
+
+    @staticmethod
+    def save_DW_data(stock_code: str, k_type_name: str, output_dfs: dict, watermark: str) -> None:
+        """
+            Save the yearly 1D / 1W files of a stock and advance its watermark. If a file cannot be saved, the
+            watermark stays where it is and the failure is reported by AsyncWriteInterface.flush()
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        :param k_type_name: 1D / 1W
+        :param output_dfs: {Output Path: K-line data of one year}
+        :param watermark: Date in String Format (YYYY-MM-DD)
+        """
+        for output_path, output_df in output_dfs.items():
+            if not DataProcessingInterface.save_stock_df_to_file(output_df, output_path, autype='NONE'):
+                raise IOError(f'Cannot save {output_path}')
+        WatermarkInterface.update_watermark(stock_code, k_type_name, watermark)
+
+    def update_rehab(self, stock_code: str) -> bool:
+        """
+            Update the rehab (adjustment) factors of a stock, which adjust its unadjusted K-line history when loaded.
+            A corporate action only changes this small table, so the stored history is never downloaded again.
+        :param stock_code: Stock Code with Format (e.g., HK.00001)
+        """
+        # Paced like the historical K-line requests (60 requests per 30 seconds)
+        self.history_rate_limiter.acquire()
+        quote_ctx = getattr(self.__history_local, 'quote_ctx', None) or self.quote_ctx
+        ret, data = quote_ctx.get_rehab(stock_code)
+        if ret != RET_OK:
+            self.default_logger.error(f'Cannot get Rehab factors of {stock_code}: {data}')
+            return False
+        RehabInterface.save_factors(stock_code, data)
+        return True
 
     def update_plate_list(self):
         output_df = pd.DataFrame()
@@ -333,7 +543,7 @@ class FutuTrade:
                 self.default_logger.error(f'Cannot get Plate List: {data}')
             time.sleep(3.5)
         output_path = PATH_DATA / 'Stock_Pool' / 'stock_plate_list.parquet'
-        DataProcessingInterface.save_stock_df_to_file(output_df, output_path)
+        DataProcessingInterface.save_stock_df_async(output_df, output_path)
         self.default_logger.info(f'Stock Owner Plate Updated: {output_path}')
 
     def update_owner_plate(self, stock_list: list):
@@ -352,7 +562,7 @@ class FutuTrade:
                 self.default_logger.error(f'Cannot get Owner Plate: {data}')
             time.sleep(3.5)
         output_path = PATH_DATA / 'Stock_Pool' / 'stock_owner_plate.parquet'
-        DataProcessingInterface.save_stock_df_to_file(output_df, output_path)
+        DataProcessingInterface.save_stock_df_async(output_df, output_path)
         self.default_logger.info(f'Stock Owner Plate Updated: {output_path}')
 
     def update_stock_basicinfo(self):
@@ -367,7 +577,7 @@ class FutuTrade:
             else:
                 self.default_logger.error(f'Cannot get Stock Basic Info of {market} - {stock_type}: {data}')
         output_path = PATH_DATA / 'Stock_Pool' / 'stock_basic_info.parquet'
-        DataProcessingInterface.save_stock_df_to_file(output_df, output_path)
+        DataProcessingInterface.save_stock_df_async(output_df, output_path)
         self.default_logger.info(f'Stock Static Basic Info Updated: {output_path}')
 
     def get_stock_basicinfo(self, market: Market, stock_type: SecurityType):
@@ -407,6 +617,10 @@ class FutuTrade:
         self.__unlock_trade()
 
         input_data = self.get_data_realtime(stock_list, sub_type, 100)
+        if sub_type == SubType.K_1M and LiveJournalInterface.is_enabled():
+            # Completed bars are kept, so the trading day does not need to be downloaded again
+            for stock_code, stock_df in input_data.items():
+                LiveJournalInterface.append_bars(stock_code, stock_df)
         for stock_code in stock_list:
             strategy_map[stock_code].set_input_data_stock_code(stock_code, input_data[stock_code])
             strategy_map[stock_code].parse_data(stock_list=[stock_code])
@@ -426,16 +640,40 @@ class FutuTrade:
         if ret == RET_OK:
             self.default_logger.info(f'Historical K-line Quota: \n{data}')
 
-    def request_trading_days(self, start_date: str, end_date: str) -> dict:
+    def request_trading_days(self, start_date: str, end_date: str, market: str = 'HK'):
         """
         请求交易日，注意该交易日是通过自然日剔除周末和节假日得到，未剔除临时休市数据。
         :param start_date:
         :param end_date:
-        :return: [{'time': '2020-04-01', 'trade_date_type': 'WHOLE'}, ...]
+        :param market: HK / US / CN
+        :return: [{'time': '2020-04-01', 'trade_date_type': 'WHOLE'}, ...], or None if the request failed
         """
-        ret, data = self.quote_ctx.request_trading_days(TradeDateMarket.HK, start=start_date, end=end_date)
+        ret, data = self.quote_ctx.request_trading_days(getattr(TradeDateMarket, market), start=start_date,
+                                                        end=end_date)
         if ret == RET_OK:
             self.default_logger.info(f'Trading Days: {data}')
             return data
         self.default_logger.error(f'error: {data}')
-        return {}
+        return None
+
+    def get_trading_sessions(self, start_date: str, end_date: str, market: str = 'HK') -> dict:
+        """
+            Open trading sessions from the local trading calendar, refreshed first for dates it does not cover yet
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD)
+        :param market: HK / US / CN
+        :return: {'YYYY-MM-DD': 'WHOLE' / 'MORNING' / 'AFTERNOON'} in date order
+        """
+        return TradingCalendarInterface.get_sessions(
+            market, start_date, end_date,
+            request_fn=lambda request_market, range_start, range_end: self.request_trading_days(
+                range_start, range_end, request_market))
+
+    def get_trading_days(self, start_date: str, end_date: str, market: str = 'HK') -> list:
+        """
+            Sorted list of open trading days in String Format (YYYY-MM-DD)
+        :param start_date: Date in String Format (YYYY-MM-DD)
+        :param end_date: Date in String Format (YYYY-MM-DD)
+        :param market: HK / US / CN
+        """
+        return list(self.get_trading_sessions(start_date, end_date, market))
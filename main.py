@@ -243,7 +243,8 @@ class MainWindow(QMainWindow):
                 row_number = self.ui.stockTradingTable.rowCount()
                 self.ui.stockTradingTable.insertRow(row_number)
                 for column_number, column_name in enumerate(headers):
-                    self.ui.stockTradingTable.setItem(row_number, column_number, QTableWidgetItem(stock[column_name]))
+                    self.ui.stockTradingTable.setItem(row_number, column_number,
+                                                      QTableWidgetItem(str(stock[column_name])))
 
         self.ui.stockTradingTable.resizeColumnsToContents()
 
@@ -20,7 +20,7 @@ import argparse
 import importlib
 import json
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import ceil
 
 from futu import KLType, Market, SecurityType, SubType
@@ -58,16 +58,33 @@ def daily_update_data(futu_trade, stock_list: list, force_update: bool = False):
     full_equity_list = HKEXInterface.get_equity_list_full()
     futu_trade.update_owner_plate(stock_list=full_equity_list)
 
-    # Identify the last update date of the data
-    default_days = max([DataProcessingInterface.get_num_days_to_update(stock_code) for stock_code in stock_list])
-
-    # Update historical k-line
-    for stock_code in stock_list:
-        futu_trade.update_DW_data(stock_code, years=ceil(default_days / 365), force_update=force_update,
-                                  k_type=KLType.K_DAY)
-        futu_trade.update_DW_data(stock_code, years=ceil(default_days / 365), force_update=force_update,
-                                  k_type=KLType.K_WEEK)
-        futu_trade.update_1M_data(stock_code, force_update=force_update, default_days=default_days)
+    # Trading days journaled during live trading are stored first, so they are not downloaded again
+    LiveJournalInterface.compact()
+
+    # 1M data is planned per stock against the trading calendar of the 2-years download window
+    end_date = TradingCalendarInterface.get_last_closed_day()
+    trading_days = futu_trade.get_trading_days((datetime.today() - timedelta(days=365 * 2)).strftime(
+        DATETIME_FORMAT_DW), end_date)
+
+    def update_stock(stock_code: str):
+        # History is stored unadjusted. Corporate actions only change the rehab factors applied when loading
+        futu_trade.update_rehab(stock_code)
+        # Identify the last update date of each stock individually
+        for k_type, k_type_name in ((KLType.K_DAY, '1D'), (KLType.K_WEEK, '1W')):
+            default_days = DataProcessingInterface.get_num_days_to_update(stock_code, k_type_name)
+            futu_trade.update_DW_data(stock_code, years=ceil(default_days / 365), force_update=force_update,
+                                      k_type=k_type)
+        if force_update or not trading_days:
+            futu_trade.update_1M_data(stock_code, force_update=force_update,
+                                      default_days=DataProcessingInterface.get_num_days_to_update(stock_code, '1M'))
+        else:
+            futu_trade.update_1M_data_gaps(stock_code, trading_days)
+
+    # Update historical k-line concurrently over multiple quote connections
+    futu_trade.update_history_data(stock_list, update_stock)
+
+    # Trading days without 1M bars for every stock were unscheduled closures (e.g., typhoon signal No. 8)
+    TradingCalendarInterface.infer_closures(stock_list)
 
     # Clean non-trading days data (Obsoleted)
     # DataProcessingInterface.clear_empty_data()
@@ -131,8 +148,14 @@ def init_day_trading(futu_trade: trading_engine.FutuTrade, stock_list: list, str
         # strategy_map = dict object {'HK.00001', MACD_Cross(), 'HK.00002', MACD_Cross()...}
         strategy_map = {stock_code: __init_strategy(strategy_name=stock_strategy_dict.get(stock_code, strategy_name),
                                                     input_data=input_data) for stock_code in stock_list}
-        while True:
-            futu_trade.cur_kline_evaluate(stock_list=stock_list, strategy_map=strategy_map, sub_type=sub_type)
+        capture_engine = futu_trade.start_capture(stock_list) if config.getboolean(
+            'FutuOpenD.Capture', 'Enabled', fallback=False) else None
+        try:
+            while True:
+                futu_trade.cur_kline_evaluate(stock_list=stock_list, strategy_map=strategy_map, sub_type=sub_type)
+        finally:
+            if capture_engine is not None:
+                capture_engine.stop()
     else:
         sys.exit(1)
 
@@ -153,6 +176,32 @@ def main():
     parser.add_argument("-fu", "--force_update",
                         help="Force Update All Data Up to Max. Allowed Years (USE WITH CAUTION)", action="store_true")
 
+    parser.add_argument("--compact_1M", help="Compact Per-Day 1M Files into the Partitioned Monthly Dataset",
+                        action="store_true")
+    parser.add_argument("--remove_daily_1M", help="Remove Per-Day 1M Files after Compaction (Use with --compact_1M)",
+                        action="store_true")
+    parser.add_argument("--compact_journal",
+                        help="Store the Live 1M Bars Journaled during Trading (Execute After Market Closes)",
+                        action="store_true")
+    parser.add_argument("--import_sqlite", help="Import the Stored K-line Files of the Stock List into the SQLite Store",
+                        action="store_true")
+    parser.add_argument("--reopen_day", type=str, nargs="+", metavar="YYYY-MM-DD",
+                        help="Reverse Wrongly Inferred HK Market Closures and Download the 1M Data of these Days Again "
+                             "with the Next Update")
+    parser.add_argument("--rebuild_catalog", help="Rebuild the Data Catalog Index from the Data Folder",
+                        action="store_true")
+    parser.add_argument("--convert_schema", help="Convert Stored K-line Files to the Typed Canonical Schema",
+                        action="store_true")
+    parser.add_argument("--check_data", type=str, nargs="?", const="report", choices=['report', 'remove', 'quarantine'],
+                        help="Scan Parquet Footers for Empty / Truncated / Schema-Drifted Files and Optionally "
+                             "Remove or Quarantine Them")
+    parser.add_argument("--validate_data",
+                        help="Validate the Stored 1M Data of the Stock List against the HK Trading Calendar of the "
+                             "2-Years Download Window (Report Saved as Parquet)", action="store_true")
+    parser.add_argument("--benchmark_storage",
+                        help="Benchmark Parquet Settings and Feather on the Stored 1M/1D Data of the Stock List",
+                        action="store_true")
+
     # Trading Related Arguments
     strategy_list = [file_name.name[:-3] for file_name in PATH_STRATEGIES.rglob("*.py") if
                      "__init__" not in file_name.name and "Strategies" not in file_name.name]
@@ -220,14 +269,56 @@ def main():
         stock_list.extend([stock_code for stock_code in YahooFinanceInterface.get_top_30_hsi_constituents() if
                            stock_code not in stock_list])
 
+    if args.reopen_day:
+        for trading_day in args.reopen_day:
+            TradingCalendarInterface.reopen('HK', trading_day, request_fn=lambda market, start_date, end_date:
+                                            futu_trade.request_trading_days(start_date, end_date, market))
+
     if args.update or args.force_update:
-        # Daily Update Data based on all available time files in the data folder
-        stock_list.extend(
-            [stock_code.name for stock_code in PATH_DATA.iterdir() if
-             stock_code.is_dir() and stock_code.name not in stock_list])
-        if 'Stock_Pool' in stock_list: stock_list.remove('Stock_Pool')
+        # Daily Update Data based on all available time files in the data folder (or the data catalog if enabled)
+        if DataCatalogInterface.is_enabled():
+            DataCatalogInterface.ensure_built()
+            stored_stocks = DataCatalogInterface.get_stock_list()
+        else:
+            stored_stocks = [item.name for item in PATH_DATA.iterdir() if
+                             item.is_dir() and DatasetInterface.STOCK_FOLDER_PATTERN.match(item.name)]
+            stored_stocks.extend(DatasetInterface.get_stock_list())
+        stock_list.extend(stock_code for stock_code in dict.fromkeys(stored_stocks) if stock_code not in stock_list)
         daily_update_data(futu_trade=futu_trade, stock_list=stock_list, force_update=args.force_update)
 
+    if args.rebuild_catalog:
+        DataCatalogInterface.rebuild()
+
+    if args.convert_schema:
+        DataProcessingInterface.convert_all_to_canonical_schema()
+
+    if args.check_data:
+        health_df = DataProcessingInterface.scan_data_health(
+            action=None if args.check_data == 'report' else args.check_data)
+        print(health_df[health_df['status'] != 'ok'].to_string(index=False))
+
+    if args.validate_data:
+        trading_days = futu_trade.get_trading_sessions(
+            (datetime.today() - timedelta(days=365 * 2)).strftime(DATETIME_FORMAT_DW),
+            datetime.today().strftime(DATETIME_FORMAT_DW))
+        validation_df = DataProcessingInterface.validate_1M_data(sorted(trading_days), stock_list, trading_days)
+        print(validation_df.groupby(['code', 'check'], observed=True)['count'].sum().to_string())
+        print(f'1M validation report saved: {DataProcessingInterface.save_validation_report(validation_df)}')
+
+    if args.benchmark_storage:
+        benchmark_df = StorageBenchmark.run(stock_list)
+        print(benchmark_df.to_string(index=False))
+        print(f'Storage benchmark saved: {StorageBenchmark.save_report(benchmark_df)}')
+
+    if args.compact_journal:
+        LiveJournalInterface.compact()
+
+    if args.import_sqlite:
+        SQLiteStoreInterface.import_all(stock_list or None)
+
+    if args.compact_1M:
+        DatasetInterface.migrate_daily_to_partitioned(remove_source=args.remove_daily_1M)
+
     if args.strategy:
         # Stock Basket => 4 Parts
         # 1. Currently Holding Stocks (i.e., in the trading account with existing position)
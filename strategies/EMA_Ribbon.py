@@ -38,6 +38,7 @@ class EMARibbon(Strategies):
     def parse_data(self, stock_list: list = None, latest_data: pd.DataFrame = None, backtesting: bool = False):
         # Received New Data => Parse it Now to input_data
         if latest_data is not None:
+            latest_data = self.normalize_latest_data(latest_data)
             # Only need to update MACD for the stock_code with new data
             stock_list = [latest_data['code'][0]]
 
@@ -61,8 +62,6 @@ class EMARibbon(Strategies):
             if not backtesting:
                 self.input_data[stock_code] = self.input_data[stock_code].iloc[
                                               -min(self.OBSERVATION, self.input_data[stock_code].shape[0]):]
-            self.input_data[stock_code][['open', 'close', 'high', 'low']] = self.input_data[stock_code][
-                ['open', 'close', 'high', 'low']].apply(pd.to_numeric)
 
             self.input_data[stock_code]['EMA_fast'] = self.input_data[stock_code]['close'].ewm(span=self.EMA_FAST,
                                                                                                adjust=False).mean()
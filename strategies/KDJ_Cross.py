@@ -50,6 +50,7 @@ class KDJCross(Strategies):
     def parse_data(self, stock_list: list = None, latest_data: pd.DataFrame = None, backtesting: bool = False):
         # Received New Data => Parse it Now to input_data
         if latest_data is not None:
+            latest_data = self.normalize_latest_data(latest_data)
             # Only need to update MACD for the stock_code with new data
             stock_list = [latest_data['code'][0]]
 
@@ -73,8 +74,6 @@ class KDJCross(Strategies):
             if not backtesting:
                 self.input_data[stock_code] = self.input_data[stock_code].iloc[
                                               -min(self.OBSERVATION, self.input_data[stock_code].shape[0]):]
-            self.input_data[stock_code][['open', 'close', 'high', 'low']] = self.input_data[stock_code][
-                ['open', 'close', 'high', 'low']].apply(pd.to_numeric)
 
             low = self.input_data[stock_code]['low'].rolling(self.FAST_K, min_periods=self.FAST_K).min()
             low.fillna(value=self.input_data[stock_code]['low'].expanding().min(), inplace=True)
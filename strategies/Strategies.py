@@ -22,6 +22,10 @@ import pandas as pd
 
 
 class Strategies(ABC):
+    # K-line columns cast to numbers when new bars are received
+    NUMERIC_COLUMNS = ('open', 'close', 'high', 'low', 'pe_ratio', 'turnover_rate', 'volume', 'turnover',
+                       'change_rate', 'last_close')
+
     def __init__(self, input_data: dict):
         self.input_data = input_data
         super().__init__()
@@ -46,6 +50,24 @@ class Strategies(ABC):
     def sell(self, stock_code) -> bool:
         pass
 
+    @staticmethod
+    def normalize_latest_data(latest_data: pd.DataFrame) -> pd.DataFrame:
+        """
+            Cast newly received bars to numbers and time_key to datetime64 (the canonical K-line schema).
+            Typed bars are returned as they are; object-dtype rows (e.g., row.to_frame().transpose()) are converted.
+        :param latest_data: New bars of a single stock
+        """
+        object_columns = [column for column in latest_data.columns if latest_data[column].dtype == object]
+        if not object_columns:
+            return latest_data
+        latest_data = latest_data.copy()
+        for column in object_columns:
+            if column in Strategies.NUMERIC_COLUMNS:
+                latest_data[column] = pd.to_numeric(latest_data[column])
+            elif column == 'time_key':
+                latest_data[column] = pd.to_datetime(latest_data[column])
+        return latest_data
+
     def get_current_and_previous_record(self, stock_code: str) -> tuple:
         return self.input_data[stock_code].iloc[-2], self.input_data[stock_code].iloc[-3]
 
@@ -0,0 +1,124 @@
+#  Futu Algo: Algorithmic Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2022
+#  Copyright (c)  billpwchan - All Rights Reserved
+import datetime
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pyarrow.parquet as pq
+from futu import RET_OK
+
+from engines import CaptureEngine
+from engines.capture_engine import OnOrderBookClass, OnTickerClass
+
+
+class TestCaptureEngine(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.temp_dir.name)
+        # Flushes are triggered explicitly
+        self.capture_engine = CaptureEngine(self.output_dir, flush_interval=3600, flush_rows=10 ** 9)
+        self.addCleanup(self.temp_dir.cleanup)
+        self.addCleanup(self.capture_engine.stop)
+
+    @staticmethod
+    def get_tickers(stock_code: str, count: int, start_sequence: int = 0) -> list:
+        return [{'code': stock_code, 'name': 'N/A', 'time': f'2022-04-13 09:30:{index % 60:02d}.{index:03d}',
+                 'price': 353.2 + index * 0.2, 'volume': 100 * (index + 1), 'turnover': 35320.0,
+                 'ticker_direction': 'BUY', 'sequence': start_sequence + index, 'recv_timestamp': 1649813400.5,
+                 'type': 'AUTO_MATCH', 'push_data_type': 'REALTIME'} for index in range(count)]
+
+    def test_capture_tickers(self):
+        handler = OnTickerClass(self.capture_engine)
+        with mock.patch.object(OnTickerClass, 'parse_rsp_pb', side_effect=[
+                (RET_OK, self.get_tickers('HK.00700', 3, 10)), (RET_OK, self.get_tickers('HK.09988', 2)),
+                (RET_OK, self.get_tickers('HK.00700', 2, 13))]):
+            for _ in range(3):
+                handler.on_recv_rsp(None)
+        self.assertEqual(self.capture_engine.flush(), 7)
+        self.assertEqual(self.capture_engine.flush(), 0)
+
+        chunk_path = next((self.output_dir / 'ticker' / '2022-04-13').glob('part-*.parquet'))
+        encodings = pq.read_metadata(chunk_path).row_group(0).column(2).encodings
+        self.assertIn('DELTA_BINARY_PACKED', encodings)
+
+        table = CaptureEngine.load('ticker', '2022-04-13', '2022-04-13', ['HK.00700'], output_dir=self.output_dir)
+        self.assertEqual(table.column('sequence').to_pylist(), [10, 11, 12, 13, 14])
+        self.assertEqual(table.column('price').to_pylist(), [353.2, 353.4, 353.6, 353.2, 353.4])
+        self.assertEqual(table.column('time')[1].as_py(), datetime.datetime(2022, 4, 13, 9, 30, 1, 1000))
+        self.assertIsNone(CaptureEngine.load('ticker', '2022-04-14', '2022-04-15', output_dir=self.output_dir))
+
+    def test_capture_order_book(self):
+        order_book = {'code': 'HK.00700', 'name': 'TENCENT', 'svr_recv_time_bid': '2022-04-13 09:30:00.120',
+                      'svr_recv_time_ask': '', 'Bid': [(353.2, 1000, 3, {}), (353.0, 500, 1, {})],
+                      'Ask': [(353.4, 200, 1, {}), (353.6, 700, 2, {}), (353.8, 100, 1, {})]}
+        handler = OnOrderBookClass(self.capture_engine)
+        with mock.patch.object(OnOrderBookClass, 'parse_rsp_pb', return_value=(RET_OK, order_book)), \
+                mock.patch('engines.capture_engine.time.time_ns', return_value=1649813400120000000):
+            handler.on_recv_rsp(None)
+        self.capture_engine.order_book_levels = 2
+        self.capture_engine.stop()
+
+        table = CaptureEngine.load('order_book', '2022-04-13', '2022-04-13', output_dir=self.output_dir)
+        self.assertEqual(table.column('side').to_pylist(), ['Ask', 'Ask', 'Bid', 'Bid'])
+        self.assertEqual(table.column('level').to_pylist(), [0, 1, 0, 1])
+        self.assertEqual(table.column('price').to_pylist(), [353.4, 353.6, 353.2, 353.0])
+        self.assertEqual(table.column('svr_recv_time_ask').null_count, 4)
+
+    def test_order_book_partitioned_by_exchange_day(self):
+        # 2022-04-13 23:59:59 UTC is already 2022-04-14 in Hong Kong, 19:59:59 of 2022-04-13 in New York
+        capture_time = 1649894399000000000
+        for order_book in ({'code': 'HK.00700', 'svr_recv_time_bid': '', 'svr_recv_time_ask': '',
+                            'Bid': [(353.2, 1000, 3, {})], 'Ask': []},
+                           {'code': 'US.AAPL', 'svr_recv_time_bid': '', 'svr_recv_time_ask': '',
+                            'Bid': [(170.1, 100, 1, {})], 'Ask': []},
+                           {'code': 'HK.09988', 'svr_recv_time_bid': '', 'svr_recv_time_ask': '2022-04-13 16:08:00',
+                            'Bid': [], 'Ask': [(95.1, 100, 1, {})]}):
+            with mock.patch('engines.capture_engine.time.time_ns', return_value=capture_time):
+                self.capture_engine.add_order_book(order_book)
+        self.capture_engine.flush()
+
+        self.assertEqual(sorted(path.name for path in (self.output_dir / 'order_book').iterdir()),
+                         ['2022-04-13', '2022-04-14'])
+        table = CaptureEngine.load('order_book', '2022-04-13', '2022-04-13', output_dir=self.output_dir)
+        self.assertCountEqual(table.column('code').to_pylist(), ['US.AAPL', 'HK.09988'])
+        table = CaptureEngine.load('order_book', '2022-04-14', '2022-04-14', output_dir=self.output_dir)
+        self.assertEqual(table.column('code').to_pylist(), ['HK.00700'])
+
+    def test_missing_exchange_time(self):
+        # Records without exchange time are stored by their receive date, never under a folder load() does not read
+        ticker_list = self.get_tickers('HK.00700', 2)
+        ticker_list[1]['time'] = ''
+        ticker_list[1]['recv_timestamp'] = 1649894399.0
+        self.capture_engine.add_tickers(ticker_list)
+        with mock.patch('engines.capture_engine.time.time_ns', return_value=1649813400120000000):
+            self.capture_engine.add_order_book({'code': 'HK.00700', 'svr_recv_time_bid': '', 'svr_recv_time_ask': '',
+                                                'Bid': [(353.2, 1000, 3, {})], 'Ask': []})
+        with self.assertLogs(self.capture_engine.default_logger, level='WARNING'):
+            self.assertEqual(self.capture_engine.flush(), 3)
+
+        self.assertEqual(sorted(path.name for path in (self.output_dir / 'ticker').iterdir()),
+                         ['2022-04-13', '2022-04-14'])
+        self.assertEqual([path.name for path in (self.output_dir / 'order_book').iterdir()], ['2022-04-13'])
+        table = CaptureEngine.load('ticker', '2022-04-14', '2022-04-14', output_dir=self.output_dir)
+        self.assertEqual(table.column('sequence').to_pylist(), [1])
+        self.assertIsNone(table.column('time')[0].as_py())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,12 +15,25 @@
 #  Written by Bill Chan <billpwchan@hotmail.com>, 2022
 #  Copyright (c)  billpwchan - All Rights Reserved
 import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
 import unittest
+from contextlib import closing
 from pathlib import Path
+from unittest import mock
 
+import openpyxl
+import pandas as pd
+import pyarrow.parquet as pq
 import yfinance as yf
 
-from engines import DataProcessingInterface, YahooFinanceInterface
+from engines import AsyncWriteInterface, DataCatalogInterface, DataProcessingInterface, DatasetInterface, \
+    HKEXInterface, LiveJournalInterface, RehabInterface, SQLiteStoreInterface, TradingCalendarInterface, \
+    TuShareInterface, WatermarkInterface, YahooFinanceInterface
+from util.global_vars import config
 
 
 class TestYahooFinanceInterface(unittest.TestCase):
@@ -49,6 +62,105 @@ class TestYahooFinanceInterface(unittest.TestCase):
         self.assertRaises(AssertionError, YahooFinanceInterface.futu_code_to_yfinance_code, "9988.HK")
 
 
+class TestYahooQuoteModules(unittest.TestCase):
+    @staticmethod
+    def fake_get_modules(symbols):
+        return {stock_code: {'price':         {'shortName': stock_code, 'longName': stock_code,
+                                               'regularMarketPrice': 10, 'regularMarketDayHigh': 11,
+                                               'regularMarketChangePercent': 0.01},
+                             'summaryDetail': {'currency': 'HKD', 'previousClose': 9.9, 'volume': 1000000},
+                             'assetProfile':  {'sector': 'Technology'}} if stock_code != '9999.HK'
+                else 'Quote not found for ticker symbol: 9999.HK' for stock_code in symbols}
+
+    def test_get_stocks_email(self):
+        with mock.patch.dict(YahooFinanceInterface.quote_cache, clear=True), \
+                mock.patch.dict(config['YahooFinance'], {'BatchSize': '2'}), \
+                mock.patch('engines.data_engine.yahooquery.Ticker') as ticker:
+            ticker.side_effect = lambda symbols, **kwargs: mock.Mock(
+                get_modules=lambda modules: self.fake_get_modules(symbols))
+            email_dict = YahooFinanceInterface.get_stocks_email(['HK.00700', 'HK.09988', 'HK.09999'])
+            self.assertEqual(ticker.call_count, 2)
+            self.assertEqual(email_dict['0700.HK']['Sector'], 'Technology')
+            self.assertEqual(email_dict['0700.HK']['% Change'], '1.00%')
+            self.assertEqual(email_dict['9999.HK']['Sector'], 'N/A')
+
+            # Module results are reused within the TTL
+            YahooFinanceInterface.get_stocks_email(['HK.00700', 'HK.09988'])
+            self.assertEqual(ticker.call_count, 2)
+
+
+class TestYahooHistoryCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch('engines.data_engine.PATH_DATA', Path(self.temp_dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def fake_download(stock_list, start=None, **kwargs):
+        dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=300)
+        if start is not None:
+            dates = dates[dates >= pd.Timestamp(start)]
+        return pd.concat({stock_code: pd.DataFrame({'Open': 1.0, 'High': 2.0, 'Low': 0.5, 'Close': 1.5, 'Volume': 100,
+                                                    'Dividends': 0.0, 'Stock Splits': 0.0}, index=dates)
+                          for stock_code in stock_list}, axis=1)
+
+    def test_prefetch_stocks_history(self):
+        stock_list = ['HK.00001', 'HK.00700', 'HK.09988']
+        with mock.patch('engines.data_engine.yf.download', side_effect=self.fake_download) as download:
+            self.assertEqual(YahooFinanceInterface.prefetch_stocks_history(stock_list, batch_size=2), 2)
+            self.assertEqual(download.call_args_list[0].args[0], ['0001.HK', '0700.HK'])
+
+            # A second run within the TTL is served from the cache only
+            self.assertEqual(YahooFinanceInterface.prefetch_stocks_history(stock_list, batch_size=2), 0)
+            history_df = YahooFinanceInterface.get_stock_history('HK.00700', period='6mo')
+            self.assertEqual(download.call_count, 2)
+            self.assertEqual(list(history_df.columns), YahooFinanceInterface.HISTORY_COLUMNS)
+            self.assertGreaterEqual(history_df.index[0], pd.Timestamp.today().normalize() - pd.DateOffset(months=6))
+
+            # Expired caches are refreshed from their last bar in one request
+            cache_path = YahooFinanceInterface.get_history_cache_path('0700.HK')
+            last_date = pq.read_schema(cache_path).metadata[b'last_date'].decode()
+            expired_time = cache_path.stat().st_mtime - 3600 * 24
+            for stock_code in ['0001.HK', '0700.HK', '9988.HK']:
+                os.utime(YahooFinanceInterface.get_history_cache_path(stock_code), (expired_time, expired_time))
+            self.assertEqual(YahooFinanceInterface.prefetch_stocks_history(stock_list), 1)
+            self.assertEqual(download.call_args.kwargs['start'], last_date)
+            self.assertEqual(len(YahooFinanceInterface.read_history_cache('0700.HK')), 300)
+
+            # A longer period than cached triggers a full download
+            YahooFinanceInterface.get_stock_history('HK.00700', period='max')
+            self.assertEqual(download.call_args.kwargs['period'], 'max')
+
+    def test_prefetch_after_corporate_action(self):
+        with mock.patch('engines.data_engine.yf.download', side_effect=self.fake_download):
+            YahooFinanceInterface.prefetch_stocks_history(['HK.00700', 'HK.09988'])
+        cache_path = YahooFinanceInterface.get_history_cache_path('0700.HK')
+        history_start = pq.read_schema(cache_path).metadata[b'history_start'].decode()
+        expired_time = cache_path.stat().st_mtime - 3600 * 24
+        for stock_code in ['0700.HK', '9988.HK']:
+            os.utime(YahooFinanceInterface.get_history_cache_path(stock_code), (expired_time, expired_time))
+
+        # A dividend of 0700.HK on the latest bar: Yahoo adjusts its whole history again
+        def download_after_dividend(stock_list, **kwargs):
+            download_df = self.fake_download(stock_list, **kwargs)
+            if '0700.HK' in stock_list:
+                download_df[('0700.HK', 'Close')] = 1.2
+                download_df.loc[download_df.index[-1], ('0700.HK', 'Dividends')] = 0.3
+            return download_df
+
+        with mock.patch('engines.data_engine.yf.download', side_effect=download_after_dividend) as download:
+            self.assertEqual(YahooFinanceInterface.prefetch_stocks_history(['HK.00700', 'HK.09988']), 2)
+        self.assertEqual(download.call_args_list[1].args[0], ['0700.HK'])
+        self.assertEqual(download.call_args_list[1].kwargs['start'], history_start)
+        self.assertTrue(YahooFinanceInterface.read_history_cache('0700.HK')['Close'].eq(1.2).all())
+        self.assertEqual(YahooFinanceInterface.get_history_start('0700.HK'), history_start)
+        self.assertTrue(YahooFinanceInterface.read_history_cache('9988.HK')['Close'].eq(1.5).all())
+
+
 class TestDataProcessingInterface(unittest.TestCase):
     def test_get_1M_data_range(self):
         date_range = ['2022-04-11', '2022-04-12', '2022-04-13']
@@ -58,9 +170,22 @@ class TestDataProcessingInterface(unittest.TestCase):
         self.assertIsInstance(output_dict, dict)
         self.assertCountEqual(output_dict.keys(), stock_list)
 
+        for stock_code in stock_list:
+            reference_df = pd.concat(
+                [pd.read_parquet(Path.cwd() / 'data' / stock_code / f'{stock_code}_{input_date}_1M.parquet') for
+                 input_date in date_range], ignore_index=True)
+            pd.testing.assert_frame_equal(output_dict[stock_code],
+                                          DataProcessingInterface.normalize_kline_df(reference_df))
+
+    def test_get_1M_data_range_missing_files(self):
+        output_dict = DataProcessingInterface.get_1M_data_range(['2022-04-09', '2022-04-10', '2022-04-11'],
+                                                                ['HK.09988', 'HK.99999'])
+        self.assertTrue(output_dict['HK.99999'].empty)
+        self.assertTrue((output_dict['HK.09988']['time_key'].dt.strftime('%Y-%m-%d') == '2022-04-11').all())
+
     def test_get_custom_interval_data(self):
         target_date = datetime.datetime(2022, 4, 11)
-        custom_intervals = [3, 5, 15, 30]
+        custom_intervals = [3, 5, 15, 30, 60]
         stock_list = ['HK.09988']
         for custom_interval in custom_intervals:
             output_df = DataProcessingInterface.get_custom_interval_data(target_date, custom_interval, stock_list)[
@@ -87,6 +212,78 @@ class TestDataProcessingInterface(unittest.TestCase):
                 self.assertAlmostEqual(row['last_close'], reference_df.loc[index, 'last_close'], places=2,
                                        msg=f"{index} last_close")
 
+    def test_resample_custom_interval_multi_day(self):
+        date_range = ['2022-04-11', '2022-04-12', '2022-04-13']
+        input_df = DataProcessingInterface.get_1M_data_range(date_range, ['HK.09988'])['HK.09988']
+        for custom_interval in [5, 60]:
+            output_df = DataProcessingInterface.resample_custom_interval(input_df, custom_interval)
+            reference_df = DataProcessingInterface.get_stock_df_from_file(
+                Path.cwd() / 'tests' / 'test_data' / f'HK.09988_2022-04-11_{custom_interval}M.parquet')
+            first_day_df = output_df[output_df['time_key'].dt.strftime('%Y-%m-%d') == '2022-04-11']
+            self.assertEqual(first_day_df['time_key'].tolist(), reference_df['time_key'].tolist())
+            self.assertEqual(output_df.shape[0], reference_df.shape[0] * len(date_range))
+
+            # The first bar of each day uses the previous day close as last_close
+            second_day_df = output_df[output_df['time_key'].dt.strftime('%Y-%m-%d') == '2022-04-12']
+            self.assertAlmostEqual(second_day_df['last_close'].iloc[0], first_day_df['close'].iloc[-1], places=2)
+            self.assertEqual(str(second_day_df['time_key'].iloc[0]), '2022-04-12 09:35:00' if custom_interval == 5 else
+                             '2022-04-12 10:30:00')
+
+    def test_normalize_kline_df(self):
+        input_df = pd.read_parquet(Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        output_df = DataProcessingInterface.normalize_kline_df(input_df)
+        self.assertEqual(output_df['time_key'].dtype, 'datetime64[ns]')
+        self.assertEqual(output_df['code'].dtype, 'category')
+        self.assertEqual(output_df['volume'].dtype, 'int64')
+        self.assertEqual(output_df['close'].dtype, 'float64')
+        self.assertEqual(output_df['time_key'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(), input_df['time_key'].tolist())
+        pd.testing.assert_frame_equal(DataProcessingInterface.normalize_kline_df(output_df), output_df)
+
+        output_df = DataProcessingInterface.normalize_kline_df(input_df, float32=True)
+        self.assertEqual(output_df['close'].dtype, 'float32')
+
+        # Rows built from a Series (e.g., row.to_frame().transpose()) come in as objects
+        output_df = DataProcessingInterface.normalize_kline_df(input_df.iloc[0].to_frame().transpose())
+        self.assertEqual(output_df['open'].dtype, 'float64')
+        self.assertEqual(output_df['time_key'].dtype, 'datetime64[ns]')
+
+    def test_convert_to_canonical_schema(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                mock.patch('engines.data_engine.PATH_DATA', Path(temp_dir)), \
+                mock.patch('engines.data_engine.PATH_DATASET', Path(temp_dir) / 'Dataset'):
+            input_path = Path(temp_dir) / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet'
+            input_path.parent.mkdir()
+            shutil.copy(Path.cwd() / 'data' / 'HK.09988' / input_path.name, input_path)
+            input_df = pd.read_parquet(input_path)
+
+            self.assertTrue(DataProcessingInterface.convert_to_canonical_schema(input_path))
+            self.assertFalse(DataProcessingInterface.convert_to_canonical_schema(input_path))
+            output_df = pd.read_parquet(input_path)
+            self.assertEqual(output_df['time_key'].dtype, 'datetime64[ns]')
+            self.assertEqual(output_df['code'].dtype, 'category')
+            pd.testing.assert_frame_equal(output_df, DataProcessingInterface.normalize_kline_df(input_df))
+
+    def test_convert_csv_parquet_streaming(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = Path(temp_dir) / 'HK.09988_2022-04-11_1M.parquet'
+            input_df = DataProcessingInterface.get_stock_df_from_file(
+                Path.cwd() / 'data' / 'HK.09988' / input_path.name)
+            DataProcessingInterface.save_stock_df_to_file(input_df, input_path.with_suffix('.csv'), file_type='csv')
+
+            # A small block size forces many record batches / row groups
+            self.assertTrue(DataProcessingInterface.convert_csv_to_parquet(input_path.with_suffix('.csv'),
+                                                                           block_size=4096))
+            self.assertGreater(pq.read_metadata(input_path).num_row_groups, 1)
+            pd.testing.assert_frame_equal(DataProcessingInterface.get_stock_df_from_file(input_path), input_df)
+
+            input_path.with_suffix('.csv').unlink()
+            self.assertTrue(DataProcessingInterface.convert_parquet_to_csv(input_path, batch_size=50))
+            output_df = pd.read_csv(input_path.with_suffix('.csv'))
+            self.assertEqual(output_df['time_key'].iloc[0], '2022-04-11 09:30:00')
+            pd.testing.assert_frame_equal(DataProcessingInterface.normalize_kline_df(output_df), input_df)
+            self.assertEqual(sorted(item.name for item in Path(temp_dir).iterdir()),
+                             [input_path.with_suffix('.csv').name, input_path.name])
+
     # def test_convert_day_interval_to_weekly(self):
     #     input_df = yf.Ticker("0700.HK").history(start="2023-01-02", end="2023-02-02", interval="1d")
     #     DataProcessingInterface.convert_day_interval_to_weekly(input_df)
@@ -102,8 +299,838 @@ class TestDataProcessingInterface(unittest.TestCase):
     #                                msg=f"{index} volume")
 
 
+class TestAsyncWriteInterface(unittest.TestCase):
+    def test_back_pressure_and_flush(self):
+        release = threading.Event()
+        written = []
+
+        def write(index):
+            release.wait()
+            if index == 3:
+                raise OSError('No space left on device')
+            written.append(index)
+
+        with mock.patch.dict(config['Data.Storage'], {'WriteWorkers': '2', 'WriteQueueSize': '3'}), \
+                mock.patch.object(AsyncWriteInterface, 'executor', None):
+            for index in range(3):
+                AsyncWriteInterface.submit(write, index)
+            # The queue is full, so the next submit waits until a write completes
+            producer = threading.Thread(target=AsyncWriteInterface.submit, args=(write, 3))
+            producer.start()
+            producer.join(0.2)
+            self.assertTrue(producer.is_alive())
+            release.set()
+            producer.join()
+            self.assertEqual(AsyncWriteInterface.flush(), 1)
+            self.assertCountEqual(written, [0, 1, 2])
+            self.assertEqual(AsyncWriteInterface.flush(), 0)
+            AsyncWriteInterface.executor.shutdown()
+
+    def test_save_stock_df_async(self):
+        input_df = pd.DataFrame({'code': ['HK.00700'], 'name': ['TENCENT']})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = Path(temp_dir) / 'stock_basic_info.parquet'
+            self.assertTrue(DataProcessingInterface.save_stock_df_async(input_df, output_path))
+            self.assertFalse(DataProcessingInterface.save_stock_df_async(input_df.iloc[:0], output_path))
+            self.assertEqual(AsyncWriteInterface.flush(), 0)
+            pd.testing.assert_frame_equal(pd.read_parquet(output_path), input_df)
+            self.assertEqual([item.name for item in Path(temp_dir).iterdir()], ['stock_basic_info.parquet'])
+
+    def test_save_failure_keeps_existing_file(self):
+        input_df = pd.DataFrame({'code': ['HK.00700'], 'time_key': ['2022-04-13 09:31:00'], 'close': [353.2]})
+
+        def write_partially(table, output_path, **kwargs):
+            Path(output_path).write_bytes(b'PAR1')
+            raise OverflowError('Python int too large to convert to C long')
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_path = Path(temp_dir) / 'HK.00700_2022-04-13_1M.parquet'
+            self.assertTrue(DataProcessingInterface.save_stock_df_to_file(input_df, output_path))
+            with mock.patch('engines.data_engine.pq.write_table', side_effect=write_partially), \
+                    mock.patch.object(DataCatalogInterface, 'register') as register:
+                self.assertFalse(DataProcessingInterface.save_stock_df_to_file(input_df.assign(close=1.0),
+                                                                               output_path))
+            register.assert_not_called()
+            self.assertEqual(pd.read_parquet(output_path)['close'].tolist(), [353.2])
+            self.assertEqual([item.name for item in Path(temp_dir).iterdir()], [output_path.name])
+
+
+class TestDatasetInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch('engines.data_engine.PATH_DATASET', Path(self.temp_dir.name))
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_migrate_daily_to_partitioned(self):
+        date_range = ['2022-04-11', '2022-04-12', '2022-04-13']
+        stock_list = ['HK.09988', 'HK.00700']
+        DatasetInterface.migrate_daily_to_partitioned(stock_list)
+
+        self.assertTrue(DatasetInterface.get_partition_path('HK.09988', 2022, 4).is_file())
+        self.assertCountEqual(DatasetInterface.get_stock_list(), stock_list)
+
+        reference_dict = DataProcessingInterface.get_1M_data_range(date_range, stock_list)
+        output_dict = DatasetInterface.read_1M_data(stock_list, date_range[0], date_range[-1])
+        for stock_code in stock_list:
+            self.assertEqual(output_dict[stock_code]['time_key'].tolist(),
+                             reference_dict[stock_code]['time_key'].tolist())
+            self.assertEqual(output_dict[stock_code]['close'].tolist(), reference_dict[stock_code]['close'].tolist())
+            self.assertTrue((output_dict[stock_code]['code'] == stock_code).all())
+
+    def test_read_legacy_partition(self):
+        # Partitions written before the typed schema keep time_key as a string
+        input_df = pd.read_parquet(Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        output_path = DatasetInterface.get_partition_path('HK.09988', 2022, 4)
+        output_path.parent.mkdir(parents=True)
+        input_df.drop(columns=['code']).to_parquet(output_path, index=False)
+
+        output_df = DatasetInterface.read_1M_data(['HK.09988'], '2022-04-11', '2022-04-11')['HK.09988']
+        pd.testing.assert_frame_equal(output_df, DataProcessingInterface.normalize_kline_df(input_df))
+
+    def test_write_1M_data_upsert(self):
+        input_df = DataProcessingInterface.get_stock_df_from_file(
+            Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        DatasetInterface.write_1M_data(input_df)
+        updated_df = input_df.tail(1).assign(close=1.0)
+        DatasetInterface.write_1M_data(updated_df)
+
+        output_df = DatasetInterface.read_1M_data(['HK.09988'], '2022-04-11', '2022-04-11')['HK.09988']
+        self.assertEqual(output_df.shape[0], input_df.shape[0])
+        self.assertEqual(output_df['close'].iloc[-1], 1.0)
+
+        output_df = DatasetInterface.read_1M_data(['HK.09988'], '2022-04-12', '2022-04-12')['HK.09988']
+        self.assertTrue(output_df.empty)
+
+
+class TestResampleCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        shutil.copytree(Path.cwd() / 'data' / 'HK.09988', self.data_path / 'HK.09988',
+                        ignore=shutil.ignore_patterns('*_1[DW].parquet'))
+        self.patcher = mock.patch('engines.data_engine.PATH_DATA', self.data_path)
+        self.patcher.start()
+        self.date_range = ['2022-04-11', '2022-04-12', '2022-04-13']
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_get_custom_interval_data_range(self):
+        output_df = DataProcessingInterface.get_custom_interval_data_range(self.date_range, ['HK.09988'], 5)[
+            'HK.09988']
+        reference_df = DataProcessingInterface.get_stock_df_from_file(
+            Path.cwd() / 'tests' / 'test_data' / 'HK.09988_2022-04-11_5M.parquet')
+        self.assertTrue((self.data_path / 'HK.09988' / 'HK.09988_2022-04-12_5M.parquet').is_file())
+        self.assertEqual(output_df.shape[0], reference_df.shape[0] * len(self.date_range))
+        self.assertEqual(output_df['time_key'].tolist()[:reference_df.shape[0]], reference_df['time_key'].tolist())
+
+        # Second run is served from the cache without resampling
+        with mock.patch.object(DataProcessingInterface, 'resample_custom_interval') as resample:
+            cached_df = DataProcessingInterface.get_custom_interval_data_range(self.date_range, ['HK.09988'], 5)[
+                'HK.09988']
+            resample.assert_not_called()
+        pd.testing.assert_frame_equal(cached_df, output_df)
+
+    def test_cache_invalidation(self):
+        DataProcessingInterface.get_custom_interval_data_range(self.date_range, ['HK.09988'], 5)
+        source_path = self.data_path / 'HK.09988' / 'HK.09988_2022-04-12_1M.parquet'
+        source_df = pd.read_parquet(source_path)
+        source_df.loc[source_df.index[-1], 'close'] = 1.0
+        source_df.to_parquet(source_path, index=False)
+        os.utime(source_path, ns=(0, 0))
+
+        with mock.patch.object(DataProcessingInterface, 'rebuild_custom_interval_cache',
+                               wraps=DataProcessingInterface.rebuild_custom_interval_cache) as rebuild:
+            output_df = DataProcessingInterface.get_custom_interval_data_range(self.date_range, ['HK.09988'], 5)[
+                'HK.09988']
+            self.assertEqual(list(rebuild.call_args[0][0].keys()), [source_path])
+        self.assertEqual(output_df.loc[output_df['time_key'] == '2022-04-12 16:00:00', 'close'].iloc[0], 1.0)
+
+
+class TestDataCatalogInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        shutil.copytree(Path.cwd() / 'data' / 'HK.09988', self.data_path / 'HK.09988')
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset'),
+                         mock.patch.dict(config['Data.Storage'], {'Catalog': 'True'})]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_rebuild(self):
+        self.assertFalse(DataCatalogInterface.is_available())
+        file_count = len(list((self.data_path / 'HK.09988').glob('*.parquet')))
+        self.assertEqual(DataCatalogInterface.rebuild(), file_count)
+        self.assertTrue(DataCatalogInterface.is_available())
+        self.assertEqual(DataCatalogInterface.get_stock_list(), ['HK.09988'])
+
+        partitions = DataCatalogInterface.get_partitions('HK.09988', '1M', '2022-04-11', '2022-04-12')
+        self.assertEqual(partitions, ['2022-04-11', '2022-04-12'])
+        row = DataCatalogInterface.query("SELECT row_count, min_time, max_time FROM data_file WHERE partition = ?",
+                                         ('2022-04-11',))[0]
+        input_df = pd.read_parquet(self.data_path / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        self.assertEqual(row, (input_df.shape[0], input_df['time_key'].min(), input_df['time_key'].max()))
+
+        date_range = ['2022-04-10', '2022-04-11', '2022-04-12', '2022-04-13']
+        self.assertEqual(DataProcessingInterface.get_1M_data_range_paths(date_range, 'HK.09988'),
+                         [self.data_path / 'HK.09988' / f'HK.09988_{input_date}_1M.parquet' for input_date in
+                          date_range[1:]])
+
+    def test_register_on_write(self):
+        # Writers do not create the catalog before it has been built
+        output_path = self.data_path / 'HK.09988' / 'HK.09988_2022-04-14_1M.parquet'
+        input_df = pd.read_parquet(self.data_path / 'HK.09988' / 'HK.09988_2022-04-13_1M.parquet')
+        DataProcessingInterface.save_stock_df_to_file(input_df, output_path)
+        self.assertFalse(DataCatalogInterface.get_path().exists())
+
+        DataCatalogInterface.rebuild()
+        DatasetInterface.write_1M_data(input_df)
+        self.assertEqual(DataCatalogInterface.get_partitions('HK.09988', '1M', layout='dataset'), ['2022-04'])
+
+        output_path.unlink()
+        DataCatalogInterface.unregister(output_path)
+        self.assertNotIn('2022-04-14', DataCatalogInterface.get_partitions('HK.09988', '1M'))
+        DataProcessingInterface.save_stock_df_to_file(input_df, output_path)
+        self.assertIn('2022-04-14', DataCatalogInterface.get_partitions('HK.09988', '1M'))
+
+    def test_availability_cached(self):
+        DataCatalogInterface.rebuild()
+        with mock.patch.object(DataCatalogInterface, 'connect') as connect:
+            self.assertTrue(DataCatalogInterface.is_available())
+            connect.assert_not_called()
+        DataCatalogInterface.get_path().unlink()
+        self.assertFalse(DataCatalogInterface.is_available())
+
+    def test_catalog_disabled(self):
+        # A catalog left by an earlier run is not used while [Data.Storage] Catalog is off
+        DataCatalogInterface.rebuild()
+        with mock.patch.dict(config['Data.Storage'], {'Catalog': 'False'}):
+            self.assertFalse(DataCatalogInterface.is_available())
+            (self.data_path / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet').unlink()
+            self.assertEqual(DataProcessingInterface.get_1M_data_range_paths(['2022-04-11', '2022-04-12'], 'HK.09988'),
+                             [self.data_path / 'HK.09988' / 'HK.09988_2022-04-12_1M.parquet'])
+
+    def test_legacy_checksum_catalog(self):
+        # Catalogs with the CRC32 column of older versions are emptied, so they are built again
+        with closing(sqlite3.connect(DataCatalogInterface.get_path())) as conn, conn:
+            conn.executescript(DataCatalogInterface.SCHEMA.replace('mtime_ns   INTEGER NOT NULL',
+                                                                   'mtime_ns   INTEGER NOT NULL, checksum TEXT'))
+            conn.execute("INSERT INTO catalog_info VALUES ('built_at', '2022-04-13 00:00:00')")
+        self.assertFalse(DataCatalogInterface.is_available())
+        DataCatalogInterface.rebuild()
+        self.assertTrue(DataCatalogInterface.is_available())
+        self.assertEqual(DataCatalogInterface.get_partitions('HK.09988', '1M', '2022-04-11', '2022-04-11'),
+                         ['2022-04-11'])
+
+    def test_migrate_unregisters_removed_files(self):
+        DataCatalogInterface.rebuild()
+        DatasetInterface.migrate_daily_to_partitioned(['HK.09988'], remove_source=True)
+        self.assertEqual(DataCatalogInterface.get_partitions('HK.09988', '1M'), [])
+        self.assertEqual(DataCatalogInterface.get_partitions('HK.09988', '1M', layout='dataset'), ['2022-04'])
+        self.assertEqual(WatermarkInterface.get_stored_dates_1M('HK.09988'), set())
+        self.assertTrue(DataProcessingInterface.get_1M_data_range(['2022-04-11'], ['HK.09988'])['HK.09988'].empty)
+
+    def test_migrate_stock_folders_only(self):
+        data_path = Path(self.temp_dir.name) / 'data'
+        input_file = Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet'
+        for folder, file_name in [('HK.09988', input_file.name), ('Capture', 'Capture_2022-04-11_1M.parquet'),
+                                  ('Yahoo_Cache', 'Yahoo_Cache_2022-04-11_1M.parquet')]:
+            (data_path / folder).mkdir(parents=True)
+            shutil.copy(input_file, data_path / folder / file_name)
+        with mock.patch('engines.data_engine.PATH_DATA', data_path), \
+                mock.patch('engines.data_engine.PATH_DATASET', data_path / 'Dataset'):
+            DatasetInterface.migrate_daily_to_partitioned(remove_source=True)
+            self.assertEqual(DatasetInterface.get_stock_list(), ['HK.09988'])
+        self.assertFalse((data_path / 'HK.09988' / input_file.name).exists())
+        self.assertTrue((data_path / 'Capture' / 'Capture_2022-04-11_1M.parquet').is_file())
+        self.assertTrue((data_path / 'Yahoo_Cache' / 'Yahoo_Cache_2022-04-11_1M.parquet').is_file())
+
+
+class TestDataHealth(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.stock_path = self.data_path / 'HK.09988'
+        self.stock_path.mkdir()
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset')]
+        for patcher in self.patchers:
+            patcher.start()
+
+        input_df = pd.read_parquet(Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        input_df.to_parquet(self.stock_path / 'HK.09988_2022-04-11_1M.parquet', index=False)
+        input_df.head(0).to_parquet(self.stock_path / 'HK.09988_2022-04-12_1M.parquet', index=False)
+        input_df.to_parquet(self.stock_path / 'HK.09988_2022-04-13_1M.parquet', index=False)
+        with open(self.stock_path / 'HK.09988_2022-04-13_1M.parquet', 'r+b') as f:
+            f.truncate(f.seek(0, os.SEEK_END) // 2)
+        input_df.drop(columns=['close']).to_parquet(self.stock_path / 'HK.09988_2022-04-14_1M.parquet', index=False)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_scan_data_health(self):
+        with mock.patch('pyarrow.parquet.read_table') as read_table:
+            output_df = DataProcessingInterface.scan_data_health()
+            read_table.assert_not_called()
+        statuses = dict(zip(output_df['path'].map(lambda input_path: input_path.name[9:19]), output_df['status']))
+        self.assertEqual(statuses, {'2022-04-11': 'ok', '2022-04-12': 'empty', '2022-04-13': 'truncated',
+                                    '2022-04-14': 'schema_drift'})
+        ok_row = output_df[output_df['status'] == 'ok'].iloc[0]
+        self.assertEqual((ok_row['min_time'], ok_row['max_time']), ('2022-04-11 09:30:00', '2022-04-11 16:00:00'))
+
+        DataProcessingInterface.scan_data_health(action='quarantine', statuses=('truncated', 'schema_drift'))
+        self.assertEqual(sorted(item.name for item in (self.data_path / 'Quarantine' / 'HK.09988').iterdir()),
+                         ['HK.09988_2022-04-13_1M.parquet', 'HK.09988_2022-04-14_1M.parquet'])
+
+        DataProcessingInterface.clear_empty_data()
+        self.assertEqual([item.name for item in self.stock_path.iterdir()], ['HK.09988_2022-04-11_1M.parquet'])
+
+
+class TestHKEXInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        (self.data_path / 'Stock_Pool').mkdir()
+        self.patcher = mock.patch('engines.data_engine.PATH_DATA', self.data_path)
+        self.patcher.start()
+        self.cache_patcher = mock.patch.dict(HKEXInterface.security_cache, {'key': None, 'df': None, 'index': {}})
+        self.cache_patcher.start()
+
+        wb = openpyxl.Workbook()
+        sh = wb.active
+        for row in [('List of Securities', None, None, None, None),
+                    ('Updated as at 24/07/2022', None, None, None, None),
+                    ('Stock Code', 'Name of Securities', 'Category', 'Sub-Category', 'Board Lot'),
+                    ('00001', 'CKH HOLDINGS', 'Equity', 'Equity Securities (Main Board)', '500'),
+                    ('00700', 'TENCENT', 'Equity', 'Equity Securities (Main Board)', '100'),
+                    ('01299', 'AIA', 'Equity', 'Equity Securities (Main Board)', '200'),
+                    ('10001', 'HSBC 2201', 'Debt Securities', 'Debt Securities', '1,000')]:
+            sh.append(row)
+        wb.save(self.data_path / 'Stock_Pool' / 'ListOfSecurities.xlsx')
+
+    def tearDown(self):
+        self.cache_patcher.stop()
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_convert_security_list(self):
+        security_df = HKEXInterface.convert_security_list(self.data_path / 'Stock_Pool' / 'ListOfSecurities.xlsx')
+        self.assertEqual(security_df['Board Lot'].tolist(), [500, 100, 200, 1000])
+        self.assertEqual(str(security_df['Category'].dtype), 'category')
+        self.assertTrue((self.data_path / 'Stock_Pool' / 'ListOfSecurities.csv').exists())
+
+        self.assertEqual(HKEXInterface.get_equity_list_full(), ['HK.00001', 'HK.00700', 'HK.01299'])
+        self.assertEqual(HKEXInterface.get_board_lot_full(), {'HK.00001': 500, 'HK.00700': 100, 'HK.01299': 200})
+        self.assertEqual(HKEXInterface.get_equity_info_full()[1],
+                         {'Stock Code': 'HK.00700', 'Name of Securities': 'TENCENT', 'Board Lot': 100})
+        self.assertEqual(HKEXInterface.get_security_info('HK.10001'), ('HSBC 2201', 1000, 'Debt Securities'))
+        self.assertEqual(HKEXInterface.get_board_lot('HK.00700'), 100)
+        self.assertEqual(HKEXInterface.get_board_lot('HK.99999'), 0)
+
+    def test_load_security_master_from_csv(self):
+        HKEXInterface.convert_security_list(self.data_path / 'Stock_Pool' / 'ListOfSecurities.xlsx')
+        (self.data_path / 'Stock_Pool' / 'ListOfSecurities.parquet').unlink()
+        self.assertEqual(HKEXInterface.get_board_lot('HK.01299'), 200)
+        self.assertTrue((self.data_path / 'Stock_Pool' / 'ListOfSecurities.parquet').exists())
+
+        security_df = HKEXInterface.get_security_df_full()
+        self.assertIs(HKEXInterface.get_security_df_full(), security_df)
+
+
+class TestTuShareInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', Path(self.temp_dir.name)),
+                         mock.patch.object(TuShareInterface, 'output_df', pd.DataFrame()),
+                         mock.patch.object(TuShareInterface, 'offsets', {})]
+        for patcher in self.patchers:
+            patcher.start()
+        self.trade_dates = pd.bdate_range(end=datetime.date.today(), periods=3).strftime('%Y%m%d').tolist()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def fake_query(self, api_name, **kwargs):
+        if api_name == 'trade_cal':
+            return pd.DataFrame({'cal_date': [trade_date for trade_date in self.trade_dates
+                                              if kwargs['start_date'] <= trade_date <= kwargs['end_date']]})
+        return pd.DataFrame({'ts_code': ['600000.SH', '000001.SZ'], 'trade_date': kwargs['trade_date'],
+                             'close': [10.0, 20.0], 'vol': [100.0, 200.0]})
+
+    def test_update_stocks_history(self):
+        with mock.patch.object(TuShareInterface, 'query', side_effect=self.fake_query) as query:
+            TuShareInterface.update_stocks_history(['SZ.000001', 'SH.600000'])
+            self.assertEqual(query.call_count, 4)
+            history_df = TuShareInterface.get_stock_history('SZ.000001')
+            self.assertEqual(history_df['time_key'].tolist(), self.trade_dates)
+            self.assertEqual(history_df['volume'].tolist(), [200.0] * 3)
+            self.assertTrue(TuShareInterface.get_stock_history('SZ.000002').empty)
+
+            # Only trade dates after the stored ones are requested
+            self.trade_dates.append((pd.Timestamp(self.trade_dates[-1]) + pd.Timedelta(days=1)).strftime('%Y%m%d'))
+            with mock.patch('engines.data_engine.datetime') as mock_datetime:
+                mock_datetime.today.return_value = datetime.datetime.strptime(self.trade_dates[-1], '%Y%m%d')
+                TuShareInterface.update_stocks_history(['SH.600000'])
+            self.assertEqual(query.call_args.kwargs, {'trade_date': self.trade_dates[-1]})
+            self.assertEqual(query.call_count, 6)
+            self.assertEqual(len(TuShareInterface.get_stock_history('SH.600000')), 4)
+            self.assertEqual(list(TuShareInterface.offsets), ['600000.SH'])
+
+    def test_update_stocks_history_empty_response(self):
+        # An empty response in the middle of the range is requested again by the next update
+        empty_dates = {self.trade_dates[1]}
+
+        def fake_query(api_name, **kwargs):
+            if kwargs.get('trade_date') in empty_dates:
+                return pd.DataFrame()
+            return self.fake_query(api_name, **kwargs)
+
+        with mock.patch.object(TuShareInterface, 'query', side_effect=fake_query) as query:
+            TuShareInterface.update_stocks_history(['SZ.000001'])
+            self.assertEqual(query.call_count, 3)
+            self.assertEqual(TuShareInterface.get_stock_history('SZ.000001')['time_key'].tolist(),
+                             self.trade_dates[:1])
+
+            empty_dates.clear()
+            TuShareInterface.update_stocks_history(['SZ.000001'])
+            self.assertEqual([call.kwargs for call in query.call_args_list[-2:]],
+                             [{'trade_date': trade_date} for trade_date in self.trade_dates[1:]])
+            self.assertEqual(TuShareInterface.get_stock_history('SZ.000001')['time_key'].tolist(), self.trade_dates)
+
+
+class TestDataValidation(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.stock_path = self.data_path / 'HK.09988'
+        self.stock_path.mkdir()
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset')]
+        for patcher in self.patchers:
+            patcher.start()
+
+        input_df = DataProcessingInterface.get_stock_df_from_file(
+            Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        input_df.to_parquet(self.stock_path / 'HK.09988_2022-04-11_1M.parquet', index=False)
+
+        # Half trading day with the morning session only
+        half_day_df = input_df[input_df['time_key'].dt.hour < 13].copy()
+        half_day_df['time_key'] += pd.Timedelta(days=1)
+        half_day_df.to_parquet(self.stock_path / 'HK.09988_2022-04-12_1M.parquet', index=False)
+
+        defect_df = input_df.copy()
+        defect_df['time_key'] += pd.Timedelta(days=3)
+        defect_df.loc[200:234, 'volume'] = 0
+        defect_df.loc[20, 'high'] = defect_df.loc[20, ['open', 'close']].max() - 1
+        off_session_row = defect_df.iloc[[150]].assign(time_key=pd.Timestamp('2022-04-14 12:30:00'))
+        defect_df = pd.concat([defect_df.iloc[:30], defect_df.iloc[[29]], defect_df.iloc[[31, 30]],
+                               defect_df.iloc[37:151], off_session_row, defect_df.iloc[151:]], ignore_index=True)
+        defect_df.to_parquet(self.stock_path / 'HK.09988_2022-04-14_1M.parquet', index=False)
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_validate_1M_data(self):
+        trading_days = {'2022-04-11': 'WHOLE', '2022-04-12': 'MORNING', '2022-04-13': 'WHOLE', '2022-04-14': 'WHOLE'}
+        report_df = DataProcessingInterface.validate_1M_data(sorted(trading_days), ['HK.09988'], trading_days,
+                                                             max_workers=1)
+        checks = {(str(row.date), row.check): row.count for row in report_df.itertuples()}
+        self.assertEqual(checks.pop(('2022-04-13', 'missing_day')), 331)
+        self.assertEqual(checks.pop(('2022-04-14', 'missing_minutes')), 5)
+        self.assertEqual(checks.pop(('2022-04-14', 'duplicate_time')), 1)
+        self.assertEqual(checks.pop(('2022-04-14', 'non_monotonic')), 1)
+        self.assertEqual(checks.pop(('2022-04-14', 'off_session')), 1)
+        self.assertEqual(checks.pop(('2022-04-14', 'ohlc_inconsistent')), 1)
+        self.assertGreaterEqual(checks.pop(('2022-04-14', 'zero_volume_run')), 35)
+        self.assertEqual(checks, {})
+
+        report_path = DataProcessingInterface.save_validation_report(report_df, self.data_path / 'Report')
+        pd.testing.assert_frame_equal(pd.read_parquet(report_path), report_df)
+
+
+class TestTradingCalendarInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.patcher = mock.patch('engines.data_engine.PATH_DATA', Path(self.temp_dir.name))
+        self.patcher.start()
+        self.holidays = {'2022-04-15', '2022-04-18'}
+        self.half_days = {'2022-04-14'}
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.temp_dir.cleanup()
+
+    def request_trading_days(self, market, start_date, end_date):
+        return [{'time': trading_day, 'trade_date_type': 'MORNING' if trading_day in self.half_days else 'WHOLE'}
+                for trading_day in pd.bdate_range(start_date, end_date).strftime('%Y-%m-%d')
+                if trading_day not in self.holidays]
+
+    def test_refresh_incrementally(self):
+        request_fn = mock.Mock(side_effect=self.request_trading_days)
+        self.assertEqual(TradingCalendarInterface.get_sessions('HK', '2022-04-11', '2022-04-19', request_fn),
+                         {'2022-04-11': 'WHOLE', '2022-04-12': 'WHOLE', '2022-04-13': 'WHOLE',
+                          '2022-04-14': 'MORNING', '2022-04-19': 'WHOLE'})
+        TradingCalendarInterface.get_trading_days('HK', '2022-04-12', '2022-04-14', request_fn)
+        self.assertEqual(request_fn.call_count, 1)
+
+        # Only the dates outside the covered range are requested
+        TradingCalendarInterface.get_trading_days('HK', '2022-04-06', '2022-04-22', request_fn)
+        self.assertEqual([call.args for call in request_fn.call_args_list[1:]],
+                         [('HK', '2022-04-06', '2022-04-10'), ('HK', '2022-04-20', '2022-04-22')])
+        self.assertEqual(TradingCalendarInterface.load()[1], {'HK': ['2022-04-06', '2022-04-22']})
+
+        # A failed request leaves the range uncovered, which falls back to weekdays
+        self.assertEqual(TradingCalendarInterface.get_trading_days('US', '2022-04-14', '2022-04-18',
+                                                                   lambda *args: None),
+                         ['2022-04-14', '2022-04-15', '2022-04-18'])
+
+    def test_get_last_closed_day(self):
+        self.assertEqual(TradingCalendarInterface.get_last_closed_day(datetime.datetime(2022, 4, 13, 8, 0)),
+                         '2022-04-12')
+        self.assertEqual(TradingCalendarInterface.get_last_closed_day(datetime.datetime(2022, 4, 13, 14, 0)),
+                         '2022-04-12')
+        self.assertEqual(TradingCalendarInterface.get_last_closed_day(datetime.datetime(2022, 4, 13, 16, 30)),
+                         '2022-04-13')
+
+    def test_closures(self):
+        TradingCalendarInterface.refresh('HK', '2022-04-11', '2022-04-14', self.request_trading_days)
+        TradingCalendarInterface.mark_closed('HK', '2022-04-13', 'AFTERNOON')
+        TradingCalendarInterface.mark_closed('HK', '2022-04-14', 'MORNING')
+        self.assertEqual(TradingCalendarInterface.get_sessions('HK', '2022-04-11', '2022-04-14'),
+                         {'2022-04-11': 'WHOLE', '2022-04-12': 'WHOLE', '2022-04-13': 'MORNING'})
+
+        with mock.patch.object(WatermarkInterface, 'load', return_value={
+                stock_code: {'1M': {'watermark': '2022-04-14', 'no_data': ['2022-04-12'] + extra_days}} for
+                stock_code, extra_days in [('HK.00001', []), ('HK.00700', ['2022-04-11']), ('HK.09988', [])]}):
+            self.assertEqual(TradingCalendarInterface.infer_closures(['HK.00001', 'HK.00700', 'HK.09988']),
+                             ['2022-04-12'])
+        self.assertEqual(TradingCalendarInterface.get_trading_days('HK', '2022-04-11', '2022-04-14'),
+                         ['2022-04-11', '2022-04-13'])
+
+    def test_closures_after_pre_market_update(self):
+        TradingCalendarInterface.refresh('HK', '2022-04-11', '2022-04-14', self.request_trading_days)
+        stock_list = ['HK.00001', 'HK.00700', 'HK.09988']
+        with mock.patch.object(WatermarkInterface, 'get_path', return_value=Path(self.temp_dir.name) / 'wm.json'), \
+                mock.patch.object(TradingCalendarInterface, 'get_last_closed_day', return_value='2022-04-13'):
+            # 2022-04-14 has not closed yet: it is neither recorded without bars nor inferred as closed
+            for stock_code in stock_list:
+                WatermarkInterface.update_watermark(stock_code, '1M', '2022-04-14', ['2022-04-12', '2022-04-14'])
+            self.assertEqual(WatermarkInterface.get_no_data_dates('HK.00700', '1M'), {'2022-04-12'})
+            self.assertEqual(TradingCalendarInterface.infer_closures(stock_list), ['2022-04-12'])
+
+            # A wrong closure is reversed and the day is requested again
+            request_fn = mock.Mock(side_effect=self.request_trading_days)
+            self.assertTrue(TradingCalendarInterface.reopen('HK', '2022-04-12', request_fn))
+            request_fn.assert_called_once_with('HK', '2022-04-12', '2022-04-12')
+            self.assertEqual(WatermarkInterface.get_no_data_dates('HK.00700', '1M'), set())
+            self.assertEqual(WatermarkInterface.plan_1M_ranges('HK.00700', ['2022-04-11', '2022-04-12']),
+                             [('2022-04-11', '2022-04-12')])
+        TradingCalendarInterface.mark_closed('HK', '2022-04-13', 'AFTERNOON')
+        self.assertTrue(TradingCalendarInterface.reopen('HK', '2022-04-13', self.request_trading_days))
+        self.assertFalse(TradingCalendarInterface.reopen('HK', '2022-04-16'))
+        self.assertEqual(TradingCalendarInterface.get_sessions('HK', '2022-04-11', '2022-04-14'),
+                         {'2022-04-11': 'WHOLE', '2022-04-12': 'WHOLE', '2022-04-13': 'WHOLE',
+                          '2022-04-14': 'MORNING'})
+
+
+class TestRehabInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset')]
+        for patcher in self.patchers:
+            patcher.start()
+        self.stock_code = 'HK.00700'
+        self.date_range = ['2022-04-12', '2022-04-13', '2022-04-14']
+        self.input_df = pd.DataFrame({'code': self.stock_code,
+                                      'time_key': [f'{input_date} 09:31:00' for input_date in self.date_range],
+                                      'open': 100.0, 'close': 100.0, 'high': 100.0, 'low': 100.0, 'pe_ratio': 10.0,
+                                      'turnover_rate': 0.1, 'volume': 1000, 'turnover': 100000.0, 'change_rate': 0.0,
+                                      'last_close': 100.0})
+        # 2:1 split on 2022-04-13 and a dividend of 1 on 2022-04-14 (Futu get_rehab format)
+        RehabInterface.save_factors(self.stock_code, pd.DataFrame({
+            'ex_div_date': ['2022-04-13', '2022-04-14'], 'split_ratio': [0.5, None],
+            'forward_adj_factorA': [0.5, 1.0], 'forward_adj_factorB': [0.0, -1.0],
+            'backward_adj_factorA': [2.0, 1.0], 'backward_adj_factorB': [0.0, 1.0]}))
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def save_daily_files(self, autype: str = None):
+        (self.data_path / self.stock_code).mkdir(exist_ok=True)
+        for input_date, output_df in self.input_df.groupby(self.input_df['time_key'].str[:10]):
+            DataProcessingInterface.save_stock_df_to_file(
+                output_df, self.data_path / self.stock_code / f'{self.stock_code}_{input_date}_1M.parquet',
+                autype=autype)
+
+    def test_adjust_on_load(self):
+        self.save_daily_files(autype='NONE')
+        for adjust_type, reference in (('QFQ', [49.0, 99.0, 100.0]), ('HFQ', [100.0, 200.0, 202.0]),
+                                       ('NONE', [100.0, 100.0, 100.0])):
+            with mock.patch.dict(config['Data.Storage'], {'AdjustType': adjust_type}):
+                output_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code])[
+                    self.stock_code]
+                self.assertEqual(output_df['close'].tolist(), reference)
+                self.assertEqual(output_df['last_close'].tolist(), reference)
+                self.assertEqual(output_df['volume'].tolist(), [1000, 1000, 1000])
+                output_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code],
+                                                                      columns=['close'])[self.stock_code]
+                self.assertEqual(output_df.columns.tolist(), ['close'])
+                self.assertEqual(output_df['close'].tolist(), reference)
+                output_df = DataProcessingInterface.get_stock_df_from_file(
+                    self.data_path / self.stock_code / f'{self.stock_code}_2022-04-12_1M.parquet', columns=['open'])
+                self.assertEqual(output_df['open'].tolist(), reference[:1])
+
+        # A new corporate action only replaces the factor table
+        RehabInterface.save_factors(self.stock_code, pd.DataFrame({
+            'ex_div_date': ['2022-04-14'], 'forward_adj_factorA': [1.0], 'forward_adj_factorB': [-2.0],
+            'backward_adj_factorA': [1.0], 'backward_adj_factorB': [2.0]}))
+        output_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code])[self.stock_code]
+        self.assertEqual(output_df['close'].tolist(), [98.0, 98.0, 100.0])
+
+    def test_legacy_files_unchanged(self):
+        # Files without the adjustment tag were downloaded forward-adjusted
+        self.save_daily_files()
+        output_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code])[self.stock_code]
+        self.assertEqual(output_df['close'].tolist(), [100.0, 100.0, 100.0])
+
+    def test_adjust_dataset(self):
+        DatasetInterface.write_1M_data(self.input_df)
+        with mock.patch.dict(config['Data.Storage'], {'Layout1M': 'partitioned', 'AdjustType': 'HFQ'}):
+            output_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code])[
+                self.stock_code]
+            self.assertEqual(output_df['high'].tolist(), [100.0, 200.0, 202.0])
+            output_df = DataProcessingInterface.get_custom_interval_data_range(self.date_range, [self.stock_code],
+                                                                               5)[self.stock_code]
+            self.assertEqual(output_df['close'].tolist(), [100.0, 200.0, 202.0])
+
+    def test_dataset_mixed_autype(self):
+        # A partition downloaded forward-adjusted by an older version
+        DatasetInterface.write_1M_data(self.input_df, autype='QFQ')
+        partition_path = DatasetInterface.get_partition_path(self.stock_code, 2022, 4)
+        # Adjusted rows are not merged into it twice, unadjusted rows replace it
+        self.assertEqual(DatasetInterface.write_1M_data(self.input_df.tail(1).assign(close=50.0), autype='HFQ'), 0)
+        self.assertEqual(DatasetInterface.write_1M_data(self.input_df.head(1).assign(close=200.0)), 1)
+        stored_table = pq.read_table(partition_path)
+        self.assertEqual(RehabInterface.get_autype(stored_table), 'NONE')
+        self.assertEqual(stored_table.column('close').to_pylist(), [200.0])
+        self.assertEqual(DatasetInterface.get_stored_dates(self.stock_code), {'2022-04-12'})
+        self.assertEqual(DatasetInterface.write_1M_data(self.input_df.tail(1), autype='QFQ'), 0)
+
+    def test_migrate_mixed_autype(self):
+        self.save_daily_files(autype='NONE')
+        # The first day was downloaded adjusted by an older version
+        first_path = self.data_path / self.stock_code / f'{self.stock_code}_2022-04-12_1M.parquet'
+        DataProcessingInterface.save_stock_df_to_file(self.input_df.head(1), first_path)
+        DatasetInterface.migrate_daily_to_partitioned([self.stock_code])
+        stored_table = pq.read_table(DatasetInterface.get_partition_path(self.stock_code, 2022, 4))
+        self.assertEqual(RehabInterface.get_autype(stored_table), 'NONE')
+        self.assertEqual(DatasetInterface.get_stored_dates(self.stock_code), {'2022-04-13', '2022-04-14'})
+
+
+class TestLiveJournalInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset'),
+                         mock.patch.object(LiveJournalInterface, 'writers', {}),
+                         mock.patch.object(LiveJournalInterface, 'last_time', {})]
+        for patcher in self.patchers:
+            patcher.start()
+        self.input_df = DataProcessingInterface.get_stock_df_from_file(
+            Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+
+    def tearDown(self):
+        LiveJournalInterface.close_writers()
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_append_and_compact(self):
+        # Every poll returns the latest 100 bars including the forming one
+        for now in pd.date_range('2022-04-11 09:30:30', '2022-04-11 16:05:00', freq='7min'):
+            LiveJournalInterface.append_bars('HK.09988', self.input_df[self.input_df['time_key'] <= now].tail(100),
+                                             now=now)
+        self.assertEqual(LiveJournalInterface.append_bars('HK.09988', self.input_df, now='2022-04-11 16:05:00'), 0)
+        # Bars of an earlier day are never journaled
+        self.assertEqual(LiveJournalInterface.append_bars('HK.00700', self.input_df, now='2022-04-12 09:31:30'), 0)
+
+        # An incomplete day is left to the historical download
+        LiveJournalInterface.append_bars('HK.00700', self.input_df.head(50), now='2022-04-11 10:30:00')
+
+        self.assertEqual(LiveJournalInterface.compact('2022-04-11'), [('HK.09988', '2022-04-11')])
+        output_df = DataProcessingInterface.get_stock_df_from_file(
+            self.data_path / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+        pd.testing.assert_frame_equal(output_df, self.input_df)
+        self.assertFalse((self.data_path / 'HK.00700').exists())
+        self.assertFalse((self.data_path / 'Journal' / '2022-04-11').exists())
+
+    def test_compact_default_end_date(self):
+        # Without an end date, journals up to the last closed session of the trading calendar are compacted
+        LiveJournalInterface.append_bars('HK.09988', self.input_df, now='2022-04-11 16:05:00')
+        with mock.patch.object(TradingCalendarInterface, 'get_last_closed_day', return_value='2022-04-10'):
+            self.assertEqual(LiveJournalInterface.compact(), [])
+        with mock.patch.object(TradingCalendarInterface, 'get_last_closed_day', return_value='2022-04-11'):
+            self.assertEqual(LiveJournalInterface.compact(), [('HK.09988', '2022-04-11')])
+
+    def test_read_cut_off_journal(self):
+        LiveJournalInterface.append_bars('HK.09988', self.input_df, now='2022-04-11 16:05:00')
+        LiveJournalInterface.close_writers()
+        journal_path = next((self.data_path / 'Journal' / '2022-04-11' / 'HK.09988').glob('*.arrows'))
+        self.assertEqual(LiveJournalInterface.read_journal(journal_path).num_rows, 331)
+
+        # Writers of a crashed process: cut off within the first batch, and before the schema
+        content = journal_path.read_bytes()
+        journal_path.with_name('1.0.arrows').write_bytes(content[:len(content) // 2])
+        journal_path.with_name('2.0.arrows').touch()
+        self.assertEqual(LiveJournalInterface.read_journal(journal_path.with_name('1.0.arrows')).num_rows, 0)
+        self.assertIsNone(LiveJournalInterface.read_journal(journal_path.with_name('2.0.arrows')))
+        with mock.patch.dict(config['Data.Storage'], {'Layout1M': 'partitioned'}):
+            self.assertEqual(LiveJournalInterface.compact('2022-04-11'), [('HK.09988', '2022-04-11')])
+            output_df = DatasetInterface.read_1M_data(['HK.09988'], '2022-04-11', '2022-04-11')['HK.09988']
+        self.assertEqual(output_df['time_key'].tolist(), self.input_df['time_key'].tolist())
+
+
+class TestSQLiteStoreInterface(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.patchers = [mock.patch('engines.data_engine.PATH_DATA', self.data_path),
+                         mock.patch('engines.data_engine.PATH_DATABASE', self.data_path / 'database')]
+        for patcher in self.patchers:
+            patcher.start()
+        self.input_df = DataProcessingInterface.get_stock_df_from_file(
+            Path.cwd() / 'data' / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet')
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.temp_dir.cleanup()
+
+    def test_upsert_and_range(self):
+        self.assertEqual(SQLiteStoreInterface.upsert_kline(self.input_df, '1M'), 331)
+        # Futu DataFrames (string time_key) update the same rows
+        updated_df = self.input_df.tail(1).assign(time_key=self.input_df['time_key'].tail(1).dt.strftime(
+            '%Y-%m-%d %H:%M:%S'), close=1.0)
+        self.assertEqual(SQLiteStoreInterface.upsert_kline(updated_df, '1M'), 1)
+        self.assertEqual(SQLiteStoreInterface.query("SELECT COUNT(*) FROM kline WHERE k_type = '1M'"), [(331,)])
+        self.assertEqual(SQLiteStoreInterface.query('PRAGMA journal_mode'), [('wal',)])
+
+        rows = SQLiteStoreInterface.get_kline_range(['HK.09988'], '1M', '2022-04-11', '2022-04-11',
+                                                    columns=['time_key', 'close'])
+        self.assertEqual(rows[0], ('2022-04-11 09:30:00', self.input_df['close'].iloc[0]))
+        self.assertEqual(rows[-1], ('2022-04-11 16:00:00', 1.0))
+        self.assertEqual(SQLiteStoreInterface.get_kline_range(['HK.09988'], '1M', '2022-04-12', '2022-04-12'), [])
+        self.assertRaises(ValueError, SQLiteStoreInterface.get_kline_range, ['HK.09988'], '1M', '2022-04-11',
+                          '2022-04-11', ['close; DROP TABLE kline'])
+
+        table = SQLiteStoreInterface.get_kline_table(['HK.09988'], '1M', '2022-04-11', '2022-04-11')
+        expected_df = self.input_df.assign(close=self.input_df['close'].where(self.input_df.index < 330, 1.0))
+        pd.testing.assert_frame_equal(table.to_pandas(), expected_df[table.column_names])
+        self.assertEqual(SQLiteStoreInterface.get_kline_table(['HK.00700'], '1M', '2022-04-11', '2022-04-11',
+                                                              columns=['time_key', 'close']).num_rows, 0)
+
+    def test_query_plans(self):
+        plan = SQLiteStoreInterface.query(
+            "EXPLAIN QUERY PLAN SELECT time_key, close FROM kline WHERE code IN (?, ?) AND k_type = '1M' "
+            "AND time_key BETWEEN ? AND ? ORDER BY code, time_key", ('HK.00700', 'HK.09988', '2022', '2023'))
+        self.assertEqual(len(plan), 1)
+        self.assertIn('USING PRIMARY KEY', plan[0][3])
+        plan = SQLiteStoreInterface.query(
+            "EXPLAIN QUERY PLAN SELECT code, close, volume FROM kline WHERE k_type = '1M' AND time_key = ?",
+            ('2022-04-11 09:30:00',))
+        self.assertIn('USING COVERING INDEX kline_cross_section', plan[0][3])
+
+    def test_import_files(self):
+        output_path = self.data_path / 'HK.09988' / 'HK.09988_2022-04-11_1M.parquet'
+        output_path.parent.mkdir()
+        # Files adjusted by older versions are not imported
+        DataProcessingInterface.save_stock_df_to_file(self.input_df, output_path)
+        self.assertEqual(SQLiteStoreInterface.import_all(), 0)
+        DataProcessingInterface.save_stock_df_to_file(self.input_df, output_path, autype='NONE')
+        self.assertEqual(SQLiteStoreInterface.import_all(['HK.09988']), 331)
+        self.assertEqual(SQLiteStoreInterface.get_stock_list(), ['HK.09988'])
+        self.assertEqual(SQLiteStoreInterface.get_stock_list('1D'), [])
+
+    def test_import_partition(self):
+        with mock.patch('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset'):
+            DatasetInterface.write_1M_data(self.input_df)
+            self.assertEqual(SQLiteStoreInterface.import_all(), 331)
+        rows = SQLiteStoreInterface.get_kline_range(['HK.09988'], '1M', '2022-04-11', '2022-04-11',
+                                                    columns=['code', 'time_key', 'volume'])
+        self.assertEqual(len(rows), 331)
+        self.assertEqual(rows[0], ('HK.09988', '2022-04-11 09:30:00', int(self.input_df['volume'].iloc[0])))
+
+
+class TestWatermarkInterface(unittest.TestCase):
+    def test_find_missing_ranges(self):
+        trading_days = ['2022-04-08', '2022-04-11', '2022-04-12', '2022-04-13', '2022-04-14', '2022-04-19']
+        stored_dates = {'2022-04-11', '2022-04-13'}
+        self.assertEqual(WatermarkInterface.find_missing_ranges(trading_days, stored_dates),
+                         [('2022-04-08', '2022-04-08'), ('2022-04-12', '2022-04-12'), ('2022-04-14', '2022-04-19')])
+        self.assertEqual(WatermarkInterface.find_missing_ranges(trading_days, set(trading_days)), [])
+
+    def test_plan_1M_ranges(self):
+        trading_days = ['2022-04-08', '2022-04-11', '2022-04-12', '2022-04-13', '2022-04-14']
+        with tempfile.TemporaryDirectory() as temp_dir, mock.patch.object(WatermarkInterface, 'get_path',
+                                                                          return_value=Path(temp_dir) / 'wm.json'):
+            self.assertEqual(WatermarkInterface.plan_1M_ranges('HK.09988', trading_days),
+                             [('2022-04-08', '2022-04-08'), ('2022-04-14', '2022-04-14')])
+            WatermarkInterface.update_watermark('HK.09988', '1M', '2022-04-14', ['2022-04-08'])
+            self.assertEqual(WatermarkInterface.plan_1M_ranges('HK.09988', trading_days),
+                             [('2022-04-14', '2022-04-14')])
+
+    def test_update_watermark(self):
+        with tempfile.TemporaryDirectory() as temp_dir, mock.patch.object(WatermarkInterface, 'get_path',
+                                                                          return_value=Path(temp_dir) / 'wm.json'):
+            self.assertIsNone(WatermarkInterface.get_watermark('HK.00700', '1D'))
+            WatermarkInterface.update_watermark('HK.00700', '1D', '2022-04-13')
+            WatermarkInterface.update_watermark('HK.00700', '1D', '2022-04-01')
+            self.assertEqual(WatermarkInterface.get_watermark('HK.00700', '1D'), '2022-04-13')
+            self.assertIsNone(WatermarkInterface.get_watermark('HK.00700', '1M'))
+
+
 if __name__ == '__main__':
     suite_yahoo_finance = (unittest.TestLoader().loadTestsFromTestCase(TestYahooFinanceInterface))
     suite_data_processing = (unittest.TestLoader().loadTestsFromTestCase(TestDataProcessingInterface))
-    suite = unittest.TestSuite([suite_yahoo_finance, suite_data_processing])
+    suite_async_write = (unittest.TestLoader().loadTestsFromTestCase(TestAsyncWriteInterface))
+    suite_dataset = (unittest.TestLoader().loadTestsFromTestCase(TestDatasetInterface))
+    suite_watermark = (unittest.TestLoader().loadTestsFromTestCase(TestWatermarkInterface))
+    suite_resample_cache = (unittest.TestLoader().loadTestsFromTestCase(TestResampleCache))
+    suite_data_catalog = (unittest.TestLoader().loadTestsFromTestCase(TestDataCatalogInterface))
+    suite_data_health = (unittest.TestLoader().loadTestsFromTestCase(TestDataHealth))
+    suite_hkex = (unittest.TestLoader().loadTestsFromTestCase(TestHKEXInterface))
+    suite_yahoo_cache = (unittest.TestLoader().loadTestsFromTestCase(TestYahooHistoryCache))
+    suite_yahoo_quote = (unittest.TestLoader().loadTestsFromTestCase(TestYahooQuoteModules))
+    suite_tushare = (unittest.TestLoader().loadTestsFromTestCase(TestTuShareInterface))
+    suite_data_validation = (unittest.TestLoader().loadTestsFromTestCase(TestDataValidation))
+    suite_trading_calendar = (unittest.TestLoader().loadTestsFromTestCase(TestTradingCalendarInterface))
+    suite_rehab = (unittest.TestLoader().loadTestsFromTestCase(TestRehabInterface))
+    suite_live_journal = (unittest.TestLoader().loadTestsFromTestCase(TestLiveJournalInterface))
+    suite_sqlite_store = (unittest.TestLoader().loadTestsFromTestCase(TestSQLiteStoreInterface))
+    suite = unittest.TestSuite(
+        [suite_yahoo_finance, suite_yahoo_cache, suite_yahoo_quote, suite_data_processing, suite_async_write,
+         suite_dataset, suite_resample_cache, suite_data_catalog, suite_data_health, suite_data_validation, suite_hkex,
+         suite_tushare, suite_trading_calendar, suite_rehab, suite_live_journal, suite_sqlite_store, suite_watermark])
     unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,42 @@
+#  Futu Algo: Algorithmic Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2022
+#  Copyright (c)  billpwchan - All Rights Reserved
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from util.rate_limiter import RateLimiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_acquire_within_limit(self):
+        rate_limiter = RateLimiter(max_requests=5, period=10)
+        start_time = time.monotonic()
+        for _ in range(5):
+            self.assertEqual(rate_limiter.acquire(), 0)
+        self.assertLess(time.monotonic() - start_time, 0.1)
+
+    def test_acquire_shared_between_threads(self):
+        rate_limiter = RateLimiter(max_requests=4, period=0.3)
+        start_time = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: rate_limiter.acquire(), range(10)))
+        # 10 requests with 4 per window need at least two full windows
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+#  Futu Algo: Algorithmic Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2022
+#  Copyright (c)  billpwchan - All Rights Reserved
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pyarrow.parquet as pq
+
+from engines import DataProcessingInterface, DatasetInterface, StorageBenchmark
+from util.global_vars import config
+
+
+class TestStorageBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        shutil.copytree(Path.cwd() / 'data' / 'HK.09988', self.data_path / 'HK.09988')
+        for patch_target, patch_path in (('engines.data_engine.PATH_DATA', self.data_path),
+                                         ('engines.storage_benchmark.PATH_DATA', self.data_path),
+                                         ('engines.data_engine.PATH_DATASET', self.data_path / 'Dataset'),
+                                         ('engines.storage_benchmark.PATH_DATASET', self.data_path / 'Dataset')):
+            patcher = mock.patch(patch_target, patch_path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_run(self):
+        output_df = StorageBenchmark.run(['HK.09988', 'HK.99999'], max_files=2, repeats=1)
+        self.assertCountEqual(output_df['k_type'].unique(), ['1M', '1D'])
+        self.assertEqual(output_df.shape[0], 2 * (len(StorageBenchmark.PARQUET_SETTINGS) +
+                                                  len(StorageBenchmark.FEATHER_SETTINGS)))
+        self.assertEqual(set(output_df['format']), {'parquet', 'feather'})
+        self.assertEqual(output_df['configured'].sum(), 2)
+        self.assertTrue((output_df['disk_mb'] > 0).all())
+        self.assertTrue(output_df['cold_read'].all())
+        # Temporary files are written inside the data folder and removed afterwards
+        self.assertEqual([item.name for item in self.data_path.iterdir()], ['HK.09988'])
+
+    def test_read_pass_after_writes(self):
+        # Every setting is written before any is read back, and each file is evicted from the page cache first
+        manager = mock.Mock()
+        with mock.patch.object(StorageBenchmark, 'measure_write', wraps=StorageBenchmark.measure_write) as write, \
+                mock.patch.object(StorageBenchmark, 'measure_read', wraps=StorageBenchmark.measure_read) as read, \
+                mock.patch.object(StorageBenchmark, 'evict', wraps=StorageBenchmark.evict) as evict:
+            manager.attach_mock(write, 'write')
+            manager.attach_mock(read, 'read')
+            StorageBenchmark.run(['HK.09988'], k_types=('1D',), max_files=2, repeats=2)
+        setting_count = len(StorageBenchmark.PARQUET_SETTINGS) + len(StorageBenchmark.FEATHER_SETTINGS)
+        self.assertEqual([call[0] for call in manager.mock_calls], ['write'] * setting_count + ['read'] * setting_count)
+        file_count = len(StorageBenchmark.get_sample_paths(['HK.09988'], '1D', 2))
+        self.assertEqual(evict.call_count, setting_count * file_count * 2 * 2)
+
+    def test_dataset_sample_paths(self):
+        DatasetInterface.migrate_daily_to_partitioned(['HK.09988'])
+        with mock.patch.dict(config['Data.Storage'], {'Layout1M': 'partitioned'}):
+            self.assertEqual(StorageBenchmark.get_sample_paths(['HK.09988'], '1M', 2),
+                             [DatasetInterface.get_partition_path('HK.09988', 2022, 4)])
+            output_df = StorageBenchmark.run(['HK.09988'], k_types=('1M',), repeats=1)
+        self.assertEqual(output_df.shape[0], len(StorageBenchmark.PARQUET_SETTINGS) +
+                         len(StorageBenchmark.FEATHER_SETTINGS))
+
+    def test_parquet_write_options(self):
+        output_path = self.data_path / 'HK.09988' / 'HK.09988_2022-04-14_1M.parquet'
+        input_df = DataProcessingInterface.get_stock_df_from_file(
+            self.data_path / 'HK.09988' / 'HK.09988_2022-04-13_1M.parquet')
+        with mock.patch.dict(config['Data.Storage'], {'Compression': 'zstd', 'CompressionLevel': '5',
+                                                      'RowGroupSize': '100'}):
+            self.assertEqual(DataProcessingInterface.get_parquet_write_options()['compression_level'], 5)
+            DataProcessingInterface.save_stock_df_to_file(input_df, output_path)
+        metadata = pq.read_metadata(output_path)
+        self.assertEqual(metadata.row_group(0).column(0).compression, 'ZSTD')
+        self.assertEqual(metadata.row_group(0).num_rows, 100)
+
+        output_df = DataProcessingInterface.get_stock_df_from_file(output_path, columns=['time_key', 'close'])
+        self.assertEqual(output_df.columns.tolist(), ['time_key', 'close'])
+        self.assertEqual(output_df['close'].tolist(), input_df['close'].tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
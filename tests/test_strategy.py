@@ -20,6 +20,8 @@ import sys
 import os
 import unittest
 
+import pandas as pd
+
 # 添加项目根目录到sys.path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -137,6 +139,54 @@ class TestStrategy(unittest.TestCase):
                 self.assertTrue(sell_decision)
 
 
+class TestStrategyObjectRows(unittest.TestCase):
+    """Bars received as object-dtype rows must be normalized before the indicators are computed."""
+
+    def setUp(self):
+        self.stock_code = 'HK.09988'
+        self.preparation_data = DataProcessingInterface.get_stock_df_from_file(
+            PATH_DATA / self.stock_code / f'{self.stock_code}_2022-04-12_1M.parquet')
+        self.target_data = DataProcessingInterface.get_stock_df_from_file(
+            PATH_DATA / self.stock_code / f'{self.stock_code}_2022-04-13_1M.parquet')
+
+    def feed_object_rows(self, strategy, samples: dict):
+        checked = 0
+        for index, row in self.target_data.iterrows():
+            latest_data = row.to_frame().transpose()
+            latest_data.reset_index(drop=True, inplace=True)
+            strategy.parse_data(latest_data=latest_data)
+            time_key = pd.Timestamp(row['time_key'])
+            if time_key in samples:
+                ta_calculations = strategy.get_input_data_stock_code(self.stock_code)
+                latest_row = ta_calculations.loc[ta_calculations['time_key'] == time_key]
+                for key, value in samples[time_key].items():
+                    self.assertAlmostEqual(latest_row[key].values[0], value, delta=0.0006)
+                checked += 1
+        self.assertEqual(checked, len(samples))
+        ta_calculations = strategy.get_input_data_stock_code(self.stock_code)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(ta_calculations['time_key']))
+        self.assertTrue(pd.api.types.is_float_dtype(ta_calculations['close']))
+
+    def test_MACD_Cross_object_rows(self):
+        strategy = MACDCross({self.stock_code: self.preparation_data},
+                             fast_period=12, slow_period=26, signal_period=9, observation=100)
+        self.feed_object_rows(strategy, {
+            pd.Timestamp('2022-04-13 15:30:00'): {'MACD': -0.063, 'MACD_signal': -0.023, 'MACD_hist': -0.079},
+            pd.Timestamp('2022-04-13 16:00:00'): {'MACD': 0.066, 'MACD_signal': -0.008, 'MACD_hist': 0.148}
+        })
+
+    def test_KDJ_Cross_object_rows(self):
+        strategy = KDJCross({self.stock_code: self.preparation_data}, fast_k=9, slow_k=3, slow_d=3, over_buy=80,
+                            over_sell=20, observation=100)
+        self.feed_object_rows(strategy, {
+            pd.Timestamp('2022-04-13 15:00:00'): {'%k': 52.524, '%d': 53.634, '%j': 50.303},
+            pd.Timestamp('2022-04-13 16:00:00'): {'%k': 85.049, '%d': 74.249, '%j': 106.650}
+        })
+
+
 if __name__ == '__main__':
-    suite = (unittest.TestLoader().loadTestsFromTestCase(TestStrategy))
+    suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestStrategy),
+        unittest.TestLoader().loadTestsFromTestCase(TestStrategyObjectRows)
+    ])
     unittest.TextTestRunner(verbosity=2).run(suite)
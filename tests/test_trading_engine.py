@@ -0,0 +1,178 @@
+#  Futu Algo: Algorithmic Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2022
+#  Copyright (c)  billpwchan - All Rights Reserved
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from futu import RET_ERROR, RET_OK
+
+from engines import AsyncWriteInterface, DataProcessingInterface, FutuTrade, WatermarkInterface
+from util import logger
+from util.global_vars import config
+from util.rate_limiter import RateLimiter
+
+
+class FakeQuoteContext:
+    """
+        Serve request_history_kline from local 1M files in pages, optionally failing at a given request
+    """
+
+    def __init__(self, history_df: pd.DataFrame, page_size: int = 400, fail_at: int = None):
+        self.history_df = history_df
+        self.page_size = page_size
+        self.fail_at = fail_at
+        self.page_req_keys = []
+
+    def request_history_kline(self, stock_code, page_req_key=None, **kwargs):
+        self.page_req_keys.append(page_req_key)
+        if self.fail_at is not None and len(self.page_req_keys) == self.fail_at:
+            raise ConnectionError('Connection lost')
+        offset = int(page_req_key.decode()) if page_req_key else 0
+        data = self.history_df.iloc[offset:offset + self.page_size].reset_index(drop=True)
+        next_offset = offset + self.page_size
+        return RET_OK, data, (str(next_offset).encode() if next_offset < self.history_df.shape[0] else None)
+
+    def close(self):
+        pass
+
+
+def create_futu_trade(quote_ctx) -> FutuTrade:
+    # Bypass the constructor, which connects to FutuOpenD
+    futu_trade = FutuTrade.__new__(FutuTrade)
+    futu_trade.config = config
+    futu_trade.default_logger = logger.get_logger("futu_trade")
+    futu_trade.quote_ctx = quote_ctx
+    futu_trade.history_rate_limiter = RateLimiter(max_requests=1000, period=1)
+    futu_trade._FutuTrade__history_local = threading.local()
+    return futu_trade
+
+
+class TestFutuTrade(unittest.TestCase):
+    def setUp(self):
+        self.stock_code = 'HK.09988'
+        self.date_range = ['2022-04-11', '2022-04-12', '2022-04-13']
+        self.history_df = DataProcessingInterface.get_1M_data_range(self.date_range, [self.stock_code])[
+            self.stock_code]
+        # Futu sends time_key and code as plain strings
+        self.history_df = self.history_df.assign(time_key=self.history_df['time_key'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+                                                 code=self.history_df['code'].astype(str))
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.data_path = Path(self.temp_dir.name)
+        self.patcher = mock.patch('engines.trading_engine.PATH_DATA', self.data_path)
+        self.patcher.start()
+        self.addCleanup(self.patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def test_update_1M_data(self):
+        futu_trade = create_futu_trade(FakeQuoteContext(self.history_df))
+        saved_dates = futu_trade.update_1M_data(self.stock_code, start_date=self.date_range[0],
+                                                end_date=self.date_range[-1])
+        self.assertEqual(AsyncWriteInterface.flush(), 0)
+        self.assertEqual(saved_dates, self.date_range)
+        for input_date in self.date_range:
+            output_df = pd.read_parquet(self.data_path / self.stock_code / f'{self.stock_code}_{input_date}_1M.parquet')
+            reference_df = self.history_df[self.history_df['time_key'].str.startswith(input_date)]
+            self.assertEqual(output_df['time_key'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),
+                             reference_df['time_key'].tolist())
+        self.assertFalse((self.data_path / self.stock_code / '.checkpoint_1M').exists())
+
+    def test_update_1M_data_resume(self):
+        quote_ctx = FakeQuoteContext(self.history_df, fail_at=2)
+        futu_trade = create_futu_trade(quote_ctx)
+        with self.assertRaises(ConnectionError):
+            futu_trade.update_1M_data(self.stock_code, start_date=self.date_range[0], end_date=self.date_range[-1])
+        self.assertTrue((self.data_path / self.stock_code / '.checkpoint_1M' / 'state.json').is_file())
+
+        # The second run continues from the checkpointed page_req_key instead of the first page
+        quote_ctx = FakeQuoteContext(self.history_df)
+        futu_trade.quote_ctx = quote_ctx
+        saved_dates = futu_trade.update_1M_data(self.stock_code, start_date=self.date_range[0],
+                                                end_date=self.date_range[-1])
+        self.assertEqual(quote_ctx.page_req_keys[0], b'400')
+        AsyncWriteInterface.flush()
+        self.assertEqual(saved_dates, self.date_range)
+        output_df = pd.read_parquet(self.data_path / self.stock_code / f'{self.stock_code}_2022-04-11_1M.parquet')
+        self.assertEqual(output_df.shape[0], 331)
+
+    def test_update_1M_data_first_page_error(self):
+        quote_ctx = FakeQuoteContext(self.history_df)
+        quote_ctx.request_history_kline = mock.Mock(return_value=(RET_ERROR, 'Quota exceeded', None))
+        futu_trade = create_futu_trade(quote_ctx)
+        self.assertIsNone(futu_trade.update_1M_data(self.stock_code, start_date=self.date_range[0],
+                                                    end_date=self.date_range[-1]))
+
+    def test_update_1M_data_gaps_pre_market(self):
+        # Today's session (2022-04-13) has not ended: it is neither downloaded nor recorded as a day without bars
+        quote_ctx = FakeQuoteContext(self.history_df[self.history_df['time_key'] < '2022-04-13'])
+        quote_ctx.request_history_kline = mock.Mock(wraps=quote_ctx.request_history_kline)
+        futu_trade = create_futu_trade(quote_ctx)
+        with mock.patch('engines.data_engine.PATH_DATA', self.data_path), \
+                mock.patch('engines.data_engine.WatermarkInterface.get_path', return_value=self.data_path / 'wm.json'), \
+                mock.patch('engines.trading_engine.TradingCalendarInterface.get_last_closed_day',
+                           return_value='2022-04-12'):
+            self.assertTrue(futu_trade.update_1M_data_gaps(self.stock_code, self.date_range))
+            AsyncWriteInterface.flush()
+            self.assertEqual({call.kwargs['end'] for call in quote_ctx.request_history_kline.call_args_list},
+                             {'2022-04-12'})
+            self.assertEqual(WatermarkInterface.get_watermark(self.stock_code, '1M'), '2022-04-12')
+            self.assertEqual(WatermarkInterface.get_no_data_dates(self.stock_code, '1M'), set())
+            self.assertEqual(WatermarkInterface.plan_1M_ranges(self.stock_code, self.date_range),
+                             [('2022-04-13', '2022-04-13')])
+
+    def test_update_rehab_rate_limited(self):
+        quote_ctx = mock.Mock(get_rehab=mock.Mock(return_value=(RET_ERROR, 'Too frequent')))
+        futu_trade = create_futu_trade(quote_ctx)
+        futu_trade.history_rate_limiter = mock.Mock()
+        self.assertFalse(futu_trade.update_rehab(self.stock_code))
+        futu_trade.history_rate_limiter.acquire.assert_called_once_with()
+
+    def test_update_DW_data(self):
+        # Three years of daily bars are requested once and split into one file per year
+        time_keys = pd.bdate_range('2020-01-02', '2022-04-13').strftime('%Y-%m-%d 00:00:00')
+        history_df = pd.DataFrame({'code': self.stock_code, 'time_key': time_keys, 'close': 100.0, 'volume': 1000})
+        quote_ctx = FakeQuoteContext(history_df)
+        futu_trade = create_futu_trade(quote_ctx)
+        with mock.patch('engines.data_engine.WatermarkInterface.get_path', return_value=self.data_path / 'wm.json'):
+            futu_trade.update_DW_data(self.stock_code, years=2)
+            self.assertEqual(AsyncWriteInterface.flush(), 0)
+            self.assertEqual(WatermarkInterface.get_watermark(self.stock_code, '1D'),
+                             datetime.today().strftime('%Y-%m-%d'))
+        self.assertEqual(len(quote_ctx.page_req_keys), 2)
+        for year in ('2020', '2021', '2022'):
+            output_df = pd.read_parquet(self.data_path / self.stock_code / f'{self.stock_code}_{year}_1D.parquet')
+            self.assertTrue(output_df['time_key'].dt.strftime('%Y').eq(year).all())
+            self.assertEqual(output_df.shape[0], sum(time_key.startswith(year) for time_key in time_keys))
+
+    def test_update_DW_data_write_failure(self):
+        # A background write that fails leaves the watermark as it was, so the next update downloads the data again
+        time_keys = pd.bdate_range('2021-01-04', '2022-04-13').strftime('%Y-%m-%d 00:00:00')
+        history_df = pd.DataFrame({'code': self.stock_code, 'time_key': time_keys, 'close': 100.0, 'volume': 1000})
+        futu_trade = create_futu_trade(FakeQuoteContext(history_df))
+        with mock.patch('engines.data_engine.WatermarkInterface.get_path', return_value=self.data_path / 'wm.json'), \
+                mock.patch('engines.data_engine.pq.write_table', side_effect=OSError('No space left on device')):
+            futu_trade.update_DW_data(self.stock_code, years=1)
+            self.assertEqual(AsyncWriteInterface.flush(), 1)
+            self.assertIsNone(WatermarkInterface.get_watermark(self.stock_code, '1D'))
+        self.assertEqual(list((self.data_path / self.stock_code).glob('*_1D.parquet')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
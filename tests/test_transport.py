@@ -0,0 +1,92 @@
+#  Futu Algo: Algorithmic Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2022
+#  Copyright (c)  billpwchan - All Rights Reserved
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+from engines import TuShareInterface, YahooFinanceInterface
+from util.global_vars import config
+from util.transport import ResponseCache, ResponseNotRecorded
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_record_replay(self):
+        frame = pd.DataFrame({'close': [1.0, 2.0]}, index=pd.DatetimeIndex(['2022-04-13', '2022-04-14'], name='Date'))
+        fetch_fn = mock.Mock(side_effect=[b'xlsx', frame, {'longName': 'TENCENT'}])
+        record_cache = ResponseCache(self.root, 'record')
+        record_cache.fetch('hkex', {'url': 'a'}, fetch_fn)
+        record_cache.fetch('yahoo', {'function': 'download', 'tickers': ['0700.HK']}, fetch_fn)
+        record_cache.fetch('yahoo', {'function': 'info', 'symbol': '0700.HK'}, fetch_fn)
+
+        replay_cache = ResponseCache(self.root, 'replay')
+        self.assertEqual(replay_cache.fetch('hkex', {'url': 'a'}, fetch_fn), b'xlsx')
+        pd.testing.assert_frame_equal(
+            replay_cache.fetch('yahoo', {'function': 'download', 'tickers': ['0700.HK']}, fetch_fn), frame)
+        self.assertEqual(replay_cache.fetch('yahoo', {'symbol': '0700.HK', 'function': 'info'}, fetch_fn),
+                         {'longName': 'TENCENT'})
+        self.assertEqual(fetch_fn.call_count, 3)
+        self.assertRaises(ResponseNotRecorded, replay_cache.fetch, 'hkex', {'url': 'b'}, fetch_fn)
+
+        # Identical responses are stored once
+        record_cache.fetch('hkex', {'url': 'c'}, lambda: b'xlsx')
+        self.assertEqual(len(list((self.root / 'objects').iterdir())), 3)
+
+    def test_ttl_and_passthrough(self):
+        fetch_fn = mock.Mock(side_effect=['v1', 'v2', 'v3'])
+        record_cache = ResponseCache(self.root, 'record')
+        self.assertEqual(record_cache.fetch('yahoo', {'url': 'hsi'}, fetch_fn, ttl=3600), 'v1')
+        self.assertEqual(record_cache.fetch('yahoo', {'url': 'hsi'}, fetch_fn, ttl=3600), 'v1')
+
+        ref_path = record_cache.get_ref_path('yahoo', {'url': 'hsi'})
+        expired_time = ref_path.stat().st_mtime - 7200
+        os.utime(ref_path, (expired_time, expired_time))
+        self.assertEqual(record_cache.fetch('yahoo', {'url': 'hsi'}, fetch_fn, ttl=3600), 'v2')
+
+        self.assertEqual(ResponseCache(self.root).fetch('yahoo', {'url': 'hsi'}, fetch_fn, ttl=3600), 'v3')
+        self.assertRaises(ValueError, ResponseCache, self.root, 'offline')
+
+    def test_adapters_replay(self):
+        html = '<table><tr><th>Symbol</th></tr><tr><td>0700.HK</td></tr><tr><td>9988.HK</td></tr></table>'
+        with mock.patch('engines.data_engine.PATH_DATA', self.root), \
+                mock.patch.dict(config['Transport'], {'Mode': 'record'}), \
+                mock.patch('engines.data_engine.requests.get', return_value=mock.Mock(text=html)), \
+                mock.patch.object(TuShareInterface, 'get_pro') as get_pro:
+            get_pro.return_value.query.return_value = pd.DataFrame({'ts_code': ['000001.SZ'], 'close': [10.0]})
+            self.assertEqual(YahooFinanceInterface.get_top_30_hsi_constituents(), ['HK.00700', 'HK.09988'])
+            TuShareInterface.query('daily', ts_code='000001.SZ')
+
+        with mock.patch('engines.data_engine.PATH_DATA', self.root), \
+                mock.patch.dict(config['Transport'], {'Mode': 'replay'}), \
+                mock.patch('engines.data_engine.requests.get', side_effect=ConnectionError), \
+                mock.patch('engines.data_engine.ts.pro_api', side_effect=ConnectionError):
+            self.assertEqual(YahooFinanceInterface.get_top_30_hsi_constituents(), ['HK.00700', 'HK.09988'])
+            self.assertEqual(TuShareInterface.query('daily', ts_code='000001.SZ')['close'].tolist(), [10.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,7 +25,37 @@
  * Written by Bill Chan <billpwchan@hotmail.com>, 2021
  */
 
-create table stock_data
+/*
+ * K-line store of SQLiteStoreInterface ([Data.Storage] SQLiteStore = True), opened in WAL mode.
+ * Rows are clustered on (code, k_type, time_key), so the range of one stock is a single primary key range scan.
+ * Prices are unadjusted, as in the Parquet files. time_key is 'YYYY-MM-DD HH:MM:SS' text.
+ */
+CREATE TABLE IF NOT EXISTS kline
+(
+    code          TEXT NOT NULL,
+    k_type        TEXT NOT NULL,
+    time_key      TEXT NOT NULL,
+    open          REAL,
+    close         REAL,
+    high          REAL,
+    low           REAL,
+    pe_ratio      REAL,
+    turnover_rate REAL,
+    volume        INTEGER,
+    turnover      REAL,
+    change_rate   REAL,
+    last_close    REAL,
+    PRIMARY KEY (code, k_type, time_key)
+) WITHOUT ROWID;
+
+-- Cross-sectional queries (all stocks at a time or over a range) answered from the index alone
+CREATE INDEX IF NOT EXISTS kline_cross_section
+    ON kline (k_type, time_key, code, close, volume, turnover);
+
+/*
+ * Legacy tables of the deprecated DatabaseInterface
+ */
+CREATE TABLE IF NOT EXISTS stock_data
 (
     id               integer not null
         constraint stock_data_pk
@@ -45,19 +75,19 @@ create table stock_data
     k_type           text
 );
 
-create index stock_code
+CREATE INDEX IF NOT EXISTS stock_code
     on stock_data (code);
 
-create index stock_code_interval
+CREATE INDEX IF NOT EXISTS stock_code_interval
     on stock_data (code, k_type);
 
-create unique index stock_data_id_uindex
+CREATE UNIQUE INDEX IF NOT EXISTS stock_data_id_uindex
     on stock_data (id);
 
-create unique index stock_time
+CREATE UNIQUE INDEX IF NOT EXISTS stock_time
     on stock_data (code, time_key, k_type);
 
-create table stock_pool
+CREATE TABLE IF NOT EXISTS stock_pool
 (
     id     integer not null
         constraint stock_pool_pk
@@ -67,5 +97,5 @@ create table stock_pool
     code   text    not null
 );
 
-create unique index stock_pool_id_uindex
+CREATE UNIQUE INDEX IF NOT EXISTS stock_pool_id_uindex
     on stock_pool (id);
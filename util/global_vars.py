@@ -25,7 +25,8 @@ import yaml
 PATH = Path(__file__).parent.parent
 PATH_CONFIG = PATH / 'config'
 PATH_DATA = PATH / 'data'
-PATH_DATABASE = PATH / 'database'  # Obsoleted
+PATH_DATASET = PATH_DATA / 'Dataset'
+PATH_DATABASE = PATH / 'database'
 PATH_FILTERS = PATH / 'filters'
 PATH_STRATEGIES = PATH / 'strategies'
 PATH_FILTER_REPORT = PATH / 'stock_filter_report'
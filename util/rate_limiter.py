@@ -0,0 +1,53 @@
+#  Futu Algo: Algorithmic High-Frequency Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2021
+#  Copyright (c)  billpwchan - All Rights Reserved
+
+
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    def __init__(self, max_requests: int, period: float):
+        """
+            Sliding-window rate limiter shared by multiple threads / connections
+            E.g., Futu request_history_kline allows max. 60 requests per 30 seconds for the whole account
+        :param max_requests: Maximum number of requests within a period
+        :param period: Length of the window in seconds
+        """
+        self.max_requests = max_requests
+        self.period = period
+        self.__request_times = deque()
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+            Block until a request is allowed, then record it
+        :return: Seconds spent waiting
+        """
+        waited = 0.0
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                while self.__request_times and now - self.__request_times[0] >= self.period:
+                    self.__request_times.popleft()
+                if len(self.__request_times) < self.max_requests:
+                    self.__request_times.append(now)
+                    return waited
+                wait_time = self.period - (now - self.__request_times[0])
+            time.sleep(wait_time)
+            waited += wait_time
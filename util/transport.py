@@ -0,0 +1,122 @@
+#  Futu Algo: Algorithmic High-Frequency Trading Framework
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#  Written by Bill Chan <billpwchan@hotmail.com>, 2021
+#  Copyright (c)  billpwchan - All Rights Reserved
+
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+
+class ResponseNotRecorded(LookupError):
+    pass
+
+
+class ResponseCache:
+    MODES = ('passthrough', 'record', 'replay')
+
+    def __init__(self, root: Path, mode: str = 'passthrough'):
+        """
+            Record / replay store for the responses of external data sources (HKEX, Yahoo Finance, TuShare).
+            A request is described by its source and a JSON-serializable dict of its parameters. Its response is
+            stored once per distinct content (objects/<sha256>) and referenced from refs/<source>/<request sha256>.
+            passthrough: Always call the data source, store nothing
+            record: Call the data source and store the response (TTL requests reuse a recorded response while young)
+            replay: Only serve recorded responses, raise ResponseNotRecorded otherwise (offline, deterministic)
+        :param root: Folder of the store
+        :param mode: passthrough / record / replay
+        """
+        if mode not in ResponseCache.MODES:
+            raise ValueError(f'Unknown transport mode {mode}. Use one of {ResponseCache.MODES}')
+        self.root = Path(root)
+        self.mode = mode
+
+    @staticmethod
+    def get_request_key(source: str, request: dict) -> str:
+        return hashlib.sha256(json.dumps([source, request], sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_ref_path(self, source: str, request: dict) -> Path:
+        return self.root / 'refs' / source / f'{ResponseCache.get_request_key(source, request)}.json'
+
+    def fetch(self, source: str, request: dict, fetch_fn, ttl: float = None):
+        """
+            Response of a request according to the transport mode
+        :param source: Data source name (e.g., hkex, yahoo, tushare)
+        :param request: Request parameters. Identical parameters are served the same recorded response
+        :param fetch_fn: Callable without arguments that calls the data source.
+                         Returns bytes, str, a JSON-serializable object or a DataFrame
+        :param ttl: Seconds a recorded response is reused in record mode before the data source is called again
+        """
+        if self.mode == 'passthrough':
+            return fetch_fn()
+        ref_path = self.get_ref_path(source, request)
+        if self.mode == 'replay' or (ttl is not None and ref_path.exists() and
+                                     time.time() - ref_path.stat().st_mtime < ttl):
+            try:
+                return self.load(ref_path)
+            except FileNotFoundError:
+                raise ResponseNotRecorded(f'No recorded {source} response for {request}') from None
+        response = fetch_fn()
+        self.save(ref_path, source, request, response)
+        return response
+
+    def load(self, ref_path: Path):
+        with open(ref_path, 'r') as f:
+            ref = json.load(f)
+        content = (self.root / 'objects' / ref['object']).read_bytes()
+        if ref['kind'] == 'bytes':
+            return content
+        elif ref['kind'] == 'text':
+            return content.decode()
+        elif ref['kind'] == 'frame':
+            return pd.read_parquet(io.BytesIO(content))
+        return json.loads(content)
+
+    def save(self, ref_path: Path, source: str, request: dict, response) -> None:
+        if isinstance(response, bytes):
+            kind, content = 'bytes', response
+        elif isinstance(response, str):
+            kind, content = 'text', response.encode()
+        elif isinstance(response, pd.DataFrame):
+            buffer = io.BytesIO()
+            response.to_parquet(buffer)
+            kind, content = 'frame', buffer.getvalue()
+        else:
+            kind, content = 'json', json.dumps(response, sort_keys=True, default=str).encode()
+        object_name = hashlib.sha256(content).hexdigest()
+        object_path = self.root / 'objects' / object_name
+        if not object_path.exists():
+            ResponseCache.write_atomic(object_path, content)
+        ResponseCache.write_atomic(ref_path, json.dumps(
+            {'source': source, 'request': request, 'kind': kind, 'object': object_name,
+             'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S')}, sort_keys=True, default=str).encode())
+
+    @staticmethod
+    def write_atomic(output_path: Path, content: bytes) -> None:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = output_path.with_name(f'{output_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            temp_path.write_bytes(content)
+            os.replace(temp_path, output_path)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()